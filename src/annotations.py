@@ -0,0 +1,174 @@
+# annotations.py
+"""
+Shared sleep-stage annotation parser.
+
+`.annot` files are tab-separated with a header line and six columns
+(stage, _, _, start, stop, _), where start/stop are wall-clock times. Clock times are
+parsed as a byte matrix and converted to samples with vectorized midnight handling.
+The resulting hypnogram is a structured array of (stage code, start_sample, stop_sample);
+it is cached in seconds, independent of the sampling rate, as a small .npy next to the
+recording.
+"""
+from datetime import datetime
+from hashing import config_digest
+from logger import logger
+import numpy as np
+import glob
+import os
+
+HYPNOGRAM_DTYPE = np.dtype([("stage", "i1"), ("start_sample", "i8"), ("stop_sample", "i8")])
+HYPNOGRAM_SECONDS_DTYPE = np.dtype([("stage", "i1"), ("start_sec", "f8"), ("stop_sec", "f8")])
+TIME_FMTS = ("%H:%M:%S", "%H:%M:%S.%f")  # HH:MM:SS and HH:MM:SS.mmm
+
+def read_annotation_table(annot_path):
+    """(stages, start_strs, stop_strs) as string arrays for every 6-column line after the header."""
+    with open(annot_path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.read().splitlines()[1:]
+    rows = [parts for parts in (line.strip().split("\t") for line in lines) if len(parts) == 6]
+    if not rows:
+        empty = np.array([], dtype=str)
+        return empty, empty, empty
+    table = np.array([(r[0].strip(), r[3].strip(), r[4].strip()) for r in rows], dtype=str)
+    return table[:, 0], table[:, 1], table[:, 2]
+
+def clock_seconds(clock_strs):
+    """
+    Seconds since midnight for an array of 'HH:MM:SS[.fff]' strings. Zero-padded times
+    are decoded as a byte matrix; anything else falls back to strptime, and unparseable
+    entries become NaN.
+    """
+    clock_strs = np.asarray(clock_strs, dtype=str)
+    out = np.full(len(clock_strs), np.nan)
+    if len(clock_strs) == 0:
+        return out
+
+    # One trailing NUL column, so "end of string" is visible at position 8 for plain HH:MM:SS
+    width = max(int(np.char.str_len(clock_strs).max()), 8) + 1
+    b = np.frombuffer(np.char.encode(clock_strs, "ascii", "replace").astype(f"S{width}").tobytes(),
+                      dtype=np.uint8).reshape(len(clock_strs), width)
+    digits = b.astype(np.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    # HH:MM:SS in fixed positions, then either the end or '.' + 1-6 fraction digits
+    fixed = (b[:, 2] == ord(":")) & (b[:, 5] == ord(":")) & is_digit[:, [0, 1, 3, 4, 6, 7]].all(axis=1)
+    frac_digits = is_digit[:, 9:]
+    n_frac = frac_digits.sum(axis=1)
+    frac_ok = (b[:, 8] == 0) | ((b[:, 8] == ord(".")) & (n_frac > 0) & (n_frac <= 6)
+                                & (frac_digits | (b[:, 9:] == 0)).all(axis=1))
+    hh = digits[:, 0] * 10 + digits[:, 1]
+    mm = digits[:, 3] * 10 + digits[:, 4]
+    ss = digits[:, 6] * 10 + digits[:, 7]
+    fixed &= frac_ok & (hh < 24) & (mm < 60) & (ss < 60)  # same ranges strptime accepts
+
+    secs = hh * 3600 + mm * 60 + ss
+    scale = 10.0 ** -np.arange(1, width - 8)
+    frac = (np.where(frac_digits, digits[:, 9:], 0) * scale).sum(axis=1)
+    out[fixed] = secs[fixed] + frac[fixed]
+
+    for i in np.flatnonzero(~fixed):
+        for fmt in TIME_FMTS:
+            try:
+                t = datetime.strptime(clock_strs[i], fmt).time()
+                out[i] = t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+                break
+            except ValueError:
+                continue
+    return out
+
+def parse_hypnogram_seconds(annot_path, meas_date, stages):
+    """
+    Rate-independent hypnogram (stage code, start_sec, stop_sec) for the annotations
+    whose stage is in `stages`; the code is the index into `stages` and the times are
+    seconds from the recording start. Times before the recording start belong to the
+    next day, and stop < start crosses midnight.
+    """
+    stage_col, start_col, stop_col = read_annotation_table(annot_path)
+    stages = list(stages)
+    keep = np.isin(stage_col, stages)
+    stage_col, start_col, stop_col = stage_col[keep], start_col[keep], stop_col[keep]
+
+    start_clock = clock_seconds(start_col)
+    stop_clock = clock_seconds(stop_col)
+    bad = np.isnan(start_clock) | np.isnan(stop_clock)
+    for i in np.flatnonzero(bad):
+        logger.error(f"Annotation parse error in {os.path.basename(annot_path)}: "
+                     f"stage={stage_col[i]} ({start_col[i]}-{stop_col[i]})")
+
+    meas_date = meas_date.replace(tzinfo=None)
+    rec_clock = meas_date.hour * 3600 + meas_date.minute * 60 + meas_date.second + meas_date.microsecond / 1e6
+    start_sec = start_clock - rec_clock
+    stop_sec = stop_clock - rec_clock
+    # Handle midnight crossing
+    stop_sec = np.where(stop_clock < start_clock, stop_sec + 86400.0, stop_sec)
+    # Handle recording start crossing
+    wrap = start_sec < 0
+    start_sec = np.where(wrap, start_sec + 86400.0, start_sec)
+    stop_sec = np.where(wrap, stop_sec + 86400.0, stop_sec)
+
+    hyp = np.empty(int((~bad).sum()), dtype=HYPNOGRAM_SECONDS_DTYPE)
+    codes = np.searchsorted(np.array(stages), stage_col[~bad], sorter=np.argsort(stages))
+    hyp["stage"] = np.argsort(stages)[codes]
+    hyp["start_sec"] = start_sec[~bad]
+    hyp["stop_sec"] = stop_sec[~bad]
+    return hyp
+
+def hypnogram_samples(hyp_sec, sfreq):
+    """(stage, start_sec, stop_sec) hypnogram -> (stage, start_sample, stop_sample) at sfreq."""
+    hyp = np.empty(len(hyp_sec), dtype=HYPNOGRAM_DTYPE)
+    hyp["stage"] = hyp_sec["stage"]
+    hyp["start_sample"] = np.round(hyp_sec["start_sec"] * sfreq).astype(np.int64)
+    hyp["stop_sample"] = np.round(hyp_sec["stop_sec"] * sfreq).astype(np.int64)
+    return hyp
+
+def parse_hypnogram(annot_path, meas_date, sfreq, stages):
+    """Structured hypnogram (stage code, start_sample, stop_sample) at sfreq; see parse_hypnogram_seconds()."""
+    return hypnogram_samples(parse_hypnogram_seconds(annot_path, meas_date, stages), sfreq)
+
+def _hypnogram_cache_prefix(annot_path):
+    return os.path.splitext(annot_path)[0] + ".hypno-"
+
+def load_hypnogram(annot_path, meas_date, sfreq, stages, use_cache=True):
+    """
+    parse_hypnogram() with a binary cache: the rate-independent hypnogram (seconds) is
+    saved as <recording>.hypno-<file key>-<key>.npy next to the annotation file and
+    converted to samples at `sfreq` on load, so stages working at the native and at a
+    resampled rate share one entry. The file key covers the annotation file's
+    size/mtime, the key the recording start and the stage list; entries of an older
+    version of the annotation file are removed.
+    """
+    meas_date = meas_date.replace(tzinfo=None)
+    if not use_cache:
+        return parse_hypnogram(annot_path, meas_date, sfreq, stages)
+
+    st = os.stat(annot_path)
+    file_key = config_digest(st.st_size, st.st_mtime_ns)[:16]
+    key = config_digest(meas_date.isoformat(), list(stages))[:16]
+    prefix = _hypnogram_cache_prefix(annot_path)
+    cache_path = f"{prefix}{file_key}-{key}.npy"
+    if os.path.isfile(cache_path):
+        try:
+            hyp_sec = np.load(cache_path)
+            if hyp_sec.dtype == HYPNOGRAM_SECONDS_DTYPE:
+                return hypnogram_samples(hyp_sec, sfreq)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable hypnogram cache {cache_path}: {e}")
+
+    hyp_sec = parse_hypnogram_seconds(annot_path, meas_date, stages)
+    try:
+        # Other recording starts/stage lists of the same annotation file stay cached
+        for stale in glob.glob(f"{glob.escape(prefix)}*.npy"):
+            if not os.path.basename(stale)[len(os.path.basename(prefix)):].startswith(f"{file_key}-"):
+                os.remove(stale)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, hyp_sec)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        # Read-only data directories still work, just without the cache
+        logger.warning(f"Could not cache hypnogram for {os.path.basename(annot_path)}: {e}")
+    return hypnogram_samples(hyp_sec, sfreq)
+
+def hypnogram_epochs(hyp, stages, sfreq):
+    """[(stage, start_sec, stop_sec), ...] in recording order."""
+    stages = list(stages)
+    return [(stages[c], s / sfreq, e / sfreq) for c, s, e in hyp.tolist()]
@@ -0,0 +1,254 @@
+# benchmark.py
+"""
+Stage-by-stage benchmark of the pipeline on synthetic cohorts (synthetic_psg.py).
+
+For every cohort size in `benchmark.cohort_sizes` a cohort is generated (recordings are
+shared between sizes), a copy of the config is pointed at it and at a scratch output
+tree, and every benchmarked stage runs in a fresh interpreter: reading, apply_preprocessing,
+static CCA, time-resolved CCA, analysis and stationarity. Each child reports the wall time
+of its stage and its peak resident memory (its own and that of its worker processes), so
+stages do not inherit each other's heap. The static CCA correlations are checked against
+the coupling the cohort was generated with.
+
+Results go to <results_dir>/benchmark_<timestamp>.json and are compared with the JSON
+baseline (`benchmark.baseline`, written on the first run or with `update_baseline`);
+stages slower or larger than the baseline by more than `tolerance` are reported.
+
+Run from the repository root: python src/benchmark.py
+"""
+from synthetic_psg import STAGE_COUPLING, write_cohort
+from config_loader import load_config
+from hashing import config_digest
+from datetime import datetime
+from telemetry import peak_rss_mb, profiled
+from omegaconf import OmegaConf
+from logger import logger
+import pandas as pd
+import numpy as np
+import subprocess
+import platform
+import shutil
+import json
+import time
+import sys
+import os
+
+STAGES = ["read", "preprocess", "static_cca", "time_resolved_cca", "analysis", "stationarity"]
+
+def _settings(cfg):
+    params = getattr(cfg, "benchmark", None)
+    synthetic = getattr(params, "synthetic", None) if params is not None else None
+
+    def get(section, key, default):
+        return getattr(section, key, default) if section is not None else default
+
+    eeg_chs = get(synthetic, "eeg_channels", None) or cfg.data.eeg_channels
+    eog_chs = get(synthetic, "eog_channels", None) or cfg.data.eog_channels
+    coupling = get(synthetic, "coupling", None)
+    coupling = OmegaConf.to_container(coupling) if coupling is not None else STAGE_COUPLING
+    spec = {
+        "duration_hours": float(get(synthetic, "duration_hours", 1.0)),
+        "sfreq": int(get(synthetic, "sfreq", 128)),
+        "eeg_channels": list(eeg_chs),
+        "eog_channels": list(eog_chs),
+        "extra_channels": list(get(synthetic, "extra_channels", None) or []),
+        "coupling": {stage: list(rho) for stage, rho in coupling.items()},
+        "seed": int(get(synthetic, "seed", 0)),
+    }
+    return {
+        "spec": spec,
+        "cohort_sizes": [int(n) for n in get(params, "cohort_sizes", [1, 4])],
+        "stages": list(get(params, "stages", None) or STAGES),
+        "data_dir": get(params, "data_dir", "data/benchmark/cohorts"),
+        "work_dir": get(params, "work_dir", "data/benchmark/work"),
+        "results_dir": get(params, "results_dir", "data/benchmark"),
+        "baseline": get(params, "baseline", "data/benchmark/baseline.json"),
+        "update_baseline": bool(get(params, "update_baseline", False)),
+        "tolerance": float(get(params, "tolerance", 0.25)),
+    }
+
+def _stage_config(cfg, spec, cohort_dir, work_dir):
+    """The config as the stages see it: the synthetic cohort in, a scratch tree out, no caches or ledgers."""
+    overrides = {
+        "data": {"data_dir": cohort_dir, "manifest_dir": os.path.join(work_dir, "manifest"),
+                 "eeg_channels": spec["eeg_channels"], "eog_channels": spec["eog_channels"],
+                 "sleep_stages": list(spec["coupling"])},
+        "preprocess": {"output_dir": os.path.join(work_dir, "preproc_examples")},
+        "cache": {"enabled": False, "dir": os.path.join(work_dir, "cache")},
+        "ledger": {"enabled": False},
+        "pipeline": {"state_file": os.path.join(work_dir, "pipeline_state.json")},
+        "static_cca_params": {"output_dir": os.path.join(work_dir, "static_cca"),
+                              "results_dir": os.path.join(work_dir, "static_cca_analysis")},
+        "time_cca_params": {"output_dir": os.path.join(work_dir, "time_resolved_cca"),
+                            "results_dir": os.path.join(work_dir, "time_resolved_cca_analysis")},
+        "report": {"figures_folder": os.path.join(work_dir, "figs")},
+    }
+    return OmegaConf.merge(cfg, OmegaConf.create(overrides))
+
+def _subject_paths(cfg):
+    from manifest import build_manifest, planned_subjects
+    file_pairs, _ = planned_subjects(build_manifest(cfg))
+    return [os.path.join(cfg.data.data_dir, edf_file) for edf_file, _ in file_pairs]
+
+def _run_stage(stage):
+    """Run one stage in this process (config from BESPACE_CONFIG); returns its timing and memory."""
+    cfg = load_config()
+    eeg_chs, eog_chs = list(cfg.data.eeg_channels), list(cfg.data.eog_channels)
+
+    if stage in ("read", "preprocess"):
+        from edf_reader import load_recording
+        from preprocessing import apply_preprocessing
+        edf_paths = _subject_paths(cfg)
+        base_rss = peak_rss_mb()
+        seconds = 0.0
+        for edf_path in edf_paths:
+            t0 = time.perf_counter()
+            raw = load_recording(edf_path, eeg_chs + eog_chs, cfg)
+            if stage == "preprocess":
+                # Only the filtering is timed; the read is measured by the "read" stage
+                t0 = time.perf_counter()
+                apply_preprocessing(raw, eeg_chs, eog_chs, cfg)
+            seconds += time.perf_counter() - t0
+            del raw
+    else:
+        import importlib
+        module = {"static_cca": "static_cca", "time_resolved_cca": "time_resolved_cca",
+                  "analysis": "time_resolved_cca_analysis", "stationarity": "time_resolved_cca_check_stationarity"}[stage]
+        # Import (and its module-level setup) is not part of the stage time
+        module = importlib.import_module(module)
+        base_rss = peak_rss_mb()
+        t0 = time.perf_counter()
+        with profiled(stage):
+            module.main()
+        seconds = time.perf_counter() - t0
+
+    return {
+        "seconds": seconds,
+        "base_rss_mb": base_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": peak_rss_mb(children=True),
+    }
+
+def _run_child(stage, config_path, out_path):
+    env = dict(os.environ, BESPACE_CONFIG=config_path)
+    cmd = [sys.executable, os.path.abspath(__file__), "--stage", stage, "--out", out_path]
+    proc = subprocess.run(cmd, env=env)
+    if proc.returncode != 0 or not os.path.exists(out_path):
+        logger.error(f"Benchmark stage {stage} failed (exit code {proc.returncode})")
+        return None
+    with open(out_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _coupling_check(work_dir, spec, cohort_size):
+    """Mean static CCA correlations per stage next to the coupling the cohort was generated with."""
+    summary_path = os.path.join(work_dir, "static_cca", "eeg_eog_cca_summary_stats.csv")
+    if not os.path.exists(summary_path):
+        return []
+    summary = pd.read_csv(summary_path)
+    rows = []
+    for stage, expected in spec["coupling"].items():
+        sel = summary["stage"] == stage
+        if not sel.any():
+            continue
+        row = {"cohort_size": cohort_size, "stage": stage}
+        for k, rho in enumerate(expected):
+            col = f"cca_corr{k+1}"
+            if col in summary:
+                row[f"{col}_expected"] = float(rho)
+                row[col] = float(summary.loc[sel, col].mean())
+        rows.append(row)
+    return rows
+
+def compare(results, baseline, tolerance):
+    """Per (cohort_size, stage) time and peak-memory ratios to the baseline, flagged above 1 + tolerance."""
+    reference = {(r["cohort_size"], r["stage"]): r for r in baseline.get("results", [])}
+    rows = []
+    for r in results:
+        ref = reference.get((r["cohort_size"], r["stage"]))
+        if ref is None:
+            continue
+        row = {"cohort_size": r["cohort_size"], "stage": r["stage"]}
+        for key in ("seconds", "peak_rss_mb"):
+            if r.get(key) and ref.get(key):
+                row[f"{key}_ratio"] = r[key] / ref[key]
+        row["regression"] = any(v > 1.0 + tolerance for k, v in row.items() if k.endswith("_ratio"))
+        rows.append(row)
+    return rows
+
+def _machine():
+    return {"platform": platform.platform(), "python": platform.python_version(),
+            "cpu_count": os.cpu_count(), "numpy": np.__version__}
+
+def main():
+    config = load_config()
+    settings = _settings(config)
+    spec = settings["spec"]
+    key = config_digest(spec)[:12]
+    pool_dir = os.path.join(settings["data_dir"], f"pool-{key}")
+    duration_sec = spec["duration_hours"] * 3600
+
+    results, coupling = [], []
+    for size in settings["cohort_sizes"]:
+        cohort_dir = os.path.join(settings["data_dir"], f"{key}-n{size}")
+        write_cohort(cohort_dir, size, duration_sec, spec["sfreq"], spec["eeg_channels"], spec["eog_channels"],
+                     spec["extra_channels"], coupling=spec["coupling"], seed=spec["seed"], pool_dir=pool_dir)
+
+        # Fresh scratch outputs for every cohort, so no stage finds earlier results
+        work_dir = os.path.join(settings["work_dir"], f"n{size}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        config_path = os.path.join(work_dir, "config.yaml")
+        OmegaConf.save(_stage_config(config, spec, cohort_dir, work_dir), config_path)
+
+        for stage in settings["stages"]:
+            logger.info(f"Benchmark: {stage} on {size} synthetic subject(s)")
+            measured = _run_child(stage, config_path, os.path.join(work_dir, f"{stage}.json"))
+            if measured is None:
+                continue
+            measured.update(cohort_size=size, stage=stage, seconds_per_subject=measured["seconds"] / size)
+            results.append(measured)
+            peak = measured["peak_rss_mb"]
+            logger.info(f"Benchmark: {stage} n={size}: {measured['seconds']:.2f}s"
+                        + (f", peak RSS {peak:.0f} MB" if peak is not None else ""))
+        coupling += _coupling_check(work_dir, spec, size)
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "machine": _machine(),
+              "spec": spec, "results": results, "coupling": coupling}
+
+    # Compare with the baseline (when it describes the same synthetic cohorts)
+    baseline_path = settings["baseline"]
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("spec") != spec:
+            logger.warning(f"Baseline {baseline_path} was measured on different synthetic cohorts; ratios are indicative only")
+        report["baseline"] = {"path": baseline_path, "created": baseline.get("created")}
+        report["comparison"] = compare(results, baseline, settings["tolerance"])
+        for row in report["comparison"]:
+            ratios = ", ".join(f"{k[:-6]} x{v:.2f}" for k, v in row.items() if k.endswith("_ratio"))
+            log = logger.warning if row["regression"] else logger.info
+            log(f"Benchmark: {row['stage']} n={row['cohort_size']} vs baseline: {ratios}")
+
+    os.makedirs(settings["results_dir"], exist_ok=True)
+    out_path = os.path.join(settings["results_dir"], f"benchmark_{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    logger.info(f"Benchmark results saved to {out_path}")
+
+    if settings["update_baseline"] or not os.path.exists(baseline_path):
+        os.makedirs(os.path.dirname(baseline_path) or ".", exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in report.items() if k not in ("baseline", "comparison")}, f, indent=1)
+        logger.info(f"Benchmark baseline written to {baseline_path}")
+    return {"benchmark": pd.DataFrame(results), "benchmark_coupling": pd.DataFrame(coupling)}
+
+if __name__ == "__main__":
+    if "--stage" in sys.argv:
+        # Child process: one stage, measurements written as JSON
+        stage = sys.argv[sys.argv.index("--stage") + 1]
+        out_path = sys.argv[sys.argv.index("--out") + 1]
+        measured = _run_stage(stage)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(measured, f)
+    else:
+        main()
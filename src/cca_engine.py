@@ -0,0 +1,241 @@
+# cca_engine.py
+"""
+Closed-form canonical correlation analysis from covariance blocks.
+
+Covariances are rescaled to correlation matrices (scale invariant, like sklearn's
+scale=True), optionally shrunk towards the identity, whitened with a symmetric inverse
+square root and decomposed with one SVD. Every function accepts leading batch
+dimensions, so a stack of windows is solved in a single call.
+"""
+import numpy as np
+
+def covariance_blocks(X, Y, chunk=1 << 16):
+    """
+    Means and sample covariance blocks of X (n, p) and Y (n, q).
+    Samples of any float dtype are centered and accumulated in float64, `chunk` rows
+    at a time. Returns (mean_x, mean_y, Cxx, Cyy, Cxy).
+    """
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    n = len(X)
+    if n < 2 or len(Y) != n:
+        raise ValueError(f"Need at least 2 paired samples, got X={len(X)}, Y={len(Y)}")
+
+    mean_x = X.mean(axis=0, dtype=np.float64)
+    mean_y = Y.mean(axis=0, dtype=np.float64)
+    p = X.shape[1]
+    C = np.zeros((p + Y.shape[1], p + Y.shape[1]))
+    for s in range(0, n, chunk):
+        Z = np.hstack([X[s:s + chunk] - mean_x, Y[s:s + chunk] - mean_y])
+        C += Z.T @ Z
+    C /= n - 1
+    return mean_x, mean_y, C[:p, :p], C[p:, p:], C[:p, p:]
+
+def _inv_sqrt(C, eps):
+    # Batched symmetric inverse square root; near-null directions are dropped
+    vals, vecs = np.linalg.eigh(C)
+    scale = vals.max(axis=-1, keepdims=True)
+    keep = vals > eps * scale
+    inv = np.where(keep, 1.0 / np.sqrt(np.where(keep, vals, 1.0)), 0.0)
+    return (vecs * inv[..., None, :]) @ np.swapaxes(vecs, -1, -2)
+
+def _standardize(Cxx, Cyy, Cxy, ridge, dtype):
+    dx = np.diagonal(Cxx, axis1=-2, axis2=-1)
+    dy = np.diagonal(Cyy, axis1=-2, axis2=-1)
+    valid = (dx > 0).all(axis=-1) & (dy > 0).all(axis=-1)
+
+    sx = 1.0 / np.sqrt(np.where(dx > 0, dx, 1.0))
+    sy = 1.0 / np.sqrt(np.where(dy > 0, dy, 1.0))
+    Rxx = Cxx * sx[..., :, None] * sx[..., None, :]
+    Ryy = Cyy * sy[..., :, None] * sy[..., None, :]
+    Rxy = Cxy * sx[..., :, None] * sy[..., None, :]
+
+    if ridge:
+        # Shrink towards the identity (the correlation matrices have unit trace per channel)
+        Rxx = (1.0 - ridge) * Rxx + ridge * np.eye(Rxx.shape[-1])
+        Ryy = (1.0 - ridge) * Ryy + ridge * np.eye(Ryy.shape[-1])
+        Rxy = (1.0 - ridge) * Rxy
+
+    return (Rxx.astype(dtype), Ryy.astype(dtype), Rxy.astype(dtype),
+            sx.astype(dtype), sy.astype(dtype), valid)
+
+def _check_args(Cxx, Cyy, n_components, ridge):
+    max_components = min(Cxx.shape[-1], Cyy.shape[-1])
+    if n_components < 1 or n_components > max_components:
+        raise ValueError(f"n_components must be in [1, {max_components}], got {n_components}")
+    if not 0.0 <= ridge < 1.0:
+        raise ValueError(f"ridge must be in [0, 1), got {ridge}")
+
+def canonical_correlations(Cxx, Cyy, Cxy, n_components=2, ridge=0.0, dtype=np.float64, eps=1e-10):
+    """
+    Canonical correlations only (no weights), shape (..., n_components).
+    Entries whose covariance block has a zero-variance channel are NaN.
+    """
+    _check_args(Cxx, Cyy, n_components, ridge)
+    Rxx, Ryy, Rxy, _, _, valid = _standardize(Cxx, Cyy, Cxy, ridge, dtype)
+
+    M = _inv_sqrt(Rxx, eps) @ Rxy @ _inv_sqrt(Ryy, eps)
+    rho = np.linalg.svd(M, compute_uv=False)[..., :n_components]
+    rho = np.clip(rho, 0.0, 1.0)
+    rho[~valid] = np.nan
+    return rho
+
+def shared_canonical_correlations(Cxx, Cyy, Cxy, n_components=2, ridge=0.0, dtype=np.float64, eps=1e-10):
+    """
+    Canonical correlations of several cross-covariances sharing the same Cxx/Cyy,
+    e.g. surrogates of one window: Cxy (..., s, p, q) with Cxx (..., p, p) and
+    Cyy (..., q, q). The whitening is computed once per Cxx/Cyy. Shape (..., s, k).
+    """
+    _check_args(Cxx, Cyy, n_components, ridge)
+    cross_shape = Cxx.shape[:-1] + Cyy.shape[-1:]
+    Rxx, Ryy, _, sx, sy, valid = _standardize(Cxx, Cyy, np.zeros(cross_shape), ridge, dtype)
+
+    Rxy = Cxy * sx[..., None, :, None] * sy[..., None, None, :]
+    if ridge:
+        Rxy = (1.0 - ridge) * Rxy
+    M = _inv_sqrt(Rxx, eps)[..., None, :, :] @ Rxy.astype(dtype) @ _inv_sqrt(Ryy, eps)[..., None, :, :]
+    rho = np.linalg.svd(M, compute_uv=False)[..., :n_components]
+    rho = np.clip(rho, 0.0, 1.0)
+    rho[~valid] = np.nan
+    return rho
+
+def _deflation_scaled(a):
+    # a (..., p, k) -> a[..., :, j] / ||a_j minus its projection onto a_1 .. a_{j-1}||
+    norm = np.abs(np.diagonal(np.linalg.qr(a, mode="r"), axis1=-2, axis2=-1))[..., None, :]
+    return a / np.where(norm > 0, norm, 1.0)
+
+def fit_cca(Cxx, Cyy, Cxy, n_components=2, ridge=0.0, dtype=np.float64, eps=1e-10):
+    """
+    Exact CCA from covariance blocks.
+
+    Returns a dict with:
+        correlations            (..., k)    canonical correlations
+        x_weights, y_weights    (..., p, k) / (..., q, k) weights for centered raw data,
+                                scaled like sklearn's CCA x_rotations_/y_rotations_ (the
+                                first has unit norm in standardized units, later ones are
+                                unit norm on the deflated data), so projections match
+                                CCA().fit_transform
+        x_loadings, y_loadings  (..., p, k) / (..., q, k) structure correlations
+                                corr(channel, canonical variate)
+        x_explained_variance,   (..., k) fraction of the standardized EEG/EOG variance
+        y_explained_variance    captured by each canonical variate
+    """
+    _check_args(Cxx, Cyy, n_components, ridge)
+    Rxx, Ryy, Rxy, sx, sy, valid = _standardize(Cxx, Cyy, Cxy, ridge, dtype)
+
+    Wxx = _inv_sqrt(Rxx, eps)
+    Wyy = _inv_sqrt(Ryy, eps)
+    U, S, Vt = np.linalg.svd(Wxx @ Rxy @ Wyy, full_matrices=False)
+    k = n_components
+    U = U[..., :, :k]
+    V = np.swapaxes(Vt, -1, -2)[..., :, :k]
+    rho = np.clip(S[..., :k], 0.0, 1.0)
+
+    # Deterministic signs: largest |entry| of each x direction is positive
+    idx = np.argmax(np.abs(U), axis=-2)[..., None, :]
+    signs = np.sign(np.take_along_axis(U, idx, axis=-2))
+    signs[signs == 0] = 1.0
+    U = U * signs
+    V = V * signs
+
+    # Unit-variance canonical directions in standardized space
+    a = Wxx @ U
+    b = Wyy @ V
+
+    x_loadings = Rxx @ a
+    y_loadings = Ryy @ b
+    x_explained = np.mean(x_loadings ** 2, axis=-2)
+    y_explained = np.mean(y_loadings ** 2, axis=-2)
+
+    # Rotation scaling of sklearn's deflation: component j is scored on the data deflated by
+    # components < j with a unit-norm weight from that data's row space, i.e. direction j
+    # minus its projection onto directions < j; that residual norm is |R_jj| of a QR
+    x_weights = _deflation_scaled(a) * sx[..., :, None]
+    y_weights = _deflation_scaled(b) * sy[..., :, None]
+
+    result = {
+        "correlations": rho,
+        "x_weights": x_weights,
+        "y_weights": y_weights,
+        "x_loadings": x_loadings,
+        "y_loadings": y_loadings,
+        "x_explained_variance": x_explained,
+        "y_explained_variance": y_explained,
+    }
+    for key, val in result.items():
+        val[~valid] = np.nan
+    return result
+
+def fit_cca_data(X, Y, n_components=2, ridge=0.0, dtype=np.float64):
+    """
+    Fit CCA directly on samples X (n, p), Y (n, q).
+    Returns the fit_cca dict plus the projections "X_c", "Y_c" (n, k) of the centered data.
+    """
+    mean_x, mean_y, Cxx, Cyy, Cxy = covariance_blocks(X, Y)
+    result = fit_cca(Cxx, Cyy, Cxy, n_components=n_components, ridge=ridge, dtype=dtype)
+    result["x_mean"] = mean_x
+    result["y_mean"] = mean_y
+    result["X_c"] = (np.asarray(X, dtype=dtype) - mean_x.astype(dtype)) @ result["x_weights"]
+    result["Y_c"] = (np.asarray(Y, dtype=dtype) - mean_y.astype(dtype)) @ result["y_weights"]
+    return result
+
+def cca_settings(cfg):
+    """(n_components, ridge, dtype) from the optional `cca_params` config section."""
+    params = getattr(cfg, "cca_params", None)
+    n_components = int(getattr(params, "n_components", 2)) if params is not None else 2
+    ridge = float(getattr(params, "ridge", 0.0)) if params is not None else 0.0
+    dtype = np.dtype(getattr(params, "dtype", "float64")) if params is not None else np.dtype(np.float64)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"cca_params.dtype must be float32 or float64, got {dtype}")
+    return n_components, ridge, dtype
+
+class MomentAccumulator:
+    """
+    Running count, mean and centered cross-product matrix of paired [X, Y] samples.
+    Chunks are merged with Chan et al.'s pairwise update, so memory is independent of
+    how many samples are streamed through and two accumulators can be merged.
+    """
+
+    def __init__(self, p, q):
+        self.p = p
+        self.q = q
+        self.n = 0
+        self.mean = np.zeros(p + q)
+        self.M2 = np.zeros((p + q, p + q))
+
+    def update(self, X, Y):
+        Z = np.hstack([np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)])
+        n_b = len(Z)
+        if n_b == 0:
+            return self
+        mean_b = Z.mean(axis=0)
+        Zc = Z - mean_b
+        self._merge(n_b, mean_b, Zc.T @ Zc)
+        return self
+
+    def merge(self, other):
+        if other.n:
+            self._merge(other.n, other.mean, other.M2)
+        return self
+
+    def decay(self, factor):
+        """Down-weight everything accumulated so far (exponential forgetting); n becomes an effective count."""
+        self.n = self.n * factor
+        self.M2 = self.M2 * factor
+        return self
+
+    def _merge(self, n_b, mean_b, M2_b):
+        n_a = self.n
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * (n_b / n)
+        self.M2 = self.M2 + M2_b + np.outer(delta, delta) * (n_a * n_b / n)
+        self.n = n
+
+    def covariance_blocks(self):
+        """(mean_x, mean_y, Cxx, Cyy, Cxy) with the same normalization as covariance_blocks()."""
+        if self.n < 2:
+            raise ValueError(f"Need at least 2 samples, got {self.n}")
+        C = self.M2 / (self.n - 1)
+        p = self.p
+        return self.mean[:p], self.mean[p:], C[:p, :p], C[p:, p:], C[:p, p:]
@@ -2,7 +2,9 @@
 from omegaconf import OmegaConf
 import os
 
-def load_config(config_path="src/config/config.yaml"):
+def load_config(config_path=None):
+    # BESPACE_CONFIG points every stage at another config (e.g. the benchmark's synthetic cohorts)
+    config_path = config_path or os.getenv("BESPACE_CONFIG", "src/config/config.yaml")
     if not os.path.isfile(config_path):
         raise FileNotFoundError(f"Config file not found at: {config_path}")
     return OmegaConf.load(config_path)
@@ -0,0 +1,170 @@
+# edf_reader.py
+"""
+Memory-mapped EDF reader.
+
+Only the fixed-size header is parsed up front; the int16 data records are memory-mapped
+and the requested channels are scaled to physical units (volts, as in MNE) on demand
+for the requested sample range. The other PSG channels are never decoded.
+"""
+from datetime import datetime, timezone
+from logger import logger
+import numpy as np
+import mne
+import os
+
+# Physical dimension -> scale to SI volts (matches MNE's EDF reader)
+_UNIT_SCALE = {"uv": 1e-6, "µv": 1e-6, "μv": 1e-6, "mv": 1e-3, "nv": 1e-9, "v": 1.0}
+
+def _field(raw_bytes, offset, width, count):
+    out = []
+    for i in range(count):
+        chunk = raw_bytes[offset + i * width: offset + (i + 1) * width]
+        out.append(chunk.decode("latin-1").strip())
+    return out, offset + width * count
+
+def read_edf_header(edf_path):
+    """Parse the EDF main and per-signal headers into a dict."""
+    with open(edf_path, "rb") as f:
+        main = f.read(256)
+        if len(main) < 256:
+            raise ValueError(f"Truncated EDF header: {edf_path}")
+        n_signals = int(main[252:256].decode("latin-1").strip())
+        sig = f.read(256 * n_signals)
+        if len(sig) < 256 * n_signals:
+            raise ValueError(f"Truncated EDF signal header: {edf_path}")
+
+    header_bytes = int(main[184:192].decode("latin-1").strip())
+    n_records = int(main[236:244].decode("latin-1").strip())
+    record_duration = float(main[244:252].decode("latin-1").strip())
+
+    off = 0
+    labels, off = _field(sig, off, 16, n_signals)
+    _, off = _field(sig, off, 80, n_signals)  # transducer
+    units, off = _field(sig, off, 8, n_signals)
+    pmin, off = _field(sig, off, 8, n_signals)
+    pmax, off = _field(sig, off, 8, n_signals)
+    dmin, off = _field(sig, off, 8, n_signals)
+    dmax, off = _field(sig, off, 8, n_signals)
+    _, off = _field(sig, off, 80, n_signals)  # prefiltering
+    nsamp, off = _field(sig, off, 8, n_signals)
+
+    samples_per_record = np.array([int(n) for n in nsamp], dtype=np.int64)
+    record_width = int(samples_per_record.sum())
+
+    # n_records may be -1 (unknown) or overstate a truncated file
+    available = (os.path.getsize(edf_path) - header_bytes) // (2 * record_width) if record_width else 0
+    if n_records < 0 or n_records > available:
+        n_records = int(available)
+
+    return {
+        "meas_date": _parse_start(main[168:176].decode("latin-1"), main[176:184].decode("latin-1")),
+        "header_bytes": header_bytes,
+        "n_records": n_records,
+        "record_duration": record_duration,
+        "labels": labels,
+        "units": units,
+        "physical_min": np.array([float(v) for v in pmin]),
+        "physical_max": np.array([float(v) for v in pmax]),
+        "digital_min": np.array([float(v) for v in dmin]),
+        "digital_max": np.array([float(v) for v in dmax]),
+        "samples_per_record": samples_per_record,
+        "record_width": record_width,
+    }
+
+def _parse_start(date_str, time_str):
+    try:
+        day, month, year = (int(v) for v in date_str.strip().split("."))
+        hour, minute, second = (int(v) for v in time_str.strip().split("."))
+    except ValueError:
+        return None
+    # EDF clipping date: yy >= 85 is 19yy, else 20yy
+    year += 1900 if year >= 85 else 2000
+    return datetime(year, month, day, hour, minute, second, tzinfo=timezone.utc)
+
+class EdfReader:
+    """
+    Read-only view over an EDF file with an MNE-like get_data(picks, start, stop).
+    All channels in `channels` (default: every non-annotation signal) must share one
+    sampling rate.
+    """
+
+    def __init__(self, edf_path, channels=None):
+        self.path = edf_path
+        self.header = read_edf_header(edf_path)
+        h = self.header
+
+        labels = h["labels"]
+        if channels is None:
+            channels = [ch for ch in labels if ch != "EDF Annotations"]
+        missing = [ch for ch in channels if ch not in labels]
+        if missing:
+            raise ValueError(f"Channels not found in {edf_path}: {missing}")
+        self.ch_names = list(channels)
+        self._index = {ch: labels.index(ch) for ch in self.ch_names}
+
+        per_record = {int(h["samples_per_record"][i]) for i in self._index.values()}
+        if len(per_record) != 1:
+            raise ValueError(f"Requested channels have mixed sampling rates in {edf_path}")
+        self._spr = per_record.pop()
+        self.sfreq = self._spr / h["record_duration"]
+        self.n_times = self._spr * h["n_records"]
+        self.info = {"sfreq": self.sfreq, "meas_date": h["meas_date"]}
+
+        self._offsets = np.concatenate([[0], np.cumsum(h["samples_per_record"])[:-1]])
+        self._mm = np.memmap(edf_path, dtype="<i2", mode="r", offset=h["header_bytes"],
+                             shape=(h["n_records"], h["record_width"]))
+
+    def _scale(self, idx):
+        h = self.header
+        gain = (h["physical_max"][idx] - h["physical_min"][idx]) / (h["digital_max"][idx] - h["digital_min"][idx])
+        offset = h["physical_min"][idx] - h["digital_min"][idx] * gain
+        unit = _UNIT_SCALE.get(h["units"][idx].lower(), 1.0)
+        return gain * unit, offset * unit
+
+    def get_data(self, picks=None, start=0, stop=None, dtype=np.float64):
+        """Scaled samples (n_picks, stop - start) in volts for the requested channels only."""
+        if picks is None:
+            picks = self.ch_names
+        elif isinstance(picks, str):
+            picks = [picks]
+        stop = self.n_times if stop is None else min(int(stop), self.n_times)
+        start = max(int(start), 0)
+        if stop <= start:
+            return np.zeros((len(picks), 0), dtype=dtype)
+
+        r = self._spr
+        rec0, rec1 = start // r, -(-stop // r)
+        out = np.empty((len(picks), stop - start), dtype=dtype)
+        for row, ch in enumerate(picks):
+            if ch not in self._index:
+                raise ValueError(f"Channel {ch} was not selected when opening {self.path}")
+            idx = self._index[ch]
+            o = self._offsets[idx]
+            block = self._mm[rec0:rec1, o:o + r].reshape(-1)[start - rec0 * r: stop - rec0 * r]
+            gain, offset = self._scale(idx)
+            np.multiply(block, gain, out=out[row], casting="unsafe")
+            out[row] += offset
+        return out
+
+def load_recording(edf_path, channels, cfg):
+    """
+    Load only `channels` of an EDF as an MNE Raw object (data in volts).
+    data.reader: "mmap" (default) decodes just these channels through EdfReader;
+    "mne" falls back to mne.io.read_raw_edf(preload=True) of the whole file.
+    Missing channels are dropped with a warning.
+    """
+    reader_kind = getattr(cfg.data, "reader", "mmap")
+    if reader_kind == "mne":
+        return mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
+
+    labels = read_edf_header(edf_path)["labels"]
+    present = [ch for ch in channels if ch in labels]
+    if len(present) < len(channels):
+        logger.warning(f"{os.path.basename(edf_path)}: missing channels ignored {sorted(set(channels) - set(present))}")
+
+    reader = EdfReader(edf_path, channels=present)
+    info = mne.create_info(present, reader.sfreq, ch_types="eeg", verbose=False)
+    raw = mne.io.RawArray(reader.get_data(present), info, verbose=False)
+    if reader.info["meas_date"] is not None:
+        raw.set_meas_date(reader.info["meas_date"])
+    return raw
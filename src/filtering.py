@@ -0,0 +1,150 @@
+# filtering.py
+"""
+Fused notch + band-pass filtering with memoized designs.
+
+The combined response for one (sfreq, band, line_hz) is designed once per process and
+applied to a whole channel group in a single zero-phase pass, either as a
+second-order-section IIR run forwards and backwards ("iir") or as a linear-phase FIR
+kernel convolved with FFT overlap-add ("fft"). Filtered signals can then be resampled
+with an anti-aliased polyphase filter, and streams of blocks decimated by an integer
+factor (StreamDecimator).
+"""
+from fractions import Fraction
+from functools import lru_cache
+from scipy import signal
+import numpy as np
+
+IIR_ORDER = 4          # Butterworth band-pass order (doubled by the forward-backward pass)
+NOTCH_Q = 30.0         # quality factor of the IIR line-noise notches
+NOTCH_WIDTH = 2.0      # Hz, stop band of FIR line-noise notches that fall inside the pass band
+DECIMATION_TAPS = 10   # anti-aliasing FIR taps per output sample on each side of the StreamDecimator kernel
+
+def _notch_freqs(sfreq, line_hz, harmonics=True):
+    # Line frequency and its 2nd/3rd harmonics, below Nyquist
+    if line_hz is None or line_hz <= 0:
+        return ()
+    ks = (1, 2, 3) if harmonics else (1,)
+    return tuple(line_hz * k for k in ks if line_hz * k < sfreq / 2.0)
+
+def _fir_transitions(sfreq, hp, lp):
+    # MNE's automatic transition bandwidths for the band edges
+    l_trans = min(max(0.25 * hp, 2.0), hp)
+    h_trans = min(max(0.25 * lp, 2.0), sfreq / 2.0 - lp)
+    return l_trans, h_trans
+
+def _fir_length(sfreq, trans):
+    # Same rule of thumb as MNE's firwin design: 3.3 / transition bandwidth (Hamming)
+    n = int(np.ceil(3.3 / trans * sfreq))
+    return n + 1 if n % 2 == 0 else n  # odd length -> integer group delay
+
+def _lowpass_piece(numtaps, sfreq, cutoff, trans):
+    # Centered windowed-sinc low-pass, zero-padded to numtaps
+    n = min(_fir_length(sfreq, trans), numtaps)
+    h = signal.firwin(n, cutoff, fs=sfreq)
+    return np.pad(h, (numtaps - n) // 2)
+
+@lru_cache(maxsize=64)
+def design_filter(sfreq, hp, lp, line_hz, method, harmonics=True):
+    """
+    Fused notch + band-pass response for one channel group.
+    Returns SOS coefficients (method="iir") or a FIR kernel (method="fft").
+    """
+    nyq = sfreq / 2.0
+    notches = _notch_freqs(sfreq, line_hz, harmonics)
+
+    if method == "iir":
+        sos = [signal.butter(IIR_ORDER, [hp, min(lp, 0.99 * nyq)], btype="bandpass", fs=sfreq, output="sos")]
+        for f0 in notches:
+            b, a = signal.iirnotch(f0, NOTCH_Q, fs=sfreq)
+            sos.append(signal.tf2sos(b, a))
+        return np.vstack(sos)
+
+    if method == "fft":
+        # MNE-style firwin design: each band edge is a windowed-sinc low-pass whose length
+        # matches its own transition band (-6 dB point in the middle of the transition);
+        # line-noise harmonics inside the pass band are subtracted as narrow band-stops
+        l_trans, h_trans = _fir_transitions(sfreq, hp, lp)
+        numtaps = _fir_length(sfreq, min(l_trans, h_trans))
+        kernel = (_lowpass_piece(numtaps, sfreq, min(lp + h_trans / 2.0, 0.99 * nyq), h_trans)
+                  - _lowpass_piece(numtaps, sfreq, hp - l_trans / 2.0, l_trans))
+        for f0 in notches:
+            lo, hi = f0 - NOTCH_WIDTH / 2.0, f0 + NOTCH_WIDTH / 2.0
+            if hp < lo and hi < lp:
+                kernel -= (_lowpass_piece(numtaps, sfreq, hi, NOTCH_WIDTH / 2.0)
+                           - _lowpass_piece(numtaps, sfreq, lo, NOTCH_WIDTH / 2.0))
+        return kernel
+
+    raise ValueError(f"Unknown filter method: {method!r} (expected 'iir' or 'fft')")
+
+def fused_filter(data, sfreq, hp, lp, line_hz, method="fft", harmonics=True):
+    """Zero-phase notch + band-pass of `data` (n_channels, n_times) in one pass per group."""
+    data = np.asarray(data)
+    design = design_filter(float(sfreq), float(hp), float(lp),
+                           float(line_hz) if line_hz else 0.0, method, harmonics)
+
+    if method == "iir":
+        padlen = min(3 * (2 * len(design) + 1), data.shape[-1] - 1)
+        return signal.sosfiltfilt(design, data, axis=-1, padlen=padlen)
+
+    # Odd-reflect pad by half the kernel (as MNE does), convolve, keep the centered part
+    half = len(design) // 2
+    pad = min(half, data.shape[-1] - 1)
+    padded = np.pad(data, [(0, 0)] * (data.ndim - 1) + [(pad, pad)], mode="reflect", reflect_type="odd")
+    out = signal.oaconvolve(padded, design[None, :] if data.ndim == 2 else design, mode="same", axes=-1)
+    return out[..., pad:pad + data.shape[-1]]
+
+def resample_ratio(sfreq, target_sfreq):
+    """(up, down) integers with target_sfreq / sfreq = up / down."""
+    ratio = Fraction(float(target_sfreq) / float(sfreq)).limit_denominator(1000)
+    return ratio.numerator, ratio.denominator
+
+def resampled_length(n_times, sfreq, target_sfreq):
+    up, down = resample_ratio(sfreq, target_sfreq)
+    return -(-n_times * up // down)
+
+def polyphase_resample(data, sfreq, target_sfreq):
+    """
+    Resample `data` (..., n_times) from sfreq to target_sfreq with scipy's polyphase
+    filter (Kaiser-windowed low-pass at the lower Nyquist frequency); only the output
+    samples are computed. Returns resampled_length(n_times, ...) samples.
+    """
+    up, down = resample_ratio(sfreq, target_sfreq)
+    if up == down:
+        return np.asarray(data)
+    return signal.resample_poly(data, up, down, axis=-1)
+
+class StreamDecimator:
+    """
+    Anti-aliased decimation by an integer factor of a stream of (n, k) blocks.
+
+    A centered windowed-sinc low-pass at the new Nyquist frequency is evaluated only at
+    the kept samples (every factor-th, as x[::factor]) whose whole kernel lies inside the
+    stream. Padding the ends (with zeros or a mirror image) would truncate the kernel
+    there and let in-band signal through, so the first and last `half` samples of the
+    stream have no output. Blocks may have any length.
+    """
+
+    def __init__(self, factor):
+        self.factor = max(int(factor), 1)
+        self.half = DECIMATION_TAPS * self.factor if self.factor > 1 else 0
+        self.kernel = signal.firwin(2 * self.half + 1, 1.0 / self.factor) if self.factor > 1 else np.ones(1)
+        self.buffer = None  # samples from (next output - half) on
+        self.n_in = 0
+        self.next_out = self.half  # stream index of the next output sample
+
+    def _emit(self, last):
+        # Outputs centered at next_out, next_out + factor, ... whose window ends at or before `last`
+        n_out = (last - self.half - self.next_out) // self.factor + 1
+        if n_out <= 0:
+            return self.buffer[:0]
+        windows = np.lib.stride_tricks.sliding_window_view(self.buffer, len(self.kernel), axis=0)
+        out = windows[:(n_out - 1) * self.factor + 1:self.factor] @ self.kernel
+        self.next_out += n_out * self.factor
+        self.buffer = self.buffer[n_out * self.factor:]
+        return out
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        self.buffer = block if self.buffer is None else np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+        return self._emit(self.n_in - 1)
@@ -1,65 +1,15 @@
 # generate_preproc_examples.py
-from preprocessing import apply_preprocessing
-from datetime import datetime, timedelta
+from preproc_cache import load_preprocessed
+from annotations import hypnogram_epochs, load_hypnogram
+from datetime import datetime
 from config_loader import load_config
+from manifest import build_manifest, planned_subjects
+from edf_reader import EdfReader
 from collections import defaultdict
 from logger import logger
 import pandas as pd
-import mne, os
-
-def _parse_time(tstr, TIME_FMTS):
-    tstr = tstr.strip()
-    for fmt in TIME_FMTS:
-        try:
-            return datetime.strptime(tstr, fmt).time()
-        except Exception:
-            continue
-    raise ValueError(f"Unrecognized time format: {tstr!r}")
-
-def _read_annotations(annot_path):
-    """Return list of tuples: (stage, start_str, stop_str)."""
-    out = []
-    with open(annot_path, "r", encoding="utf-8", errors="ignore") as f:
-        lines = f.readlines()
-    if not lines:
-        return out
-    
-    for line in lines[1:]:
-        parts = line.strip().split("\t")
-        if len(parts) == 6:
-            stage, _, _, start, stop, _ = parts
-            out.append((stage.strip(), start.strip(), stop.strip()))
-    return out
-
-def _segments_seconds(annos, start_dt, SLEEP_STAGES, TIME_FMTS):
-    segs = []
-    for stage, start_str, stop_str in annos:
-        if stage not in SLEEP_STAGES:
-            continue
-        try:
-            start_clock = _parse_time(start_str, TIME_FMTS)
-            stop_clock  = _parse_time(stop_str, TIME_FMTS)
-
-            sdt = datetime.combine(start_dt.date(), start_clock)
-            edt = datetime.combine(start_dt.date(), stop_clock)
-
-            # Handle midnight crossing
-            if edt < sdt:
-                edt += timedelta(days=1)
-
-            # Handle recording start crossing
-            if sdt < start_dt:
-                sdt += timedelta(days=1)
-                edt += timedelta(days=1)
-
-            s_sec = (sdt - start_dt).total_seconds()
-            e_sec = (edt - start_dt).total_seconds()
-
-            if e_sec > s_sec:
-                segs.append((stage, s_sec, e_sec))
-        except Exception as e:
-            logger.error(f"Annotation parse error for stage={stage} ({start_str}-{stop_str}): {e}")
-    return segs
+import numpy as np
+import os
 
 def _pick_window(segs, win_len, preferred_order):
     """
@@ -96,7 +46,6 @@ def main():
     config = load_config()
     WINDOW_LENGTH = config.time_cca_params.window_length # 30 seconds
     SLEEP_STAGES = config.data.sleep_stages # ['W', 'N1', 'N2', 'N3', 'R']
-    TIME_FMTS = ["%H:%M:%S", "%H:%M:%S.%f"] # handle HH:MM:SS and HH:MM:SS.mmm
     DATA_FOLDER = config.data.data_dir # "data/apples"
     OUTPUT_FOLDER  = config.preprocess.output_dir # "data/apples/preproc_examples"
     EEG_CHANNELS = config.data.eeg_channels # ['C3_M2', 'C4_M1', 'O1_M2', 'O2_M1']
@@ -106,22 +55,22 @@ def main():
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)
 
-    # Choose first available EDF
-    edfs = [f for f in os.listdir(DATA_FOLDER) if f.endswith(".edf")]
-    if not edfs:
-        logger.error("No EDF files in DATA_FOLDER.")
+    # Choose the first usable recording from the cohort manifest
+    file_pairs, _ = planned_subjects(build_manifest(config))
+    if not file_pairs:
+        logger.error("No usable EDF files in DATA_FOLDER.")
         return
-    edf = edfs[0]
-    annot = edf.replace(".edf", ".annot")
+    edf, annot = file_pairs[0]
     edf_path = os.path.join(DATA_FOLDER, edf)
     annot_path = os.path.join(DATA_FOLDER, annot)
 
-    if not os.path.exists(annot_path):
-        logger.error(f"Missing annot for {edf}")
+    # Open EDF: only the header is parsed, the exported window is decoded on demand
+    picks = list(EEG_CHANNELS) + list(EOG_CHANNELS)
+    try:
+        raw = EdfReader(edf_path, channels=picks)
+    except ValueError as e:
+        logger.error(f"Cannot read {edf}: {e}")
         return
-
-    # Load EDF
-    raw = mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
     start_dt = raw.info.get('meas_date')
     if isinstance(start_dt, (list, tuple)):
         start_dt = start_dt[0]
@@ -131,9 +80,10 @@ def main():
     else:
         start_dt = start_dt.replace(tzinfo=None)
 
-    # Parse annotations
-    annos = _read_annotations(annot_path)
-    segs = _segments_seconds(annos, start_dt, SLEEP_STAGES, TIME_FMTS)
+    # Parse annotations (shared hypnogram, same epochs as the CCA scripts)
+    hypnogram = load_hypnogram(annot_path, start_dt, raw.info['sfreq'], SLEEP_STAGES,
+                               getattr(config.data, "hypnogram_cache", True))
+    segs = [seg for seg in hypnogram_epochs(hypnogram, SLEEP_STAGES, raw.info['sfreq']) if seg[2] > seg[1]]
 
     if not segs:
         logger.error("No valid segments from annotations.")
@@ -152,14 +102,14 @@ def main():
     e_samp = int(round(e_sec * sf))
 
     try:
-        # Optional preprocessing (EEG/EOG only)
-        raw_proc = apply_preprocessing(raw, EEG_CHANNELS, EOG_CHANNELS, config)
+        # Preprocessed signals; a cached recording is not refiltered
+        raw_proc = load_preprocessed(edf_path, EEG_CHANNELS, EOG_CHANNELS, config)
     except Exception as e:
         logger.error(f"Failed to preprocess data for subject {edf_path} , error: {e}")
+        return
 
     # Export per-channel CSVs: time_s, raw_uV, preproc_uV
-    picks = EEG_CHANNELS + EOG_CHANNELS
-    times = raw.times[s_samp:e_samp]
+    times = np.arange(s_samp, e_samp) / sf
 
     for ch in picks:
         raw_v = raw.get_data(picks=[ch], start=s_samp, stop=e_samp).ravel() * 1e6 # µV
@@ -0,0 +1,146 @@
+# group_stats.py
+"""
+Mergeable moment statistics and one-way ANOVA from group sufficient statistics.
+
+MomentStats holds the count, mean and central moment sums M2, M3, M4 of one or more
+columns. Partial results (one file, one chunk) merge with Pébay's pairwise formulas,
+so per-group mean, std, skewness and kurtosis are exact without the raw samples.
+group_moments/group_histogram compute the same statistics for every group of a long
+table at once, with bincount over factorized group codes instead of a groupby-apply.
+"""
+from scipy.stats import f as f_dist
+import pandas as pd
+import numpy as np
+
+class MomentStats:
+    """Count, mean and central moment sums M2..M4 of k columns (arrays shaped (k,))."""
+
+    def __init__(self, n=0, mean=0.0, M2=0.0, M3=0.0, M4=0.0):
+        self.n = np.asarray(n, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.M2 = np.asarray(M2, dtype=np.float64)
+        self.M3 = np.asarray(M3, dtype=np.float64)
+        self.M4 = np.asarray(M4, dtype=np.float64)
+
+    @classmethod
+    def from_values(cls, values):
+        """Moments of samples shaped (n,) or (n, k); NaNs are left out per column."""
+        values = np.asarray(values, dtype=np.float64)
+        finite = ~np.isnan(values)
+        n = finite.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(finite, values, 0.0).sum(axis=0) / n
+        d = np.where(finite, values - mean, 0.0)
+        d2 = d * d
+        return cls(n, np.where(n > 0, mean, 0.0), d2.sum(axis=0), (d2 * d).sum(axis=0), (d2 * d2).sum(axis=0))
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        n = na + nb
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            d_n = np.where(n > 0, delta / n, 0.0)
+            M2 = self.M2 + other.M2 + delta * d_n * na * nb
+            M3 = (self.M3 + other.M3 + d_n * d_n * delta * na * nb * (na - nb)
+                  + 3.0 * d_n * (na * other.M2 - nb * self.M2))
+            M4 = (self.M4 + other.M4 + d_n ** 3 * delta * na * nb * (na * na - na * nb + nb * nb)
+                  + 6.0 * d_n * d_n * (na * na * other.M2 + nb * nb * self.M2)
+                  + 4.0 * d_n * (na * other.M3 - nb * self.M3))
+            self.mean = self.mean + d_n * nb
+        self.n, self.M2, self.M3, self.M4 = n, M2, M3, M4
+        return self
+
+    def std(self, ddof=0):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(np.where(self.n > ddof, self.M2 / (self.n - ddof), np.nan))
+
+    def _m2(self):
+        # Second central moment; NaN where it is zero up to rounding, as in scipy.stats
+        m2 = self.M2 / self.n
+        flat = m2 <= (np.finfo(np.float64).resolution * self.mean) ** 2
+        return np.where(flat, np.nan, m2)
+
+    def skewness(self):
+        """Biased sample skewness (scipy.stats.skew default)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.M3 / self.n) / self._m2() ** 1.5
+
+    def kurtosis(self):
+        """Biased Fisher kurtosis (scipy.stats.kurtosis default)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m2 = self._m2()
+            return (self.M4 / self.n) / (m2 * m2) - 3.0
+
+def one_way_anova(groups):
+    """
+    One-way ANOVA F statistic and p-value from a list of per-group MomentStats
+    (same result as scipy.stats.f_oneway on the raw samples, per column).
+    """
+    n = np.array([g.n for g in groups], dtype=np.float64)
+    means = np.array([g.mean for g in groups], dtype=np.float64)
+    ss_within = np.sum([g.M2 for g in groups], axis=0)
+
+    n_total = n.sum(axis=0)
+    grand_mean = (n * means).sum(axis=0) / n_total
+    ss_between = (n * (means - grand_mean) ** 2).sum(axis=0)
+
+    df_between = len(groups) - 1
+    df_within = n_total - len(groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        F = (ss_between / df_between) / (ss_within / df_within)
+    return F, f_dist.sf(F, df_between, df_within)
+
+def factorize_groups(*keys):
+    """
+    Group codes (n,) of one or more key arrays and a DataFrame of the observed key
+    combinations, ordered like groupby(sort=True).
+    """
+    codes = np.zeros(len(keys[0]), dtype=np.int64)
+    uniques = []
+    for key in keys:
+        key_codes, key_uniques = pd.factorize(np.asarray(key), sort=True)
+        codes = codes * len(key_uniques) + key_codes
+        uniques.append(key_uniques)
+    observed, codes = np.unique(codes, return_inverse=True)
+
+    # Decode the combined codes back to the key values
+    columns = []
+    for key_uniques in reversed(uniques):
+        columns.append(np.asarray(key_uniques)[observed % len(key_uniques)])
+        observed = observed // len(key_uniques)
+    return codes, pd.DataFrame(dict(enumerate(reversed(columns))))
+
+def group_moments(codes, n_groups, values):
+    """
+    MomentStats with (n_groups, k) arrays of the samples `values` (n, k) per group
+    code; NaNs are left out. Two passes of bincount over the samples.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(len(codes), -1)
+    k = values.shape[1]
+    finite = ~np.isnan(values)
+    flat = (codes[:, None] * k + np.arange(k)).ravel()
+    size = n_groups * k
+
+    def per_group(weights):
+        return np.bincount(flat, weights=weights.ravel(), minlength=size).reshape(n_groups, k)
+
+    n = per_group(finite.astype(np.float64))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, per_group(np.where(finite, values, 0.0)) / n, 0.0)
+    d = np.where(finite, values - mean[codes], 0.0)
+    d2 = d * d
+    return MomentStats(n, mean, per_group(d2), per_group(d2 * d), per_group(d2 * d2))
+
+def group_histogram(codes, n_groups, values, edges):
+    """
+    Counts (n_groups, n_bins) of the 1-D `values` per group code, with np.histogram's
+    bins: right-open except the last, values outside the edges or NaN not counted.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    n_bins = len(edges) - 1
+    values = np.asarray(values, dtype=np.float64)
+    bins = np.searchsorted(edges, values, side="right") - 1
+    bins[values == edges[-1]] = n_bins - 1
+    valid = (bins >= 0) & (bins < n_bins)
+    counts = np.bincount(codes[valid] * n_bins + bins[valid], minlength=n_groups * n_bins)
+    return counts.reshape(n_groups, n_bins)
@@ -0,0 +1,38 @@
+# hashing.py
+"""
+Content and configuration digests used to key caches and completion records.
+"""
+from omegaconf import OmegaConf
+import hashlib
+import json
+import os
+
+_DIGEST_MEMO = {}
+
+def file_digest(path, chunk_size=1 << 22):
+    """
+    SHA-256 of a file's content. Memoized per (path, size, mtime) within the process,
+    so repeated lookups of an unchanged file do not re-read it.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key in _DIGEST_MEMO:
+        return _DIGEST_MEMO[memo_key]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    _DIGEST_MEMO[memo_key] = digest
+    return digest
+
+def config_digest(*parts):
+    """Stable short digest of config sections / plain values (order of keys ignored)."""
+    payload = []
+    for part in parts:
+        if OmegaConf.is_config(part):
+            part = OmegaConf.to_container(part, resolve=True)
+        payload.append(part)
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
@@ -0,0 +1,107 @@
+# ledger.py
+"""
+Per-stage completion ledger for incremental, resumable runs.
+
+Each per-subject stage keeps `<output_dir>/ledger.json` mapping a recording to the
+content digest of its EDF/.annot pair, the digest of the config sections that affect
+the stage's results and the output files it wrote. A subject is skipped when all
+three still match; entries are written as soon as a subject finishes, so an
+interrupted run resumes at the first unfinished subject.
+"""
+from hashing import config_digest, file_digest
+from omegaconf import OmegaConf
+from datetime import datetime
+from logger import logger
+import json
+import os
+
+LEDGER_FILE = "ledger.json"
+
+def settings_digest(cfg, sections):
+    """Digest of the named top-level config sections, ignoring paths and cache switches."""
+    parts = []
+    for name in sections:
+        section = getattr(cfg, name, None)
+        if section is None:
+            parts.append(None)
+            continue
+        values = OmegaConf.to_container(section, resolve=True)
+        if isinstance(values, dict):
+            values = {k: v for k, v in values.items() if not k.endswith("dir") and k != "hypnogram_cache"}
+        parts.append(values)
+    return config_digest(*parts)
+
+class Ledger:
+    """Completion records of one pipeline stage."""
+
+    def __init__(self, output_dir, settings):
+        self.path = os.path.join(output_dir, LEDGER_FILE)
+        self.output_dir = output_dir
+        self.settings = settings
+        self.entries = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable ledger {self.path}: {e}")
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _inputs(self, edf_path, annot_path, entry=None):
+        # Content digests are only recomputed when size/mtime changed since the last record
+        stats = [self._stat(edf_path), self._stat(annot_path)]
+        if entry is not None and entry.get("stats") == stats:
+            return stats, entry["input"]
+        return stats, f"{file_digest(edf_path)[:24]}-{file_digest(annot_path)[:24]}"
+
+    def is_current(self, edf_path, annot_path):
+        entry = self.entries.get(os.path.basename(edf_path))
+        if entry is None or entry.get("settings") != self.settings:
+            return False
+        if not all(os.path.exists(os.path.join(self.output_dir, f)) for f in entry.get("outputs", [])):
+            return False
+        return self._inputs(edf_path, annot_path, entry)[1] == entry["input"]
+
+    def outputs(self, edf_path):
+        entry = self.entries.get(os.path.basename(edf_path), {})
+        return list(entry.get("outputs", []))
+
+    def record(self, edf_path, annot_path, outputs):
+        stats, digest = self._inputs(edf_path, annot_path)
+        self.entries[os.path.basename(edf_path)] = {
+            "input": digest,
+            "stats": stats,
+            "settings": self.settings,
+            "outputs": list(outputs),
+            "completed": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+def open_ledger(cfg, output_dir, sections):
+    """The stage ledger, or None when `ledger.enabled` is off (every subject is recomputed)."""
+    params = getattr(cfg, "ledger", None)
+    if params is None or not getattr(params, "enabled", False):
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    return Ledger(output_dir, settings_digest(cfg, sections))
+
+def pending_subjects(ledger, file_pairs, data_dir, costs=None):
+    """(file_pairs, costs) restricted to the subjects the ledger does not list as up to date."""
+    costs = list(costs) if costs is not None else [0] * len(file_pairs)
+    if ledger is None:
+        return list(file_pairs), costs
+    todo = [i for i, (edf_file, annot_file) in enumerate(file_pairs)
+            if not ledger.is_current(os.path.join(data_dir, edf_file), os.path.join(data_dir, annot_file))]
+    if len(todo) < len(file_pairs):
+        logger.info(f"Ledger: {len(file_pairs) - len(todo)} of {len(file_pairs)} subjects up to date, skipped")
+    return [file_pairs[i] for i in todo], [costs[i] for i in todo]
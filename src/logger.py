@@ -1,28 +1,53 @@
 # logger.py
+"""
+Project logger.
+
+Records are put on a bounded in-memory queue without being formatted; a listener thread
+formats them and writes them to stdout (and LOG_FILE), so a logging call in a hot loop
+never waits on I/O. When the queue is full (LOG_QUEUE_SIZE records) new records are
+dropped and counted, and the count is reported once there is room again. Subject worker
+processes get a fresh queue and listener at fork and flush it on exit (start_worker_logging).
+
+RepeatedLog aggregates repeated per-window/per-epoch messages into periodic counted
+summaries per key (e.g. subject and stage).
+"""
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing.util
+import threading
 import logging
+import atexit
+import queue
+import time
 import os
 import sys
 
-class logger(logging.Logger):
-    def _stringify(self, obj):
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+def _stringify(obj):
+    try:
+        return str(obj)
+    except Exception:
         try:
-            return str(obj)
+            return repr(obj)
         except Exception:
-            try:
-                return repr(obj)
-            except Exception:
-                return "<unprintable>"
+            return "<unprintable>"
+
+class _Joined:
+    """print-style message: msg and the extra args joined by spaces, only when the record is formatted."""
+
+    def __init__(self, msg, args):
+        self.msg = msg
+        self.args = args
+
+    def __str__(self):
+        return " ".join([self.msg] + [_stringify(a) for a in self.args])
 
+class logger(logging.Logger):
     def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False, stacklevel=1):
-        # If user passed extra args but msg has no %-placeholders, join them
+        # If user passed extra args but msg has no %-placeholders, join them (lazily)
         if args and isinstance(msg, str) and ('%' not in msg):
-            try:
-                parts = [msg] + [self._stringify(a) for a in args]
-                msg = " ".join(parts)
-                args = ()  # prevent stdlib from doing %-formatting
-            except Exception:
-                msg = f"{msg} {args}"
-                args = ()
+            msg = _Joined(msg, args)
+            args = ()  # prevent stdlib from doing %-formatting
 
         super()._log(level, msg, args, exc_info=exc_info, extra=extra,
                      stack_info=stack_info, stacklevel=stacklevel)
@@ -37,6 +62,65 @@ def _build_formatter():
         datefmt="%Y-%m-%d %H:%M:%S,%f"
     )
 
+class _DroppingQueueHandler(QueueHandler):
+    """Non-blocking queue handler: records are queued as they are, dropped (and counted) when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener thread formats the record; the queue never leaves this process
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                notice = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                           "%d log records dropped (logging queue full)", (self.dropped,), None)
+                self.queue.put_nowait(notice)
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Blocking put: the stop sentinel must not be lost to a full queue
+        self.queue.put(self._sentinel)
+
+_queue_handler = None
+_listener = None
+_worker_finalizer = None
+
+def _stop_listener():
+    # Drains the queue before returning; safe to call more than once
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _start_listener(handlers):
+    global _listener
+    _queue_handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.dropped = 0
+    _listener = _Listener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def _restart_after_fork():
+    # A forked child inherits the queue (possibly mid-operation) but not the listener thread
+    if _listener is not None:
+        _start_listener(_listener.handlers)
+
+def start_worker_logging():
+    """
+    Flush the queued records when this pool worker exits. Workers leave through os._exit,
+    which skips atexit but runs multiprocessing finalizers; call from the pool initializer.
+    """
+    global _worker_finalizer
+    if _worker_finalizer is None:
+        _worker_finalizer = multiprocessing.util.Finalize(None, _stop_listener, exitpriority=10)
+
 def _ensure_handler(logger_obj):
     if logger_obj.handlers:
         return logger_obj
@@ -47,18 +131,74 @@ def _ensure_handler(logger_obj):
     stream = logging.StreamHandler(stream=sys.stdout)
     stream.setLevel(level)
     stream.setFormatter(_build_formatter())
-    logger_obj.addHandler(stream)
+    handlers = [stream]
 
     log_file = os.getenv("LOG_FILE")
     if log_file:
         fh = logging.FileHandler(log_file, encoding="utf-8")
         fh.setLevel(level)
         fh.setFormatter(_build_formatter())
-        logger_obj.addHandler(fh)
+        handlers.append(fh)
+
+    # Calls only enqueue; formatting and I/O happen in the listener thread
+    global _queue_handler
+    _queue_handler = _DroppingQueueHandler(None)
+    _queue_handler.setLevel(level)
+    _start_listener(handlers)
+    atexit.register(_stop_listener)
+    if hasattr(os, "register_at_fork"):  # POSIX only
+        os.register_at_fork(after_in_child=_restart_after_fork)
+    logger_obj.addHandler(_queue_handler)
 
     # Avoid duplicate logs if root has handlers
     logger_obj.propagate = False
     return logger_obj
 
+class RepeatedLog:
+    """
+    Counted summaries of a repeated message, per key (e.g. (subject, stage)).
+
+    The first add() of a key is logged as is; later ones are only counted, and the count
+    is logged with the latest message at most once per `interval` seconds and on flush()
+    (e.g. when a subject is done). Messages are %-style templates formatted only when
+    logged, so a corrupt recording costs a few lines instead of one per window.
+    """
+
+    def __init__(self, log, level=logging.ERROR, interval=30.0):
+        self.log = log
+        self.level = level
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> [count since last report, last report time, msg, args]
+
+    def add(self, key, msg, *args, count=1):
+        """Record `count` occurrences of msg % args under key."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [count - 1, now, msg, args]
+                self.log.log(self.level, msg, *args)
+                return
+            entry[0] += count
+            entry[2:] = [msg, args]
+            if now - entry[1] >= self.interval:
+                self._report(key, entry, now)
+
+    def flush(self):
+        """Log the outstanding counts and forget every key."""
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in self._pending.items():
+                self._report(key, entry, now)
+            self._pending.clear()
+
+    def _report(self, key, entry, now):
+        n, since, msg, args = entry
+        if n:
+            label = " ".join(str(k) for k in key) if isinstance(key, tuple) else str(key)
+            self.log.log(self.level, "%s: %d more in %.1fs, last: " + msg, label, n, now - since, *args)
+        entry[0], entry[1] = 0, now
+
 # Module-level logger used across the project
 logger = _ensure_handler(logging.getLogger("bespace"))
@@ -0,0 +1,126 @@
+# manifest.py
+"""
+Cohort manifest built from EDF headers and annotation files only.
+
+One row per recording in `data.data_dir`: file sizes, sampling rate, length and start
+time of the EEG/EOG channels, which configured channels are present, per-stage epoch
+counts/durations and a `usable` flag with the reason when it is not. The pipeline
+stages plan their subject lists (and pool submission order) from this table.
+"""
+from annotations import load_hypnogram
+from edf_reader import read_edf_header
+from logger import logger
+import pandas as pd
+import numpy as np
+import os
+
+def manifest_path(cfg):
+    """<data.manifest_dir>/<cohort>.csv, the cohort being the data_dir folder name."""
+    data_dir = cfg.data.data_dir
+    manifest_dir = getattr(cfg.data, "manifest_dir", "data/manifest")
+    cohort = os.path.basename(os.path.normpath(data_dir))
+    return os.path.join(manifest_dir, f"{cohort}.csv")
+
+def _subject_row(data_dir, edf_file, eeg_chs, eog_chs, stages, use_cache, resampled=False):
+    annot_file = edf_file.replace(".edf", ".annot")
+    edf_path = os.path.join(data_dir, edf_file)
+    annot_path = os.path.join(data_dir, annot_file)
+    channels = list(eeg_chs) + list(eog_chs)
+
+    row = {"subject": os.path.splitext(edf_file)[0], "edf_file": edf_file, "annot_file": annot_file,
+           "edf_bytes": os.path.getsize(edf_path),
+           "annot_bytes": os.path.getsize(annot_path) if os.path.exists(annot_path) else np.nan,
+           "sfreq": np.nan, "n_times": 0, "duration_s": np.nan, "meas_date": None}
+    row.update({f"has_{ch}": False for ch in channels})
+    for stage in stages:
+        row[f"n_{stage}"] = 0
+        row[f"dur_{stage}"] = 0.0
+    issues = []
+
+    try:
+        header = read_edf_header(edf_path)
+    except (OSError, ValueError) as e:
+        row.update(usable=False, issue=f"unreadable header: {e}")
+        return row
+
+    labels = header["labels"]
+    present = [ch for ch in channels if ch in labels]
+    row.update({f"has_{ch}": ch in labels for ch in channels})
+    if len(present) < len(channels):
+        issues.append(f"missing channels {[ch for ch in channels if ch not in labels]}")
+
+    # Each modality needs one rate; EEG and EOG may differ when both are resampled to a target rate
+    eeg_rates = {int(header["samples_per_record"][labels.index(ch)]) for ch in eeg_chs if ch in labels}
+    eog_rates = {int(header["samples_per_record"][labels.index(ch)]) for ch in eog_chs if ch in labels}
+    rates = eeg_rates | eog_rates
+    if len(eeg_rates) > 1 or len(eog_rates) > 1 or (len(rates) > 1 and not resampled):
+        issues.append("mixed sampling rates")
+    if rates and header["record_duration"] > 0:
+        spr = max(rates)
+        row["sfreq"] = spr / header["record_duration"]
+        row["n_times"] = spr * header["n_records"]
+        row["duration_s"] = header["n_records"] * header["record_duration"]
+
+    meas_date = header["meas_date"]
+    if meas_date is None:
+        issues.append("invalid meas_date")
+    else:
+        row["meas_date"] = meas_date.replace(tzinfo=None).isoformat()
+
+    if not os.path.exists(annot_path):
+        issues.append("missing annot")
+    elif meas_date is not None and row["n_times"] > 0:
+        hyp = load_hypnogram(annot_path, meas_date, row["sfreq"], stages, use_cache)
+        # Same validity rule as the CCA stages: clipped to the recording, non-empty
+        stop = np.minimum(hyp["stop_sample"], row["n_times"])
+        valid = (hyp["start_sample"] >= 0) & (hyp["start_sample"] < stop)
+        counts = np.bincount(hyp["stage"][valid], minlength=len(stages))
+        samples = np.bincount(hyp["stage"][valid], weights=(stop - hyp["start_sample"])[valid],
+                              minlength=len(stages))
+        for k, stage in enumerate(stages):
+            row[f"n_{stage}"] = int(counts[k])
+            row[f"dur_{stage}"] = float(samples[k] / row["sfreq"])
+        if counts.sum() == 0:
+            issues.append("no scored epochs")
+
+    if row["n_times"] == 0 and not issues:
+        issues.append("empty recording")
+    row["usable"] = not issues
+    row["issue"] = "; ".join(issues)
+    return row
+
+def build_manifest(cfg):
+    """Scan data_dir, write the cohort manifest CSV and return it as a DataFrame."""
+    data_dir = cfg.data.data_dir
+    stages = list(cfg.data.sleep_stages)
+    use_cache = getattr(cfg.data, "hypnogram_cache", True)
+    resampled = bool(getattr(cfg.preprocess, "target_sfreq", None))
+    edf_files = sorted(f for f in os.listdir(data_dir) if f.endswith(".edf"))
+
+    rows = [_subject_row(data_dir, f, cfg.data.eeg_channels, cfg.data.eog_channels, stages, use_cache, resampled)
+            for f in edf_files]
+    manifest = pd.DataFrame(rows)
+
+    out_path = manifest_path(cfg)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    manifest.to_csv(out_path, index=False)
+
+    if manifest.empty:
+        logger.warning(f"Manifest: no EDF files in {data_dir}")
+        return manifest
+    logger.info(f"Manifest: {int(manifest['usable'].sum())}/{len(manifest)} usable recordings -> {out_path}")
+    for edf_file, issue in manifest.loc[~manifest["usable"], ["edf_file", "issue"]].itertuples(index=False):
+        logger.warning(f"Skipping {edf_file}: {issue}")
+    return manifest
+
+def planned_subjects(manifest):
+    """
+    (file_pairs, costs) for the usable recordings, in file order. The cost is the
+    number of samples per channel, used to submit the longest recordings first.
+    """
+    if manifest.empty:
+        return [], []
+    usable = manifest[manifest["usable"]]
+    file_pairs = list(zip(usable["edf_file"], usable["annot_file"]))
+    costs = [int(n) for n in usable["n_times"]]
+    return file_pairs, costs
@@ -0,0 +1,44 @@
+# memory.py
+"""
+Signal precision and working-memory budget.
+
+Loaded and filtered EEG/EOG are held in `memory.signal_dtype` (float32 by default);
+covariances and moments are always accumulated in float64 from chunks of them.
+`memory.budget_gb` is the working memory of the node, shared by the subject workers
+(and, when a single worker prefetches, by the recordings it holds at once): stages size
+their chunks and batches to their share instead of materializing whole float64 copies
+of a recording.
+"""
+from parallel import parallel_settings
+from prefetch import prefetch_depth
+from logger import logger
+import numpy as np
+
+def memory_settings(cfg):
+    """
+    (signal_dtype, budget_bytes per recording in flight) from the optional `memory` section;
+    budget 0 = unlimited. The node budget is split between the workers, and with one worker
+    prefetching `depth` subjects between the depth + 2 recordings it keeps in memory.
+    """
+    params = getattr(cfg, "memory", None)
+    dtype = np.dtype(getattr(params, "signal_dtype", "float32") if params is not None else "float32")
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"memory.signal_dtype must be float32 or float64, got {dtype}")
+    budget_gb = float(getattr(params, "budget_gb", 0) or 0) if params is not None else 0.0
+    n_workers, _ = parallel_settings(cfg)
+    depth = prefetch_depth(cfg) if n_workers == 1 else 0  # the process pool does not prefetch
+    shares = n_workers * (depth + 2) if depth else n_workers
+    return dtype, int(budget_gb * (1 << 30) / shares)
+
+def rows_within(budget, bytes_per_row, default, minimum=1):
+    """Chunk length: `default` rows, fewer if that many rows of `bytes_per_row` exceed the budget."""
+    if not budget:
+        return default
+    return int(max(min(default, budget // max(int(bytes_per_row), 1)), minimum))
+
+def check_fits(budget, nbytes, what):
+    """Warn when an unavoidable allocation is larger than the budget; returns whether it fits."""
+    if budget and nbytes > budget:
+        logger.warning(f"{what} needs {nbytes / 1e6:.0f} MB, above the {budget / 1e6:.0f} MB per-worker memory budget")
+        return False
+    return True
@@ -0,0 +1,85 @@
+# parallel.py
+"""
+Subject-level process pool shared by the per-recording pipeline stages.
+Each worker caps its BLAS/OpenMP thread pools so n_workers processes do not
+oversubscribe the cores. A single process instead overlaps loading the next subjects
+with analyzing the current one (prefetch.py).
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from prefetch import prefetch_depth, prefetched
+from threadpoolctl import threadpool_limits
+from telemetry import count
+from logger import logger, start_worker_logging
+import os
+
+def parallel_settings(cfg):
+    """(n_workers, blas_threads) from the optional `parallel` config section."""
+    params = getattr(cfg, "parallel", None)
+    n_workers = getattr(params, "n_workers", 1) if params is not None else 1
+    blas_threads = getattr(params, "blas_threads_per_worker", 1) if params is not None else 1
+
+    # 0 / None means "all cores"
+    if not n_workers:
+        n_workers = os.cpu_count() or 1
+    return max(int(n_workers), 1), max(int(blas_threads or 1), 1)
+
+def _init_worker(blas_threads):
+    # Applied once per worker process and kept for its lifetime
+    threadpool_limits(limits=blas_threads)
+    start_worker_logging()
+
+def map_subjects(func, file_pairs, cfg, costs=None, on_result=None, preload=None):
+    """
+    Run func(edf_file, annot_file) for every pair, in a process pool when
+    parallel.n_workers > 1. Results are returned in the order of `file_pairs`;
+    a subject whose worker raised yields None. With `costs` (e.g. recording length
+    from the manifest) the most expensive subjects are submitted first, so a long
+    recording does not start last and leave the other workers idle.
+    on_result(file_pair, result) is called in this process as soon as each subject
+    finishes (e.g. to checkpoint it); it is not called for failed subjects.
+    With `preload` and a single worker, preload(edf_file, annot_file) runs up to
+    parallel.prefetch_depth subjects ahead in a background thread and its result is
+    passed on as func(edf_file, annot_file, preloaded).
+    """
+    n_workers, blas_threads = parallel_settings(cfg)
+    n_workers = min(n_workers, max(len(file_pairs), 1))
+
+    if n_workers == 1:
+        depth = prefetch_depth(cfg)
+        if preload is not None and depth > 0 and len(file_pairs) > 1:
+            subjects = prefetched(preload, file_pairs, depth)
+        else:
+            subjects = ((pair, None, None) for pair in file_pairs)
+
+        results = []
+        for (edf_file, annot_file), preloaded, error in subjects:
+            try:
+                if error is not None:
+                    raise error
+                args = (edf_file, annot_file) if preloaded is None else (edf_file, annot_file, preloaded)
+                results.append(func(*args))
+            except Exception as e:
+                logger.error(f"Subject {edf_file} failed: {e}")
+                count("subject_failed", subject=edf_file)
+                results.append(None)
+                continue
+            if on_result is not None:
+                on_result((edf_file, annot_file), results[-1])
+        return results
+
+    logger.info(f"Processing {len(file_pairs)} subjects with {n_workers} workers ({blas_threads} BLAS thread(s) each)")
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(blas_threads,)) as pool:
+        order = range(len(file_pairs)) if costs is None else sorted(range(len(file_pairs)), key=lambda i: -costs[i])
+        futures = {pool.submit(func, *file_pairs[i]): i for i in order}
+        results = [None] * len(file_pairs)
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logger.error(f"Subject {file_pairs[i][0]} failed in worker: {e}")
+                count("subject_failed", subject=file_pairs[i][0])
+                continue
+            if on_result is not None:
+                on_result(file_pairs[i], results[i])
+    return results
@@ -0,0 +1,168 @@
+# pipeline.py
+"""
+In-process DAG runner for the pipeline stages.
+
+Every script exposes main(**artifacts) returning a dict of DataFrames; the runner
+imports the enabled stages once, in dependency order, and hands those DataFrames to
+the downstream stages in memory (a stage that gets None reads the file on disk).
+A stage is skipped when its outputs exist and neither its config sections nor the
+outputs of the stages it depends on changed since it last ran; the per-subject CCA
+stages always run and rely on their own completion ledgers.
+"""
+from hashing import config_digest
+from ledger import settings_digest
+from telemetry import memory_snapshot, profiled, timer
+from logger import logger
+import matplotlib
+import importlib
+import json
+import time
+import os
+
+class Stage:
+    """One node of the pipeline DAG."""
+
+    def __init__(self, name, module, flag, deps=(), inputs=(), outputs=None, sections=(), sources=None, always=False):
+        self.name = name
+        self.module = module      # script exposing main(**artifacts)
+        self.flag = flag          # run_params switch
+        self.deps = list(deps)    # upstream stage names
+        self.inputs = list(inputs)  # in-memory artifacts passed to main()
+        self.outputs = outputs or (lambda cfg: [])  # files/dirs it writes, from the config
+        self.sections = list(sections)  # config sections its results depend on
+        self.sources = sources or (lambda cfg: [])  # raw inputs outside the pipeline
+        self.always = always
+
+def _static_dir(cfg, *names):
+    return [os.path.join(cfg.static_cca_params.output_dir, n) for n in names]
+
+def _static_results(cfg, *names):
+    return [os.path.join(cfg.static_cca_params.results_dir, n) for n in names]
+
+def _tr_dir(cfg, *names):
+    return [os.path.join(cfg.time_cca_params.output_dir, n) for n in names]
+
+def _tr_results(cfg, *names):
+    return [os.path.join(cfg.time_cca_params.results_dir, n) for n in names]
+
+def _report(cfg, *names):
+    return [os.path.join(cfg.report.figures_folder, n) for n in names]
+
+STAGES = [
+    Stage("preproc_examples", "generate_preproc_examples", "run_preproc_example",
+          outputs=lambda cfg: [cfg.preprocess.output_dir],
+          sections=["data", "preprocess", "time_cca_params"],
+          sources=lambda cfg: [cfg.data.data_dir]),
+    Stage("preproc_figures", "visualize_preproc_examples", "run_preproc_example",
+          deps=["preproc_examples"],
+          outputs=lambda cfg: _report(cfg, "figure6a_preprocessing.png", "figure6b_preprocessing.png")),
+    Stage("static_cca", "static_cca", "run_static_cca", always=True,
+          outputs=lambda cfg: _static_dir(cfg, "eeg_eog_cca_summary_stats.csv", "projections")),
+    Stage("static_projections", "static_cca_analyze_canonical_projections", "run_static_analysis",
+          deps=["static_cca"],
+          outputs=lambda cfg: _static_results(cfg, "canonical_projection_summary_by_stage.csv")),
+    Stage("static_summary_stats", "stataic_cca_analyze_summary_stats", "run_static_analysis",
+          deps=["static_cca"], inputs=["static_summary"],
+          outputs=lambda cfg: _static_results(cfg, "cca_correlation_summary.csv")),
+    Stage("static_explained_variance", "static_cca_explained_variance", "run_static_analysis",
+          deps=["static_cca"], inputs=["static_summary"],
+          outputs=lambda cfg: _static_dir(cfg, "explained_variance_by_stage.csv")),
+    Stage("time_resolved_cca", "time_resolved_cca", "run_time_resolved_cca", always=True,
+          outputs=lambda cfg: _tr_dir(cfg, "timeseries")),
+    Stage("time_resolved_analysis", "time_resolved_cca_analysis", "run_time_resolved_analysis",
+          deps=["time_resolved_cca"], inputs=["timeseries"], sections=["time_cca_params"],
+          outputs=lambda cfg: _tr_results(cfg, "stagewise_summary.csv", "mean_cca_trajectory_by_stage.csv",
+                                          "entropy_by_subject_stage.csv", "subset_trajectories.csv")),
+    Stage("time_resolved_stationarity", "time_resolved_cca_check_stationarity", "run_time_resolved_analysis",
+          deps=["time_resolved_cca"], inputs=["timeseries"], sections=["stationarity"],
+          outputs=lambda cfg: _tr_dir(cfg, "stationarity_results.csv")),
+    Stage("report_figures", "generate_figures_report", "generate_figures",
+          deps=["static_cca", "time_resolved_analysis"],
+          inputs=["static_summary", "subset_trajectories", "mean_cca_trajectory_by_stage", "entropy_by_subject_stage"],
+          outputs=lambda cfg: _report(cfg, "figure1_static_cca_boxplots.png", "figure2_time_resolved_boxplots.png",
+                                      "figure3_cca_trajectories.png", "figure4_entropy_boxplots.png")),
+    Stage("explained_variance_figures", "static_cca_visualize_explained_variance", "generate_figures",
+          deps=["static_explained_variance"], inputs=["explained_variance"],
+          outputs=lambda cfg: _report(cfg, "figure5a_explained_variance_Xc.png", "figure5b_explained_variance_Yc.png")),
+    Stage("time_resolved_figures", "time_resolved_cca_plotting_grouped", "generate_figures",
+          deps=["time_resolved_analysis"],
+          inputs=["stagewise_summary", "mean_cca_trajectory_by_stage", "entropy_by_subject_stage", "subset_trajectories"],
+          outputs=lambda cfg: [os.path.join(cfg.time_cca_params.results_dir, "figures")]),
+]
+
+def _fingerprint(paths):
+    """Digest of (path, size, mtime) of every file under `paths`; missing paths count too."""
+    entries = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("_"))
+                for name in sorted(files):
+                    st = os.stat(os.path.join(root, name))
+                    entries.append([os.path.join(root, name), st.st_size, st.st_mtime_ns])
+        elif os.path.exists(path):
+            st = os.stat(path)
+            entries.append([path, st.st_size, st.st_mtime_ns])
+        else:
+            entries.append([path, None])
+    return config_digest(entries)
+
+def _pipeline_settings(cfg):
+    params = getattr(cfg, "pipeline", None)
+    state_file = getattr(params, "state_file", "data/pipeline_state.json") if params is not None else "data/pipeline_state.json"
+    force = bool(getattr(params, "force", False)) if params is not None else False
+    return state_file, force
+
+def _load_state(state_file):
+    if not os.path.isfile(state_file):
+        return {}
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable pipeline state {state_file}: {e}")
+        return {}
+
+def _save_state(state_file, state):
+    os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+    tmp_path = f"{state_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_file)
+
+def run_pipeline(cfg, stages=STAGES):
+    """Run the stages enabled in cfg.run_params in dependency order, skipping up-to-date ones."""
+    state_file, force = _pipeline_settings(cfg)
+    state = _load_state(state_file)
+    by_name = {stage.name: stage for stage in stages}
+    artifacts = {}
+
+    for stage in stages:
+        if not getattr(cfg.run_params, stage.flag, False):
+            continue
+
+        upstream = [p for dep in stage.deps for p in by_name[dep].outputs(cfg)] + list(stage.sources(cfg))
+        record = {"settings": settings_digest(cfg, stage.sections), "inputs": _fingerprint(upstream)}
+        outputs_present = all(os.path.exists(p) for p in stage.outputs(cfg))
+        if not (force or stage.always) and outputs_present and state.get(stage.name) == record:
+            logger.info(f"Stage {stage.name}: up to date, skipped")
+            continue
+
+        logger.info(f"Stage {stage.name}: running {stage.module}")
+        t0 = time.perf_counter()
+        try:
+            module = importlib.import_module(stage.module)
+            # Each stage gets its own matplotlib rc state, as it had in its own interpreter
+            with matplotlib.rc_context(), profiled(stage.name), timer("pipeline.stage", stage=stage.name):
+                produced = module.main(**{k: artifacts[k] for k in stage.inputs if k in artifacts})
+            memory_snapshot("pipeline.stage", stage=stage.name)
+        except Exception as e:
+            logger.error(f"Stage {stage.name} failed: {e}")
+            continue
+        artifacts.update(produced or {})
+
+        # Recorded against the upstream outputs as they were when the stage ran
+        state[stage.name] = record
+        _save_state(state_file, state)
+        logger.info(f"Stage {stage.name}: done in {time.perf_counter() - t0:.1f}s")
+    return artifacts
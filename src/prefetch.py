@@ -0,0 +1,60 @@
+# prefetch.py
+"""
+Bounded background prefetch of subject inputs.
+
+A loader thread reads (and, with preproc_cache.preload_subject, filters) the next
+subjects while the current one is analyzed, so EDF decoding overlaps with compute.
+At most `depth` loaded subjects wait in the queue; with the one being analyzed and the
+one being loaded, no more than depth + 2 recordings are in memory at once.
+"""
+from threading import Thread, Event
+import queue
+
+_DONE = object()
+
+def prefetch_depth(cfg):
+    """Subjects loaded ahead from `parallel.prefetch_depth` (0 disables prefetching)."""
+    params = getattr(cfg, "parallel", None)
+    depth = getattr(params, "prefetch_depth", 1) if params is not None else 1
+    return max(int(depth or 0), 0)
+
+def prefetched(load, items, depth=1):
+    """
+    Yield (item, loaded, error) for every item in order, with load(*item) running in a
+    background thread up to `depth` items ahead. A failed load yields its exception as
+    `error` (and loaded=None) instead of stopping the stream.
+    """
+    slots = queue.Queue(maxsize=max(depth, 1))
+    stop = Event()
+
+    def _put(entry):
+        # Block while the queue is full, but give up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                slots.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker():
+        for item in items:
+            try:
+                entry = (item, load(*item), None)
+            except Exception as e:
+                entry = (item, None, e)
+            if not _put(entry):
+                return
+        _put(_DONE)
+
+    thread = Thread(target=_worker, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = slots.get()
+            if entry is _DONE:
+                break
+            yield entry
+    finally:
+        stop.set()
+        thread.join()
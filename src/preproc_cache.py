@@ -0,0 +1,222 @@
+# preproc_cache.py
+"""
+Persistent cache of preprocessed EEG/EOG signals.
+
+Entries are .npy arrays (n_channels, n_times) in `memory.signal_dtype`, read back
+memory-mapped, keyed by the EDF content hash plus a hash of the `preprocess` config
+section, channel lists and signal dtype, so a hit gives exactly the signals of a miss.
+The cache directory is kept under `cache.max_gb` by evicting least recently used entries.
+"""
+from memory import check_fits, memory_settings, rows_within
+from preprocessing import apply_preprocessing
+from hashing import config_digest, file_digest
+from edf_reader import EdfReader, load_recording, read_edf_header
+from filtering import fused_filter, polyphase_resample, resampled_length
+from telemetry import count, timer
+from omegaconf import OmegaConf
+from datetime import datetime
+from logger import logger
+import numpy as np
+import shutil
+import json
+import os
+
+class CachedRecording:
+    """
+    Read-only preprocessed signals (a memory-mapped cache entry or an in-memory array)
+    with the subset of the mne Raw interface used by the pipeline: ch_names,
+    info["sfreq"], info["meas_date"], n_times, times, get_data().
+    """
+
+    def __init__(self, data, ch_names, sfreq, meas_date, dtype=np.float64):
+        self._data = data
+        self.ch_names = list(ch_names)
+        self.info = {"sfreq": sfreq, "meas_date": meas_date}
+        self.n_times = data.shape[1]
+        self.dtype = np.dtype(dtype)
+        self._index = {ch: i for i, ch in enumerate(self.ch_names)}
+
+    @property
+    def times(self):
+        return np.arange(self.n_times) / self.info["sfreq"]
+
+    def get_data(self, picks=None, start=0, stop=None, dtype=None):
+        if picks is None:
+            rows = list(range(len(self.ch_names)))
+        else:
+            if isinstance(picks, str):
+                picks = [picks]
+            missing = [ch for ch in picks if ch not in self._index]
+            if missing:
+                raise ValueError(f"Channels not in preprocessed cache: {missing}")
+            rows = [self._index[ch] for ch in picks]
+        return np.asarray(self._data[rows, start:stop], dtype=dtype or self.dtype)
+
+def _cache_settings(cfg):
+    params = getattr(cfg, "cache", None)
+    enabled = bool(getattr(params, "enabled", False)) if params is not None else False
+    cache_dir = getattr(params, "dir", "data/cache/preproc") if params is not None else "data/cache/preproc"
+    max_gb = float(getattr(params, "max_gb", 20)) if params is not None else 20.0
+    return enabled, cache_dir, int(max_gb * (1 << 30))
+
+def cache_key(edf_path, eeg_chs, eog_chs, cfg):
+    """EDF content hash + digest of everything that changes the filtered output (including its dtype)."""
+    preprocess = OmegaConf.to_container(cfg.preprocess, resolve=True)
+    preprocess.pop("output_dir", None)
+    dtype, _ = memory_settings(cfg)
+    settings = config_digest(preprocess, list(eeg_chs), list(eog_chs), dtype.name)
+    return f"{file_digest(edf_path)[:24]}-{settings}"
+
+def _entry_size(entry_dir):
+    return sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+
+def _evict(cache_dir, max_bytes, keep):
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        meta = os.path.join(entry_dir, "meta.json")
+        if not os.path.isfile(meta):
+            continue
+        entries.append((os.path.getmtime(meta), name, _entry_size(entry_dir)))
+
+    total = sum(size for _, _, size in entries)
+    for _, name, size in sorted(entries):  # least recently used first
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        total -= size
+        logger.info(f"Preproc cache: evicted {name} ({size / 1e6:.1f} MB)")
+
+def _check_target(pre, target):
+    # The resampling low-pass sits at the new Nyquist frequency: warn if it cuts into a modality's band
+    for name in ("eeg", "eog"):
+        band = getattr(pre, name, None)
+        if target and band is not None and getattr(pre, "enabled", False) and float(band.lp) >= target / 2.0:
+            logger.warning(f"preprocess.target_sfreq={target:g} Hz cuts the {name.upper()} band (lp={float(band.lp):g} Hz)")
+
+def _filtered_signals(edf_path, eeg_chs, eog_chs, cfg, dtype):
+    """
+    Filtered EEG/EOG (n_channels, n_times) as `dtype`, with (ch_names, sfreq, meas_date).
+    With the fused fft/iir backends, channel batches are decoded from the memory-mapped
+    EDF and filtered straight into the output, batch size bounded by the memory budget;
+    the mne backend (or reader) filters a whole MNE Raw in float64. With
+    preprocess.target_sfreq every modality is then polyphase-resampled to that rate,
+    so EEG and EOG (and recordings) with different native rates line up.
+    """
+    pre = cfg.preprocess
+    enabled = getattr(pre, "enabled", False)
+    backend = getattr(pre, "backend", "mne")
+    target = getattr(pre, "target_sfreq", None)
+    target = float(target) if target else None
+    _check_target(pre, target)
+    channels = list(eeg_chs) + list(eog_chs)
+    subject = os.path.basename(edf_path)
+    if getattr(cfg.data, "reader", "mmap") == "mne" or (enabled and backend == "mne"):
+        with timer("read", subject=subject):
+            raw = load_recording(edf_path, channels, cfg)
+        with timer("preprocess", subject=subject):
+            raw_proc = apply_preprocessing(raw, eeg_chs, eog_chs, cfg)
+        present = [ch for ch in channels if ch in raw_proc.ch_names]
+        sfreq = float(raw_proc.info["sfreq"])
+        data = raw_proc.get_data(picks=present)
+        if target:
+            data, sfreq = polyphase_resample(data, sfreq, target), target
+        return data.astype(dtype), present, sfreq, raw_proc.info["meas_date"]
+
+    labels = read_edf_header(edf_path)["labels"]
+    present = [ch for ch in channels if ch in labels]
+    if len(present) < len(channels):
+        logger.warning(f"{os.path.basename(edf_path)}: missing channels ignored {sorted(set(channels) - set(present))}")
+
+    # One reader per modality: each may have its own native rate when resampling to a target
+    groups = []
+    for names, band in ((eeg_chs, getattr(pre, "eeg", None)), (eog_chs, getattr(pre, "eog", None))):
+        names = [ch for ch in names if ch in present]
+        if names:
+            groups.append((names, band, EdfReader(edf_path, channels=names)))
+    if not groups:
+        raise ValueError(f"No EEG/EOG channel found in {os.path.basename(edf_path)}")
+    rates = {reader.sfreq for _, _, reader in groups}
+    if not target and len(rates) > 1:
+        raise ValueError(f"EEG and EOG sampling rates differ ({sorted(rates)} Hz); set preprocess.target_sfreq")
+    sfreq = target or rates.pop()
+    n_times = min(resampled_length(reader.n_times, reader.sfreq, sfreq) for _, _, reader in groups)
+
+    _, budget = memory_settings(cfg)
+    out = np.empty((len(present), n_times), dtype=dtype)
+    check_fits(budget, out.nbytes, f"Signals of {os.path.basename(edf_path)}")
+
+    line_hz = getattr(pre, "line_hz", None)
+    for names, band, reader in groups:
+        # float64 working set per filtered channel: decoded, padded, convolved and resampled copies
+        batch = rows_within(max(budget - out.nbytes, 1) if budget else 0, 8 * (4 * reader.n_times + n_times), len(names))
+        for b in range(0, len(names), batch):
+            picks = names[b:b + batch]
+            with timer("read", items=len(picks) * reader.n_times, subject=subject):
+                data = reader.get_data(picks)
+            with timer("preprocess", items=data.size, subject=subject):
+                if enabled:
+                    data = fused_filter(data, reader.sfreq, float(band.hp), float(band.lp), line_hz, method=backend)
+                data = polyphase_resample(data, reader.sfreq, sfreq)
+            out[[present.index(ch) for ch in picks]] = data[:, :n_times]
+    return out, present, float(sfreq), groups[0][2].info["meas_date"]
+
+def _open_entry(entry_dir, dtype):
+    with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    data = np.load(os.path.join(entry_dir, "signals.npy"), mmap_mode="r")
+    meas_date = datetime.fromisoformat(meta["meas_date"]) if meta["meas_date"] else None
+    return CachedRecording(data, meta["ch_names"], meta["sfreq"], meas_date, dtype=dtype)
+
+def load_preprocessed(edf_path, eeg_chs, eog_chs, cfg):
+    """
+    Preprocessed EEG/EOG signals for one recording. With cache.enabled the filtered
+    signals are computed once per (EDF content, preprocess config) and memory-mapped
+    on later calls; otherwise the recording is loaded and filtered in memory.
+    """
+    dtype, _ = memory_settings(cfg)
+    enabled, cache_dir, max_bytes = _cache_settings(cfg)
+    if not enabled:
+        data, present, sfreq, meas_date = _filtered_signals(edf_path, eeg_chs, eog_chs, cfg, dtype)
+        return CachedRecording(data, present, sfreq, meas_date, dtype=dtype)
+
+    key = cache_key(edf_path, eeg_chs, eog_chs, cfg)
+    entry_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_dir, "meta.json")
+    if os.path.isfile(meta_path):
+        os.utime(meta_path)  # mark as recently used
+        logger.info(f"Preproc cache hit for {os.path.basename(edf_path)}")
+        count("preproc_cache_hit", subject=os.path.basename(edf_path))
+        return _open_entry(entry_dir, dtype)
+
+    count("preproc_cache_miss", subject=os.path.basename(edf_path))
+    data, present, sfreq, meas_date = _filtered_signals(edf_path, eeg_chs, eog_chs, cfg, dtype)
+
+    # Write into a private directory, then rename: concurrent workers never see partial entries
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, "signals.npy"), data)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "edf": os.path.abspath(edf_path),
+            "ch_names": present,
+            "sfreq": sfreq,
+            "meas_date": meas_date.isoformat() if meas_date is not None else None,
+        }, f)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another worker stored the same entry first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info(f"Preproc cache: stored {os.path.basename(edf_path)} ({data.nbytes / 1e6:.1f} MB)")
+
+    _evict(cache_dir, max_bytes, keep=key)
+    return _open_entry(entry_dir, dtype)
+
+def preload_subject(edf_file, annot_file, config):
+    """Filtered EEG/EOG of one recording, as loaded by the per-subject scripts (for prefetching)."""
+    return load_preprocessed(os.path.join(config.data.data_dir, edf_file), config.data.eeg_channels,
+                             config.data.eog_channels, config)
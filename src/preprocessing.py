@@ -1,4 +1,5 @@
 # preprocessing.py
+from filtering import fused_filter
 import mne
 
 def _notch_filter(raw, picks, line_hz, harmonics=True):
@@ -52,12 +53,22 @@ def apply_preprocessing(raw_in, eeg_chs, eog_chs, cfg):
     eog_picks = mne.pick_channels(raw.ch_names, include=eog_chs)
 
     line_hz = getattr(cfg.preprocess, "line_hz", None)
-    _notch_filter(raw, eeg_picks, line_hz, harmonics=True)
-    _notch_filter(raw, eog_picks, line_hz, harmonics=True)
-
     eeg_hp = float(cfg.preprocess.eeg.hp); eeg_lp = float(cfg.preprocess.eeg.lp)
     eog_hp = float(cfg.preprocess.eog.hp); eog_lp = float(cfg.preprocess.eog.lp)
 
+    backend = getattr(cfg.preprocess, "backend", "mne")
+    if backend != "mne":
+        # Fused notch + band-pass, one pass per channel group with a memoized design
+        sfreq = float(raw.info["sfreq"])
+        for picks, hp, lp in ((eeg_picks, eeg_hp, eeg_lp), (eog_picks, eog_hp, eog_lp)):
+            if len(picks) > 0:
+                raw.apply_function(fused_filter, picks=picks, channel_wise=False,
+                                   sfreq=sfreq, hp=hp, lp=lp, line_hz=line_hz, method=backend)
+        return raw
+
+    _notch_filter(raw, eeg_picks, line_hz, harmonics=True)
+    _notch_filter(raw, eog_picks, line_hz, harmonics=True)
+
     if len(eeg_picks) > 0:
         raw.filter(l_freq=eeg_hp, h_freq=eeg_lp, picks=eeg_picks,
                    phase='zero', fir_design='firwin', verbose=False)
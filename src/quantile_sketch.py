@@ -0,0 +1,83 @@
+# quantile_sketch.py
+"""
+Mergeable fixed-range histogram sketch for quantiles of several columns at once.
+
+Each column gets n_bins equal bins over [lo, hi] plus an underflow and an overflow bin
+bounded by the running min/max, so values outside the range are still counted. Two
+sketches with the same range merge by adding their counts. Quantiles are interpolated
+inside the bin holding the requested rank, so the error is a fraction of one bin width
+for ranks inside [lo, hi]; the 0 and 1 quantiles are the exact min and max.
+"""
+import numpy as np
+
+class QuantileSketch:
+    """Histogram quantile sketch over k columns with per-column ranges lo/hi (k,)."""
+
+    def __init__(self, lo, hi, n_bins=65536):
+        self.lo = np.atleast_1d(np.asarray(lo, dtype=np.float64))
+        self.hi = np.atleast_1d(np.asarray(hi, dtype=np.float64))
+        if self.lo.shape != self.hi.shape or not (self.hi > self.lo).all():
+            raise ValueError("QuantileSketch needs hi > lo for every column")
+        self.n_bins = int(n_bins)
+        self.width = (self.hi - self.lo) / self.n_bins
+        k = len(self.lo)
+        self.counts = np.zeros((k, self.n_bins + 2), dtype=np.int64)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+
+    def update(self, values):
+        """Add a block of samples shaped (n, k); non-finite values are ignored."""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.lo))
+        finite = np.isfinite(values)
+        if not finite.any():
+            return self
+        idx = np.floor((values - self.lo) / self.width)
+        idx = np.clip(np.nan_to_num(idx), -1, self.n_bins).astype(np.int64) + 1
+        idx += np.arange(len(self.lo)) * (self.n_bins + 2)
+        self.counts += np.bincount(idx[finite], minlength=self.counts.size).reshape(self.counts.shape)
+        self.min = np.fmin(self.min, np.where(finite, values, np.inf).min(axis=0))
+        self.max = np.fmax(self.max, np.where(finite, values, -np.inf).max(axis=0))
+        return self
+
+    def merge(self, other):
+        if self.n_bins != other.n_bins or not (np.array_equal(self.lo, other.lo) and np.array_equal(self.hi, other.hi)):
+            raise ValueError("Only sketches with identical ranges can be merged")
+        self.counts += other.counts
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        return self
+
+    @property
+    def count(self):
+        return self.counts.sum(axis=1)
+
+    def quantiles(self, q):
+        """
+        Quantiles at fractions q (like np.percentile(x, 100 * q), linear interpolation),
+        shape (len(q), k); NaN for empty columns.
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        out = np.full((len(q), len(self.lo)), np.nan)
+        cum = np.cumsum(self.counts, axis=1)
+        steps = np.arange(self.n_bins)
+        for c in range(len(self.lo)):
+            n = cum[c, -1]
+            if n == 0:
+                continue
+            # Bin edges: [min, lo), equal bins over [lo, hi), [hi, max]
+            left = np.concatenate([[self.min[c]], self.lo[c] + steps * self.width[c], [self.hi[c]]])
+            width = np.concatenate([[self.lo[c] - self.min[c]], np.full(self.n_bins, self.width[c]), [self.max[c] - self.hi[c]]])
+
+            # Order statistics either side of the rank; samples of a bin are taken as evenly spread
+            # over it, except the smallest and largest, which are the tracked min and max
+            rank = q * (n - 1)
+            lower = np.floor(rank)
+            stats = []
+            for j in (lower, np.minimum(lower + 1, n - 1)):
+                b = np.searchsorted(cum[c], j, side="right")
+                before = cum[c, b] - self.counts[c, b]
+                stat = left[b] + (j - before + 0.5) / self.counts[c, b] * width[b]
+                stats.append(np.where(j == 0, self.min[c], np.where(j == n - 1, self.max[c], stat)))
+            value = stats[0] + (rank - lower) * (stats[1] - stats[0])
+            out[:, c] = np.clip(value, self.min[c], self.max[c])
+        return out
@@ -0,0 +1,121 @@
+# result_store.py
+"""
+Partitioned Parquet result store.
+
+Per-subject outputs are buffered in memory and written once, as one Parquet file per
+(subject, stage) in a hive-partitioned dataset:
+
+    <root>/<dataset>/subject=<subject>/stage=<stage>/part-0.parquet
+
+Value columns are stored as float32 unless given another dtype. Readers select
+columns and filter on subject/stage partitions without opening the other files.
+"""
+from telemetry import timer
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import numpy as np
+import shutil
+import os
+
+PART_FILE = "part-0.parquet"
+PARTITIONING = ds.partitioning(pa.schema([("subject", pa.string()), ("stage", pa.string())]), flavor="hive")
+
+def dataset_path(root, dataset):
+    return os.path.join(root, dataset)
+
+def partition_file(dataset, subject, stage):
+    """Path of one (subject, stage) file relative to the store root."""
+    return os.path.join(dataset, f"subject={subject}", f"stage={stage}", PART_FILE)
+
+class SubjectWriter:
+    """
+    Buffer of one subject's per-stage tables. flush() replaces everything previously
+    stored for the subject in a single step, so a rerun never leaves stale stages.
+    """
+
+    def __init__(self, root, dataset, subject):
+        self.root = root
+        self.dataset = dataset
+        self.subject = subject
+        self._tables = {}
+
+    def add(self, stage, columns, dtype=np.float32, dtypes=None):
+        """
+        Add a stage table; `columns` maps name -> 1-D array. Floating columns are cast
+        to `dtype` unless `dtypes` names another one for them (e.g. float64 time axes).
+        """
+        dtypes = dtypes or {}
+        arrays = {}
+        for name, values in columns.items():
+            values = np.asarray(values)
+            if np.issubdtype(values.dtype, np.floating):
+                values = values.astype(dtypes.get(name, dtype), copy=False)
+            arrays[name] = pa.array(values)
+        self._tables[stage] = pa.table(arrays)
+
+    def flush(self):
+        """Write the buffered stages; returns their paths relative to root."""
+        base = dataset_path(self.root, self.dataset)
+        final_dir = os.path.join(base, f"subject={self.subject}")
+        # Underscore-prefixed directories are ignored by dataset discovery
+        tmp_dir = os.path.join(base, f"_tmp-{self.subject}-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        written = []
+        rows = sum(table.num_rows for table in self._tables.values())
+        with timer("write", items=rows, subject=self.subject, dataset=self.dataset):
+            for stage, table in self._tables.items():
+                stage_dir = os.path.join(tmp_dir, f"stage={stage}")
+                os.makedirs(stage_dir, exist_ok=True)
+                pq.write_table(table, os.path.join(stage_dir, PART_FILE))
+                written.append(partition_file(self.dataset, self.subject, stage))
+
+            shutil.rmtree(final_dir, ignore_errors=True)
+            if written:
+                os.rename(tmp_dir, final_dir)
+        self._tables.clear()
+        return written
+
+def read_results(root, dataset, columns=None, subjects=None, stages=None):
+    """
+    DataFrame of a result dataset with `subject` and `stage` columns, restricted to
+    the requested value columns and partitions. Empty if nothing is stored yet.
+    """
+    base = dataset_path(root, dataset)
+    if not os.path.isdir(base):
+        return pd.DataFrame(columns=list(columns or []) + ["subject", "stage"])
+
+    dataset_obj = ds.dataset(base, format="parquet", partitioning=PARTITIONING)
+    flt = None
+    if subjects is not None:
+        flt = ds.field("subject").isin(list(subjects))
+    if stages is not None:
+        stage_flt = ds.field("stage").isin(list(stages))
+        flt = stage_flt if flt is None else flt & stage_flt
+    read_cols = None if columns is None else list(columns) + ["subject", "stage"]
+
+    df = dataset_obj.to_table(columns=read_cols, filter=flt).to_pandas()
+    for key in ("subject", "stage"):
+        df[key] = df[key].astype(str)
+    return df
+
+def list_partitions(root, dataset):
+    """Sorted (subject, stage, path relative to root) of every stored partition file."""
+    base = dataset_path(root, dataset)
+    if not os.path.isdir(base):
+        return []
+    partitions = []
+    for subject_dir in sorted(os.listdir(base)):
+        if not subject_dir.startswith("subject="):
+            continue
+        for stage_dir in sorted(os.listdir(os.path.join(base, subject_dir))):
+            if stage_dir.startswith("stage=") and os.path.isfile(os.path.join(base, subject_dir, stage_dir, PART_FILE)):
+                partitions.append((subject_dir[len("subject="):], stage_dir[len("stage="):],
+                                   os.path.join(dataset, subject_dir, stage_dir, PART_FILE)))
+    return partitions
+
+def read_partition(root, path, columns=None):
+    """DataFrame of the value columns of one partition file (path relative to root)."""
+    return pq.read_table(os.path.join(root, path), columns=columns).to_pandas()
@@ -1,15 +1,23 @@
 # static_cca.py
-from preprocessing import apply_preprocessing
-from sklearn.cross_decomposition import CCA
-from datetime import datetime, timedelta
+from preproc_cache import load_preprocessed, preload_subject
+from cca_engine import MomentAccumulator, cca_settings, covariance_blocks, fit_cca
+from quantile_sketch import QuantileSketch
+from filtering import StreamDecimator
+from annotations import hypnogram_epochs, load_hypnogram
 from config_loader import load_config
 from collections import Counter
-from logger import logger
+from manifest import build_manifest, planned_subjects
+from result_store import SubjectWriter, partition_file
+from ledger import open_ledger, pending_subjects
+from parallel import map_subjects
+from memory import memory_settings, rows_within
+from telemetry import memory_snapshot, timer
+from functools import partial
+from logger import RepeatedLog, logger
 import pandas as pd
+import logging
 import numpy as np
-import mne
 import os
-import gc
 
 # Parameters
 config = load_config()
@@ -20,182 +28,271 @@ EEG_CHANNELS = config.data.eeg_channels # ['C3_M2', 'C4_M1', 'O1_M2', 'O2_M1']
 EOG_CHANNELS = config.data.eog_channels # ['LOC', 'ROC']
 SLEEP_STAGES = config.data.sleep_stages # ['W', 'N1', 'N2', 'N3', 'R']
 DOWNSAMPLING_FACTOR = config.static_cca_params.downsampling_factor # 1
-fmt = "%H:%M:%S"
-
-if not os.path.exists(OUTPUT_FOLDER):
-    os.makedirs(OUTPUT_FOLDER)
-
-# Initialize results list
-summary_results = []
-
-# Iterate through .edf/.annot files
-file_pairs = [(f, f.replace(".edf", ".annot")) for f in os.listdir(DATA_FOLDER) if f.endswith(".edf")]
-
-for edf_file, annot_file in file_pairs:
+N_COMPONENTS, RIDGE, CCA_DTYPE = cca_settings(config) # 2, 0.0, float64
+STREAMING = getattr(config.static_cca_params, "streaming", False) # True
+CHUNK_SECONDS = getattr(config.static_cca_params, "chunk_seconds", 300) # seconds per streamed block
+HYPNOGRAM_CACHE = getattr(config.data, "hypnogram_cache", True) # .npy hypnogram next to the annotations
+SKETCH_BINS = getattr(config.static_cca_params, "sketch_bins", 65536) # histogram bins of the projection quantile sketches
+SKETCH_RANGE = 8.0 # sketch bins span +-8 projection std; values beyond land in the min/max tail bins
+SIGNAL_DTYPE, MEMORY_BUDGET = memory_settings(config) # float32, bytes per worker (0 = unlimited)
+
+PARTS_FOLDER = os.path.join(OUTPUT_FOLDER, "summary_parts")
+PROJECTIONS = "projections" # result-store dataset of downsampled canonical projections
+EPOCH_ERRORS = RepeatedLog(logger) # unreadable chunks, summarized per stage of the current subject
+EPOCH_WARNINGS = RepeatedLog(logger, logging.WARNING) # epochs outside the recording, per subject and stage
+
+if not os.path.exists(PARTS_FOLDER):
+    os.makedirs(PARTS_FOLDER)
+
+# Completion ledger: subjects whose inputs and CCA-relevant config are unchanged are skipped
+LEDGER = open_ledger(config, OUTPUT_FOLDER, ["data", "preprocess", "cca_params", "static_cca_params"])
+
+def _iter_epoch_chunks(raw_proc, epoch_ranges, chunk_samples):
+    """
+    Yield (stage, start, X, Y) sample blocks, shaped (n_samples, n_channels), for a list
+    of (stage, start_sample, stop_sample) epochs; start is the first sample of the block.
+    chunk_samples=None yields whole epochs.
+    """
+    for stage, start_sample, stop_sample in epoch_ranges:
+        step = chunk_samples or (stop_sample - start_sample)
+        for s in range(start_sample, stop_sample, step):
+            e = min(s + step, stop_sample)
+            try:
+                eeg = raw_proc.get_data(picks=EEG_CHANNELS, start=s, stop=e)
+                eog = raw_proc.get_data(picks=EOG_CHANNELS, start=s, stop=e)
+            except Exception as err:
+                EPOCH_ERRORS.add(stage, "Failed to extract data: stage=%s, start=%d, stop=%d, error: %s",
+                                  stage, s, e, err)
+                continue
+            yield stage, s, eeg.T, eog.T
+
+def _project_stage(blocks, cca, mean_x, mean_y, Cxx, Cyy, n_samples, factor):
+    """
+    One fused pass over a stage: each (start, X, Y) block is projected with the fitted weights
+    and folded into running moments and quantile sketches of the canonical variates.
+    Only the anti-aliased, decimated projections are kept; returns (moments, sketch, projections).
+    The stage's epochs are not contiguous in time, so decimation restarts wherever a block
+    does not begin where the previous one ended: the low-pass never runs across a gap, and
+    the ends of each run, where the kernel would reach past it, have no decimated samples.
+    """
+    x_weights, y_weights = cca["x_weights"], cca["y_weights"]
+    k = x_weights.shape[1]
+
+    # Sketch range around the (zero) projection mean, from the exact variances w'Cw
+    sd = np.sqrt(np.concatenate([np.einsum("pk,pq,qk->k", x_weights, Cxx, x_weights),
+                                 np.einsum("pk,pq,qk->k", y_weights, Cyy, y_weights)]))
+    sd = np.where(sd > 0, sd, 1.0)
+    sketch = QuantileSketch(-SKETCH_RANGE * sd, SKETCH_RANGE * sd, SKETCH_BINS)
+    moments = MomentAccumulator(k, k)
+
+    # Low-pass and keep every factor-th sample of each contiguous run, continued across its blocks
+    factor = factor if n_samples > factor else 1
+    decimator, end = None, None
+    kept = [np.zeros((0, 2 * k))]
+    for start, X, Y in blocks:
+        x_c = (X - mean_x).astype(CCA_DTYPE) @ x_weights
+        y_c = (Y - mean_y).astype(CCA_DTYPE) @ y_weights
+        moments.update(x_c, y_c)
+        Z = np.hstack([x_c, y_c])
+        sketch.update(Z)
+        if start != end:
+            decimator = StreamDecimator(factor)
+        kept.append(decimator.update(Z))
+        end = start + len(Z)
+    return moments, sketch, np.vstack(kept)
+
+def _summarize(edf_file, stage, correlations, moments, sketch):
+    # Summary statistics of the full-resolution canonical variates (population std, like np.std)
+    summary = {
+        "subject": edf_file,
+        "stage": stage,
+    }
+    for k, corr in enumerate(correlations):
+        summary[f"cca_corr{k+1}"] = corr
+
+    means = moments.mean
+    stds = np.sqrt(np.maximum(np.diag(moments.M2) / moments.n, 0.0))
+    q25, median, q75 = sketch.quantiles([0.25, 0.5, 0.75])
+    k = moments.p
+    for idx, name in enumerate([f"Xc{i+1}" for i in range(k)] + [f"Yc{i+1}" for i in range(k)]):
+        summary[f"{name}_mean"] = means[idx]
+        summary[f"{name}_std"] = stds[idx]
+        summary[f"{name}_25p"] = q25[idx]
+        summary[f"{name}_median"] = median[idx]
+        summary[f"{name}_75p"] = q75[idx]
+
+    return summary
+
+def process_subject(edf_file, annot_file, raw_proc=None):
+    """
+    Load, preprocess and run static CCA for one recording. Returns (summary rows, complete);
+    complete is False when any scored stage or the projection write failed.
+    """
+    summary_results = []
+    complete = False
     edf_path = os.path.join(DATA_FOLDER, edf_file)
     annot_path = os.path.join(DATA_FOLDER, annot_file)
 
     if not os.path.exists(annot_path):
-        continue
+        return summary_results, complete
 
     try:
-        raw = mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
-        sfreq = int(raw.info['sfreq'])
-        start_datetime = raw.info['meas_date'].replace(tzinfo=None)
-        #logger.info(f"EDF {edf_path} Start:", start_datetime)
-
-        try:
-            # Optional preprocessing (EEG/EOG only)
-            raw_proc = apply_preprocessing(raw, EEG_CHANNELS, EOG_CHANNELS, config)
-        except Exception as e:
-            logger.error(f"Failed to preprocess data for subject {edf_file} , error: {e}") 
-
-        # Read annotations
-        with open(annot_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()[1:]
-        annotations = []
-        starts = []
-        for line in lines:
-            parts = line.strip().split("\t")
-            if len(parts) == 6:
-                stage, _, _, start, stop, _ = parts
-                annotations.append((stage, start, stop))
-
-        parsed_epochs = []
-        for stage, start_str, stop_str in annotations:
-            if stage in SLEEP_STAGES:
-                try:
-                    start_clock = datetime.strptime(start_str, fmt).time()
-                    stop_clock = datetime.strptime(stop_str, fmt).time()
-
-                    start_time = datetime.combine(start_datetime.date(), start_clock)
-                    stop_time = datetime.combine(start_datetime.date(), stop_clock)
-
-                    # Handle midnight crossing
-                    if stop_time < start_time:
-                        stop_time += timedelta(days=1)
-                    if start_time < start_datetime:
-                        start_time += timedelta(days=1)
-                        stop_time += timedelta(days=1)
-
-                    start_sec = (start_time - start_datetime).total_seconds()
-                    stop_sec = (stop_time - start_datetime).total_seconds()
-
-                    parsed_epochs.append((stage, start_sec, stop_sec))
-                except Exception as e:
-                    logger.error(f"Annotation parse error: {e}")
-
-
-        logger.info('Epochs parsed: ', parsed_epochs[:5])
-        stage_counts = Counter([stage for stage, _, _ in parsed_epochs])
+        # Filtered EEG/EOG (decoded channel-selectively, served from the preproc cache when enabled)
+        if raw_proc is None:
+            raw_proc = load_preprocessed(edf_path, EEG_CHANNELS, EOG_CHANNELS, config)
+        sfreq = int(raw_proc.info['sfreq'])
+        hypnogram = load_hypnogram(annot_path, raw_proc.info['meas_date'], sfreq, SLEEP_STAGES, HYPNOGRAM_CACHE)
+        logger.info('Epochs parsed: ', hypnogram_epochs(hypnogram[:5], SLEEP_STAGES, sfreq))
+        stage_counts = Counter(SLEEP_STAGES[c] for c in hypnogram["stage"].tolist())
         logger.info(f'Stage count for subject {edf_file}: {stage_counts}')
 
-        # Organize EEG and EOG segments
-        eeg_data = {stage: [] for stage in SLEEP_STAGES}
-        eog_data = {stage: [] for stage in SLEEP_STAGES}
-        for stage, start, stop in parsed_epochs:
-            start_sample = round(start * sfreq)
-            stop_sample = min(round(stop * sfreq), raw_proc.n_times)
+        # Valid sample ranges, in recording order
+        epoch_ranges = []
+        for code, start_sample, stop_sample in hypnogram.tolist():
+            stage = SLEEP_STAGES[code]
+            stop_sample = min(stop_sample, raw_proc.n_times)
 
             if start_sample < 0 or start_sample >= stop_sample:
-                logger.warning(f"Invalid sample range for stage {stage}: start={start_sample}, stop={stop_sample}, total={raw_proc.n_times}")
-                continue   
-
-            try:
-                eeg = raw_proc.get_data(picks=EEG_CHANNELS, start=start_sample, stop=stop_sample)
-                eog = raw_proc.get_data(picks=EOG_CHANNELS, start=start_sample, stop=stop_sample)
-                eeg_data[stage].append(eeg)
-                eog_data[stage].append(eog)
-            except Exception as e:
-                logger.error(f"Failed to extract data: stage={stage}, start={start_sample}, stop={stop_sample}, error: {e}")
+                EPOCH_WARNINGS.add((edf_file, stage), "Invalid sample range for stage %s: start=%d, stop=%d, total=%d",
+                                   stage, start_sample, stop_sample, raw_proc.n_times)
                 continue
+            epoch_ranges.append((stage, start_sample, stop_sample))
 
         # Set a downsampling factor
         target_fs = DOWNSAMPLING_FACTOR
         factor = int(sfreq / target_fs)
 
-        # Perform CCA
+        # Block size of the projection pass within the memory budget (signal block, float64
+        # centered copy and projections); stages held in memory only if they fit as well
+        n_channels = len(EEG_CHANNELS) + len(EOG_CHANNELS)
+        chunk_samples = rows_within(MEMORY_BUDGET, 8 * (2 * n_channels + 6 * N_COMPONENTS), max(int(CHUNK_SECONDS * sfreq), 1))
+        stage_bytes = 2 * SIGNAL_DTYPE.itemsize * n_channels * sum(stop - start for _, start, stop in epoch_ranges)
+        streaming = STREAMING or bool(MEMORY_BUDGET and stage_bytes > MEMORY_BUDGET)
+        if streaming and not STREAMING:
+            logger.info(f"{edf_file}: stage buffers ({stage_bytes / 1e6:.0f} MB) exceed the memory budget, streaming instead")
+
+        if streaming:
+            # Pass 1: running moments per stage, walking the epochs in recording order
+            accumulators = {stage: MomentAccumulator(len(EEG_CHANNELS), len(EOG_CHANNELS)) for stage in SLEEP_STAGES}
+            n_scored = sum(stop - start for _, start, stop in epoch_ranges)
+            with timer("static_cca.moments", items=n_scored, subject=edf_file):
+                for stage, _, X, Y in _iter_epoch_chunks(raw_proc, epoch_ranges, chunk_samples):
+                    accumulators[stage].update(X, Y)
+        else:
+            # Collect every epoch of a stage in memory, with its first sample
+            eeg_data = {stage: [] for stage in SLEEP_STAGES}
+            eog_data = {stage: [] for stage in SLEEP_STAGES}
+            epoch_starts = {stage: [] for stage in SLEEP_STAGES}
+            for stage, start, X, Y in _iter_epoch_chunks(raw_proc, epoch_ranges, None):
+                eeg_data[stage].append(X)
+                eog_data[stage].append(Y)
+                epoch_starts[stage].append(start)
+
+        # Perform CCA; downsampled projections are buffered per stage
+        projections = SubjectWriter(OUTPUT_FOLDER, PROJECTIONS, edf_file.replace('.edf', ''))
+        failed_stages = []
         for stage in SLEEP_STAGES:
-            if not eeg_data[stage] or not eog_data[stage]:
+            stage_epochs = [r for r in epoch_ranges if r[0] == stage]
+            if not stage_epochs:
                 logger.info(f"Skipping stage {stage}: no data available.")
                 continue
-            eeg_agg = np.hstack(eeg_data[stage])
-            eog_agg = np.hstack(eog_data[stage])
 
             try:
-                # Transpose to (n_samples, n_features)
-                X = eeg_agg.T
-                Y = eog_agg.T
-
-                # Ensure same number of samples
-                min_len = min(len(X), len(Y))
-                X = X[:min_len]
-                Y = Y[:min_len]
-
-                cca = CCA(n_components=2)
-                X_c, Y_c = cca.fit_transform(X, Y)
-
-                # Save downsampled projections
-                if len(X_c) > factor:
-                    X_c_ds = X_c[::factor, :]
-                    Y_c_ds = Y_c[::factor, :]
-                else:
-                    X_c_ds = X_c
-                    Y_c_ds = Y_c
-
-                file_prefix = f"{edf_file.replace('.edf','')}_{stage}"
-
-                pd.DataFrame(X_c_ds, columns=["Xc_1", "Xc_2"]).to_csv(
-                    os.path.join(OUTPUT_FOLDER, f"{file_prefix}_Xc_downsampled.csv"), index=False
-                )
-                pd.DataFrame(Y_c_ds, columns=["Yc_1", "Yc_2"]).to_csv(
-                    os.path.join(OUTPUT_FOLDER, f"{file_prefix}_Yc_downsampled.csv"), index=False
-                )
-
-                # Compute canonical correlation coefficients
-                corr1 = np.corrcoef(X_c[:, 0], Y_c[:, 0])[0, 1]
-                corr2 = np.corrcoef(X_c[:, 1], Y_c[:, 1])[0, 1]
-                
-                # Compute summary statistics
-                summary = {
-                    "subject": edf_file,
-                    "stage": stage,
-                    "cca_corr1": corr1,
-                    "cca_corr2": corr2
-                }
-
-                for idx in range(X_c.shape[1]):
-                    x_vals = X_c[:, idx]
-                    summary[f"Xc{idx+1}_mean"] = np.mean(x_vals)
-                    summary[f"Xc{idx+1}_std"] = np.std(x_vals)
-                    summary[f"Xc{idx+1}_25p"] = np.percentile(x_vals, 25)
-                    summary[f"Xc{idx+1}_median"] = np.median(x_vals)
-                    summary[f"Xc{idx+1}_75p"] = np.percentile(x_vals, 75)
-
-                for idx in range(Y_c.shape[1]):
-                    y_vals = Y_c[:, idx]
-                    summary[f"Yc{idx+1}_mean"] = np.mean(y_vals)
-                    summary[f"Yc{idx+1}_std"] = np.std(y_vals)
-                    summary[f"Yc{idx+1}_25p"] = np.percentile(y_vals, 25)
-                    summary[f"Yc{idx+1}_median"] = np.median(y_vals)
-                    summary[f"Yc{idx+1}_75p"] = np.percentile(y_vals, 75)
-
-                summary_results.append(summary)
-                logger.info(f'Summary resulst for edf {edf_file} for stage {stage} written')
+                with timer("static_cca.cca", subject=edf_file, sleep_stage=stage) as timing:
+                    if streaming:
+                        n_samples = accumulators[stage].n
+                        mean_x, mean_y, Cxx, Cyy, Cxy = accumulators[stage].covariance_blocks()
+                        # Pass 2 re-reads the stage chunk by chunk
+                        blocks = ((start, X, Y) for _, start, X, Y in _iter_epoch_chunks(raw_proc, stage_epochs, chunk_samples))
+                    else:
+                        X = np.vstack(eeg_data[stage])
+                        Y = np.vstack(eog_data[stage])
+                        n_samples = len(X)
+                        mean_x, mean_y, Cxx, Cyy, Cxy = covariance_blocks(X, Y, chunk=chunk_samples)
+                        # Blocks never span two epochs, so each keeps its position in the recording
+                        blocks = ((start + s, Xe[s:s + chunk_samples], Ye[s:s + chunk_samples])
+                                  for start, Xe, Ye in zip(epoch_starts[stage], eeg_data[stage], eog_data[stage])
+                                  for s in range(0, len(Xe), chunk_samples))
+
+                    cca = fit_cca(Cxx, Cyy, Cxy, n_components=N_COMPONENTS, ridge=RIDGE, dtype=CCA_DTYPE)
+                    if np.isnan(cca["correlations"]).any():
+                        raise ValueError("degenerate covariance (flat channel)")
+
+                    # Moments, quantiles and downsampled projections in one pass
+                    moments, sketch, proj_ds = _project_stage(blocks, cca, mean_x, mean_y, Cxx, Cyy, n_samples, factor)
+
+                    k = N_COMPONENTS
+                    columns = {f"Xc_{i+1}": proj_ds[:, i] for i in range(k)}
+                    columns.update({f"Yc_{i+1}": proj_ds[:, k + i] for i in range(k)})
+                    projections.add(stage, columns)
+
+                    summary_results.append(_summarize(edf_file, stage, cca["correlations"], moments, sketch))
+                    timing["items"] = n_samples
+                    logger.info(f'Summary resulst for edf {edf_file} for stage {stage} written')
 
             except Exception as e:
                 logger.error(f"CCA failed for {edf_file}, stage {stage}: {e}")
+                failed_stages.append(stage)
+
+        # All stages of the subject written at once
+        projections.flush()
+        complete = not failed_stages
+        memory_snapshot("static_cca.subject", subject=edf_file)
     except Exception as e:
         logger.error(f"Failed on {edf_file}: {e}")
-    #
-        raw_proc._data = None  # Detach memory-mapped data if present
-        raw_proc.annotations.delete(0, len(raw_proc.annotations))  # Clear MNE annotations    
-        del raw_proc, eeg_data, eog_data
-        gc.collect() # Clean up memory
-
-# Save results
-results_df = pd.DataFrame(summary_results)
-results_csv_path = os.path.join(OUTPUT_FOLDER, "eeg_eog_cca_summary_stats.csv")
-results_df.to_csv(results_csv_path, index=False)
-
-logger.info(f'The summary statistics saved to {results_csv_path}')
+    finally:
+        EPOCH_WARNINGS.flush()
+        EPOCH_ERRORS.flush()
+
+    return summary_results, complete
+
+def _summary_part_path(edf_file):
+    # Per-subject checkpoint of the summary rows, merged into the cohort CSV by main()
+    return os.path.join(PARTS_FOLDER, f"{edf_file.replace('.edf', '')}_summary.csv")
+
+def _checkpoint(file_pair, result):
+    """Persist one finished subject: its summary rows, then (only if every stage succeeded) its ledger entry."""
+    edf_file, annot_file = file_pair
+    rows, complete = result
+    if not rows:
+        return  # nothing usable: retried on the next run
+    part_path = _summary_part_path(edf_file)
+    pd.DataFrame(rows).to_csv(part_path, index=False)
+    if not complete:
+        logger.warning(f"{edf_file} is incomplete; it is not recorded in the ledger and will be retried")
+    elif LEDGER is not None:
+        prefix = edf_file.replace('.edf', '')
+        outputs = [os.path.relpath(part_path, OUTPUT_FOLDER)]
+        outputs += [partition_file(PROJECTIONS, prefix, row["stage"]) for row in rows]
+        LEDGER.record(os.path.join(DATA_FOLDER, edf_file), os.path.join(DATA_FOLDER, annot_file), outputs)
+
+def main():
+    # Plan from the cohort manifest (EDF headers + annotations only); unusable recordings are skipped up front
+    file_pairs, costs = planned_subjects(build_manifest(config))
+    todo, todo_costs = pending_subjects(LEDGER, file_pairs, DATA_FOLDER, costs)
+
+    # One process per subject; each finished subject is checkpointed immediately
+    map_subjects(process_subject, todo, config, costs=todo_costs, on_result=_checkpoint,
+                 preload=partial(preload_subject, config=config))
+
+    # Merge the per-subject checkpoints of the whole cohort, in file order
+    parts = [_summary_part_path(edf_file) for edf_file, _ in file_pairs]
+    parts = [pd.read_csv(p, float_precision="round_trip") for p in parts if os.path.exists(p)]
+    results_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    # Save results; an unchanged summary is not rewritten, so downstream stages see it as up to date
+    results_csv_path = os.path.join(OUTPUT_FOLDER, "eeg_eog_cca_summary_stats.csv")
+    csv_text = results_df.to_csv(index=False)
+    previous = None
+    if os.path.exists(results_csv_path):
+        with open(results_csv_path, "r", encoding="utf-8") as f:
+            previous = f.read()
+    if previous != csv_text:
+        with open(results_csv_path, "w", encoding="utf-8") as f:
+            f.write(csv_text)
+
+    logger.info(f'The summary statistics saved to {results_csv_path}')
+    return {"static_summary": results_df}
+
+if __name__ == "__main__":
+    main()
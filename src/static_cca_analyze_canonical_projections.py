@@ -1,168 +1,95 @@
 # static_cca_analyze_canonical_projections.py
-from scipy.stats import skew, kurtosis, f_oneway
+from result_store import list_partitions, read_partition
+from group_stats import MomentStats, one_way_anova
 from config_loader import load_config
-import matplotlib.pyplot as plt
 from logger import logger
-import seaborn as sns
 import pandas as pd
 import numpy as np
-import glob
 import os
 
-# TODO: plot are not necessary - remove
-
-# Parameters
-config = load_config()
-
-OUTPUT_FOLDER = config.static_cca_params.output_dir # "data/static_cca"
-RESULTS_FOLDER = config.static_cca_params.results_dir # "data/static_cca_analysis"
-FIGURES_FOLDER = os.path.join(RESULTS_FOLDER, "figures")
-
-if not os.path.exists(FIGURES_FOLDER):
-    os.makedirs(FIGURES_FOLDER)
-
-if not os.path.exists(RESULTS_FOLDER):
-    os.makedirs(RESULTS_FOLDER)
-
-# File patterns
-pattern_Xc = os.path.join(OUTPUT_FOLDER, "*_Xc_downsampled.csv")
-pattern_Yc = os.path.join(OUTPUT_FOLDER, "*_Yc_downsampled.csv")
-
-# Projection loader
-def load_projection_files(pattern, prefix):
-    rows = []
-    for filepath in glob.glob(pattern):
-        filename = os.path.basename(filepath)
-        
-        name_parts = filename.replace("_Xc_downsampled.csv", "") \
-                             .replace("_Yc_downsampled.csv", "").split("_")
-        
-        if len(name_parts) != 2:
-            logger.warning(f"Skipping unexpected filename: {filename}")
-            continue
-        
-        subject, stage = name_parts
-
-        df = pd.read_csv(filepath)
-
-        # Unpivoting the dataframe
-        df_long = df.melt(var_name="projection", value_name="value")
-        df_long["subject"] = subject
-        df_long["stage"] = stage
-        df_long["type"] = prefix
-
-        rows.append(df_long)
-
-    if rows:
-        return pd.concat(rows, ignore_index=True)
-    else:
-        return pd.DataFrame(columns=["subject", "stage", "projection", "value", "type"])
-
-# Load all downsampled files
-df_Xc = load_projection_files(pattern_Xc, "Xc")
-df_Yc = load_projection_files(pattern_Yc, "Yc")
-
-all_data = pd.concat([df_Xc, df_Yc], ignore_index=True)
-logger.info(f"Loaded downsampled projections: {all_data.shape}")
-
-if all_data.empty:
-    logger.warning("No data loaded! Check file paths and patterns.")
-    exit()
-
-# Save combined file
-#all_data.to_csv(os.path.join(OUTPUT_FOLDER, "all_downsampled_projections.csv"), index=False)
-#logger.info("Saved combined downsampled data.")
-
-# Compute summary statistics by stage and projection
-summary_rows = []
-for proj_type in ["Xc", "Yc"]:
-    for comp in ["1", "2"]:
-        projection_name = f"{proj_type}_{comp}"
-        df_proj = all_data[
-            (all_data["type"] == proj_type) &
-            (all_data["projection"] == projection_name)
-        ]
-        if df_proj.empty:
-            continue
-
-        grouped = df_proj.groupby("stage")["value"]
-        for stage, vals in grouped:
+MOMENT_FIELDS = ["n", "mean", "M2", "M3", "M4"]
+
+# Per-file moments of every projection column; files unchanged since the cached row are not re-read
+def file_moments(root, partitions, cache_path):
+    cached = {}
+    if os.path.exists(cache_path):
+        cache_df = pd.read_csv(cache_path, float_precision="round_trip")
+        for path, rows in cache_df.groupby("path", sort=False):
+            cached[path] = rows
+
+    frames = []
+    for subject, stage, path in partitions:
+        st = os.stat(os.path.join(root, path))
+        rows = cached.get(path)
+        if rows is None or rows["size"].iloc[0] != st.st_size or rows["mtime_ns"].iloc[0] != st.st_mtime_ns:
+            df = read_partition(root, path)
+            value_cols = [c for c in df.columns if c.startswith(("Xc_", "Yc_"))]
+            m = MomentStats.from_values(df[value_cols].to_numpy(dtype=np.float64))
+            rows = pd.DataFrame({"subject": subject, "stage": stage, "path": path,
+                                 "size": st.st_size, "mtime_ns": st.st_mtime_ns, "projection": value_cols,
+                                 **{field: getattr(m, field) for field in MOMENT_FIELDS}})
+        frames.append(rows)
+
+    moments = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["subject", "stage", "path", "size", "mtime_ns", "projection"] + MOMENT_FIELDS)
+    moments.to_csv(cache_path, index=False)
+    return moments
+
+def main():
+    """Per-stage distribution statistics and ANOVA of the canonical projections."""
+    # Parameters
+    config = load_config()
+
+    OUTPUT_FOLDER = config.static_cca_params.output_dir # "data/static_cca"
+    RESULTS_FOLDER = config.static_cca_params.results_dir # "data/static_cca_analysis"
+
+    if not os.path.exists(RESULTS_FOLDER):
+        os.makedirs(RESULTS_FOLDER)
+
+    # One partial aggregate per projection file; cost scales with the number of files
+    partitions = list_partitions(OUTPUT_FOLDER, "projections")
+    moments = file_moments(OUTPUT_FOLDER, partitions, os.path.join(RESULTS_FOLDER, "projection_moments.csv"))
+    logger.info(f"Projection moments of {len(partitions)} files loaded")
+
+    if moments.empty:
+        logger.warning("No data loaded! Check file paths and patterns.")
+        return {}
+
+    # Merge the file aggregates per projection and stage
+    merged = {}
+    for (projection, stage), rows in moments.groupby(["projection", "stage"], sort=True):
+        m = MomentStats()
+        for row in rows[MOMENT_FIELDS].itertuples(index=False):
+            m.merge(MomentStats(*row))
+        merged[(projection, stage)] = m
+
+    # Compute summary statistics by stage and projection (every stored component: Xc_1, ..., Yc_k)
+    projection_names = sorted(moments["projection"].unique(), key=lambda c: (c.split("_")[0], int(c.split("_")[1])))
+    summary_rows = []
+    for projection_name in projection_names:
+        groups = {stage: m for (proj, stage), m in merged.items() if proj == projection_name}
+        for stage, m in groups.items():
             summary_rows.append({
                 "projection": projection_name,
                 "stage": stage,
-                "mean": np.mean(vals),
-                "std": np.std(vals),
-                "skewness": skew(vals),
-                "kurtosis": kurtosis(vals),
-                "count": len(vals)
+                "mean": float(m.mean),
+                "std": float(m.std()),
+                "skewness": float(m.skewness()),
+                "kurtosis": float(m.kurtosis()),
+                "count": int(m.n)
             })
 
-summary_df = pd.DataFrame(summary_rows)
-summary_csv = os.path.join(RESULTS_FOLDER, "canonical_projection_summary_by_stage.csv")
-summary_df.to_csv(summary_csv, index=False)
-logger.info(f"Saved summary stats to {summary_csv}")
-
-# Run ANOVA across stages
-for proj_type in ["Xc", "Yc"]:
-    for comp in ["1", "2"]:
-        projection_name = f"{proj_type}_{comp}"
-        df_proj = all_data[
-            (all_data["type"] == proj_type) &
-            (all_data["projection"] == projection_name)
-        ]
-        if df_proj.empty:
-            continue
-
-        groups = [g["value"].values for _, g in df_proj.groupby("stage")]
+        # Run ANOVA across stages
         if len(groups) > 1:
-            fval, pval = f_oneway(*groups)
+            fval, pval = one_way_anova(list(groups.values()))
             logger.info(f"ANOVA for {projection_name}: F = {fval:.3f}, p = {pval:.3e}")
 
-# TODO: deprecate below
-# Plot distributions per stage and projection
-for proj_type in ["Xc", "Yc"]:
-    for comp in ["1", "2"]:
-        projection_name = f"{proj_type}_{comp}"
-
-        df_plot = all_data[
-            (all_data["type"] == proj_type) &
-            (all_data["projection"] == projection_name)
-        ]
-
-        if df_plot.empty:
-            logger.warning(f"No data for {projection_name}")
-            continue
+    summary_df = pd.DataFrame(summary_rows)
+    summary_csv = os.path.join(RESULTS_FOLDER, "canonical_projection_summary_by_stage.csv")
+    summary_df.to_csv(summary_csv, index=False)
+    logger.info(f"Saved summary stats to {summary_csv}")
 
-        # KDE Plot
-        plt.figure(figsize=(10,5))
-        sns.kdeplot(
-            data=df_plot,
-            x="value",
-            hue="stage",
-            common_norm=False,
-            fill=True,
-            alpha=0.3,
-            linewidth=1.5
-        )
-        plt.title(f"Density of {projection_name} across stages")
-        plt.grid(alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(os.path.join(FIGURES_FOLDER, f"{projection_name}_kde.png"))
-        plt.close()
-        logger.info(f"Saved density plot for {projection_name}")
+    return {"canonical_projection_summary": summary_df}
 
-        # Boxplot
-        plt.figure(figsize=(8,5))
-        sns.boxplot(
-            x="stage",
-            y="value",
-            data=df_plot,
-            showmeans=True
-        )
-        plt.title(f"Boxplot of {projection_name} across stages")
-        plt.grid(alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(os.path.join(FIGURES_FOLDER, f"{projection_name}_boxplot.png"))
-        plt.close()
-        logger.info(f"Saved boxplot for {projection_name}")
-        
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -5,63 +5,44 @@ import pandas as pd
 import numpy as np
 import os
 
-# Parameters
-config = load_config()
-
-DATA_FOLDER = config.static_cca_params.output_dir  # "data/static_cca"
-OUTPUT_PATH = os.path.join(DATA_FOLDER, "explained_variance_by_stage.csv")
-
-# Find files
-xc_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith("_Xc_downsampled.csv")]
-yc_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith("_Yc_downsampled.csv")]
-
-# Get stage and subject
-def parse_metadata(filename):
-    parts = filename.replace("_Xc_downsampled.csv", "").replace("_Yc_downsampled.csv", "").split("_")
-    if len(parts) == 2:
-        return parts[0], parts[1]
-    return "unknown", "unknown"
-
-# Initialize
-records = []
-
-for xc_file in xc_files:
-    base = xc_file.replace("_Xc_downsampled.csv", "")
-    yc_file = base + "_Yc_downsampled.csv"
-    xc_path = os.path.join(DATA_FOLDER, xc_file)
-    yc_path = os.path.join(DATA_FOLDER, yc_file)
-
-    if not os.path.exists(yc_path):
-        continue
-
-    subject, stage = parse_metadata(xc_file)
-    try:
-        Xc = pd.read_csv(xc_path).values
-        Yc = pd.read_csv(yc_path).values
-
-        if Xc.shape[0] != Yc.shape[0]:
-            continue
-
-        var_Xc = np.var(Xc, axis=0)
-        var_Yc = np.var(Yc, axis=0)
-
-        total_var_X = var_Xc.sum()
-        total_var_Y = var_Yc.sum()
-
-        for i in range(2):
-            records.append({
-                "subject": subject,
-                "stage": stage,
-                "component": i + 1,
-                "explained_variance_Xc": var_Xc[i] / total_var_X if total_var_X else np.nan,
-                "explained_variance_Yc": var_Yc[i] / total_var_Y if total_var_Y else np.nan
-            })
-    except Exception as e:
-        logger.error(f"Error processing {xc_file}: {e}")
-        continue
-
-# Save results
-explained_var_df = pd.DataFrame(records)
-explained_var_df.to_csv(OUTPUT_PATH, index=False)
-
-logger.info(f"Explained variance results saved to {OUTPUT_PATH}")
+def main(static_summary=None):
+    """Explained-variance ratio of each canonical component per subject x stage."""
+    # Parameters
+    config = load_config()
+
+    DATA_FOLDER = config.static_cca_params.output_dir  # "data/static_cca"
+    SUMMARY_PATH = os.path.join(DATA_FOLDER, "eeg_eog_cca_summary_stats.csv")
+    OUTPUT_PATH = os.path.join(DATA_FOLDER, "explained_variance_by_stage.csv")
+
+    # Full-resolution projection stds, computed by static_cca.py in its projection pass
+    if static_summary is None:
+        static_summary = pd.read_csv(SUMMARY_PATH, float_precision="round_trip")
+
+    n_components = sum(1 for c in static_summary.columns if c.startswith("Xc") and c.endswith("_std"))
+    df = static_summary.assign(subject=static_summary["subject"].str.replace(".edf", "", regex=False))
+    df = df.sort_values(["subject", "stage"], kind="stable")
+
+    # Variance share of each component among the canonical components
+    var_Xc = df[[f"Xc{i+1}_std" for i in range(n_components)]].to_numpy(dtype=np.float64) ** 2
+    var_Yc = df[[f"Yc{i+1}_std" for i in range(n_components)]].to_numpy(dtype=np.float64) ** 2
+    total_var_X = var_Xc.sum(axis=1, keepdims=True)
+    total_var_Y = var_Yc.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio_X = np.where(total_var_X > 0, var_Xc / total_var_X, np.nan)
+        ratio_Y = np.where(total_var_Y > 0, var_Yc / total_var_Y, np.nan)
+
+    # Save results, one row per subject x stage x component
+    explained_var_df = pd.DataFrame({
+        "subject": np.repeat(df["subject"].to_numpy(), n_components),
+        "stage": np.repeat(df["stage"].to_numpy(), n_components),
+        "component": np.tile(np.arange(1, n_components + 1), len(df)),
+        "explained_variance_Xc": ratio_X.ravel(),
+        "explained_variance_Yc": ratio_Y.ravel(),
+    })
+    explained_var_df.to_csv(OUTPUT_PATH, index=False)
+
+    logger.info(f"Explained variance results saved to {OUTPUT_PATH}")
+    return {"explained_variance": explained_var_df}
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# stationarity.py
+"""
+Batched ADF / KPSS stationarity tests.
+
+Series of equal length are tested together: the ADF lag search (AIC over statsmodels'
+default maxlag) reuses one stacked Gram matrix per series, the final ADF regressions are
+solved per selected lag as stacked least-squares problems, and the KPSS statistics
+(Hobijn et al. automatic bandwidth) come from batched FFT autocovariances. Lengths with
+too few series to batch are tested one by one with statsmodels, in a process pool.
+Statistics and p-values follow statsmodels adfuller(x) and kpss(x, regression="c").
+"""
+from statsmodels.tsa.stattools import adfuller, kpss
+from statsmodels.tools.sm_exceptions import InterpolationWarning, MissingDataError
+from statsmodels.tsa.adfvalues import mackinnonp
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+from collections import defaultdict
+from logger import RepeatedLog, logger, start_worker_logging
+import multiprocessing.util
+import pandas as pd
+import numpy as np
+import warnings
+import logging
+
+KPSS_CRIT = [0.347, 0.463, 0.574, 0.739] # level-stationarity critical values
+KPSS_PVALS = [0.10, 0.05, 0.025, 0.01]
+RESULT_COLUMNS = ["adf_stat", "adf_pval", "adf_lags", "kpss_stat", "kpss_pval", "kpss_lags"]
+TEST_FAILURES = RepeatedLog(logger, logging.WARNING) # statsmodels failures, summarized per test
+TEST_ERRORS = (ValueError, np.linalg.LinAlgError, MissingDataError) # a failed test, e.g. NaN/inf in the series
+
+def adf_maxlag(nobs):
+    """statsmodels' default ADF maxlag (Schwert), constant-only regression."""
+    return min(nobs // 2 - 2, int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0))))
+
+def _adf_design(S, lag):
+    # Regressors [level, diff lags 1..lag, const] stacked as (B, k, nobs), and the differenced target
+    B, n = S.shape
+    xdiff = np.diff(S, axis=1)
+    nobs = n - 1 - lag
+    rows = [S[:, lag:n - 1]] + [xdiff[:, lag - j:lag - j + nobs] for j in range(1, lag + 1)]
+    rows.append(np.ones((B, nobs)))
+    return np.stack(rows, axis=1), xdiff[:, lag:]
+
+def adf_batch(S):
+    """ADF statistic, p-value and selected lag of each row of S (B, n)."""
+    S = np.asarray(S, dtype=np.float64)
+    B, n = S.shape
+    maxlag = adf_maxlag(n)
+    if maxlag < 0:
+        raise ValueError("sample size is too short to use selected regression component")
+
+    # Lag search on the common sample of the largest lag: every candidate model is a
+    # leading block of the same Gram matrix ([const, level, diff lags])
+    Xt, y = _adf_design(S, maxlag)
+    Xt = np.concatenate([Xt[:, -1:], Xt[:, :-1]], axis=1)
+    nobs = y.shape[1]
+    G = Xt @ np.swapaxes(Xt, 1, 2)
+    Xy = (Xt @ y[:, :, None])[..., 0]
+    yy = np.einsum("bn,bn->b", y, y)
+    aic = np.empty((B, maxlag + 1))
+    for lag in range(maxlag + 1):
+        k = lag + 2
+        beta = np.linalg.solve(G[:, :k, :k], Xy[:, :k, None])[..., 0]
+        ssr = yy - np.einsum("bi,bi->b", beta, Xy[:, :k])
+        aic[:, lag] = nobs * np.log(ssr / nobs) + 2 * k
+    best = np.argmin(aic, axis=1)
+
+    # Final regression per selected lag, on its own (longer) sample
+    stat = np.empty(B)
+    for lag in np.unique(best):
+        rows = np.flatnonzero(best == lag)
+        Xt, y = _adf_design(S[rows], lag)
+        G_inv = np.linalg.inv(Xt @ np.swapaxes(Xt, 1, 2))
+        beta = (G_inv @ (Xt @ y[:, :, None]))[..., 0]
+        resid = y - (beta[:, None, :] @ Xt)[:, 0]
+        sigma2 = np.einsum("bn,bn->b", resid, resid) / (y.shape[1] - Xt.shape[1])
+        stat[rows] = beta[:, 0] / np.sqrt(sigma2 * G_inv[:, 0, 0])
+
+    pval = np.array([mackinnonp(s, regression="c", N=1) for s in stat])
+    return stat, pval, best
+
+def kpss_batch(S):
+    """Level-stationarity KPSS statistic, p-value and bandwidth of each row of S (B, n)."""
+    S = np.asarray(S, dtype=np.float64)
+    B, nobs = S.shape
+    resids = S - S.mean(axis=1, keepdims=True)
+
+    # Autocovariance sums sum_t e_t e_{t-i} for every lag, via one FFT per series
+    nfft = 1 << int(np.ceil(np.log2(2 * nobs)))
+    spec = np.fft.rfft(resids, n=nfft, axis=1)
+    acov = np.fft.irfft(spec * np.conj(spec), n=nfft, axis=1)[:, :nobs]
+    lags = np.arange(nobs)
+
+    # Hobijn et al. (1998) bandwidth
+    covlags = int(np.power(nobs, 2.0 / 9.0))
+    prods = acov[:, 1:covlags + 1] / (nobs / 2.0)
+    s0 = acov[:, 0] / nobs + prods.sum(axis=1)
+    s1 = (prods * lags[1:covlags + 1]).sum(axis=1)
+    gamma_hat = 1.1447 * np.power((s1 / s0) ** 2, 1.0 / 3.0)
+    nlags = np.minimum((gamma_hat * np.power(nobs, 1.0 / 3.0)).astype(np.int64), nobs - 1)
+
+    # Bartlett-weighted long-run variance with each series' own bandwidth
+    weights = np.clip(1.0 - lags[None, 1:] / (nlags[:, None] + 1.0), 0.0, None)
+    s_hat = (acov[:, 0] + 2.0 * (acov[:, 1:] * weights).sum(axis=1)) / nobs
+    eta = np.sum(np.cumsum(resids, axis=1) ** 2, axis=1) / nobs ** 2
+    stat = eta / s_hat
+    return stat, np.interp(stat, KPSS_CRIT, KPSS_PVALS), nlags
+
+def _test_one(x):
+    # One series with statsmodels; a failed test yields NaN instead of aborting the batch
+    x = np.asarray(x, dtype=np.float64)
+    result = dict.fromkeys(RESULT_COLUMNS, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", InterpolationWarning)  # p-values beyond the table are clipped
+        warnings.simplefilter("ignore", FutureWarning)
+        try:
+            adf = adfuller(x)
+            result.update(adf_stat=adf[0], adf_pval=adf[1], adf_lags=adf[2])
+        except TEST_ERRORS as e:
+            TEST_FAILURES.add("ADF", "ADF test failed on a series of length %d: %s", len(x), e)
+        try:
+            stat, pval, nlags, _ = kpss(x, regression="c")
+            result.update(kpss_stat=stat, kpss_pval=pval, kpss_lags=nlags)
+        except TEST_ERRORS as e:
+            TEST_FAILURES.add("KPSS", "KPSS test failed on a series of length %d: %s", len(x), e)
+    return result
+
+def _init_worker(blas_threads):
+    threadpool_limits(limits=blas_threads)
+    start_worker_logging()
+    # Report the worker's outstanding failure counts before its log queue is drained
+    multiprocessing.util.Finalize(None, TEST_FAILURES.flush, exitpriority=20)
+
+def stationarity_tests(series, min_batch=8, batch_size=256, n_workers=1, blas_threads=1):
+    """
+    ADF and KPSS results for a list of 1-D series, one row per series in input order
+    (columns RESULT_COLUMNS). Lengths shared by at least `min_batch` finite, non-constant
+    series are tested in stacked batches of `batch_size`; the rest fall back to
+    statsmodels, in a pool of `n_workers` processes.
+    """
+    results = pd.DataFrame(np.nan, index=range(len(series)), columns=RESULT_COLUMNS)
+
+    by_length = defaultdict(list)
+    ragged = []
+    for i, x in enumerate(series):
+        x = np.asarray(x)
+        # Constant or non-finite series go through statsmodels, which reports them
+        if len(x) > 4 and np.isfinite(x).all() and x.max() > x.min():
+            by_length[len(x)].append(i)
+        else:
+            ragged.append(i)
+
+    for length, idx in by_length.items():
+        if len(idx) < min_batch or adf_maxlag(length) < 0:
+            ragged.extend(idx)
+            continue
+        for start in range(0, len(idx), batch_size):
+            rows = idx[start:start + batch_size]
+            S = np.stack([np.asarray(series[i], dtype=np.float64) for i in rows])
+            adf_stat, adf_pval, adf_lags = adf_batch(S)
+            kpss_stat, kpss_pval, kpss_lags = kpss_batch(S)
+            results.loc[rows, RESULT_COLUMNS] = np.column_stack([adf_stat, adf_pval, adf_lags, kpss_stat, kpss_pval, kpss_lags])
+
+    ragged.sort()
+    if n_workers > 1 and len(ragged) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(blas_threads,)) as pool:
+            rows = list(pool.map(_test_one, [series[i] for i in ragged], chunksize=max(len(ragged) // (4 * n_workers), 1)))
+    else:
+        rows = [_test_one(series[i]) for i in ragged]
+    if rows:
+        results.loc[ragged, RESULT_COLUMNS] = pd.DataFrame(rows, columns=RESULT_COLUMNS).to_numpy()
+    TEST_FAILURES.flush()
+    return results
@@ -0,0 +1,217 @@
+# streaming_cca.py
+"""
+Online EEG-EOG CCA for live or replayed PSG streams.
+
+Chunks of EEG/EOG samples (any iterable of (eeg, eog) arrays shaped (n_channels, n))
+are band-passed with causal SOS filters (the "iir" design of filtering.py run forwards
+only, with carried state) and folded into per-block moment accumulators. The sliding
+window is the Chan merge of its last blocks and the forgetting estimate decays by
+block, so memory is fixed by the window length whatever the recording length, and a
+correlation is emitted as soon as the last sample of each step has arrived.
+
+Run directly to replay an EDF of the cohort at real-time or accelerated speed.
+"""
+from cca_engine import MomentAccumulator, canonical_correlations, cca_settings
+from manifest import build_manifest, planned_subjects
+from filtering import design_filter
+from config_loader import load_config
+from edf_reader import EdfReader
+from collections import deque
+from scipy import signal
+from logger import logger
+import pandas as pd
+import numpy as np
+import math
+import time
+import os
+
+class CausalFilter:
+    """Notch + band-pass applied chunk by chunk; the SOS state carries over between chunks."""
+
+    def __init__(self, sfreq, hp, lp, line_hz):
+        self.sos = design_filter(float(sfreq), float(hp), float(lp), float(line_hz) if line_hz else 0.0, "iir")
+        self.zi = None
+
+    def __call__(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.shape[-1] == 0:
+            return chunk
+        if self.zi is None:
+            # Start from the steady state of the first sample, as if the signal had been constant before
+            self.zi = signal.sosfilt_zi(self.sos)[:, None, :] * chunk[None, :, :1]
+        out, self.zi = signal.sosfilt(self.sos, chunk, axis=-1, zi=self.zi)
+        return out
+
+class StreamingCCA:
+    """
+    Incremental windowed and exponentially-forgotten canonical correlations.
+
+    Samples are accumulated in blocks of gcd(window, step) samples; a window is the merge
+    of its last window/block blocks. The forgetting estimate multiplies its past moments
+    by 0.5 ** (block / halflife) before each new block (halflife_sec=None disables it).
+    """
+
+    def __init__(self, p, q, sfreq, window_sec, step_sec, halflife_sec=None, n_components=2, ridge=0.0, dtype=np.float64):
+        self.p, self.q = p, q
+        self.sfreq = float(sfreq)
+        self.window = int(round(window_sec * sfreq))
+        self.step = int(round(step_sec * sfreq))
+        self.block = math.gcd(self.window, self.step)
+        self.n_components, self.ridge, self.dtype = n_components, ridge, dtype
+
+        self.blocks = deque(maxlen=self.window // self.block)
+        self.pending = np.zeros((self.block, p + q))
+        self.n_pending = 0
+        self.n_seen = 0  # samples folded into blocks
+        self.forget = None
+        if halflife_sec:
+            self.forget = MomentAccumulator(p, q)
+            self.decay = 0.5 ** (self.block / (halflife_sec * sfreq))
+
+    def update(self, X, Y):
+        """
+        Feed X (n, p) and Y (n, q); returns a list of results, one per completed step:
+        dicts with time_sec (window start), cca_corr{k} and, with forgetting, ewm_corr{k}.
+        """
+        Z = np.hstack([np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)])
+        results = []
+        pos = 0
+        while pos < len(Z):
+            take = min(self.block - self.n_pending, len(Z) - pos)
+            self.pending[self.n_pending:self.n_pending + take] = Z[pos:pos + take]
+            self.n_pending += take
+            pos += take
+            if self.n_pending == self.block:
+                result = self._close_block()
+                if result is not None:
+                    results.append(result)
+        return results
+
+    def _close_block(self):
+        acc = MomentAccumulator(self.p, self.q).update(self.pending[:, :self.p], self.pending[:, self.p:])
+        self.blocks.append(acc)
+        if self.forget is not None:
+            self.forget.decay(self.decay).merge(acc)
+        self.n_pending = 0
+        self.n_seen += self.block
+
+        # Emit once the window is full and then every step
+        if self.n_seen < self.window or (self.n_seen - self.window) % self.step:
+            return None
+        window = MomentAccumulator(self.p, self.q)
+        for acc in self.blocks:
+            window.merge(acc)
+        stats = [window] if self.forget is None else [window, self.forget]
+        blocks = [s.covariance_blocks()[2:] for s in stats]
+        rho = canonical_correlations(*[np.stack(b) for b in zip(*blocks)], n_components=self.n_components,
+                                     ridge=self.ridge, dtype=self.dtype)
+
+        result = {"time_sec": (self.n_seen - self.window) / self.sfreq}
+        result.update({f"cca_corr{k+1}": rho[0, k] for k in range(self.n_components)})
+        if self.forget is not None:
+            result.update({f"ewm_corr{k+1}": rho[1, k] for k in range(self.n_components)})
+        return result
+
+def stream_cca(chunks, sfreq, config, halflife_sec=None):
+    """
+    Generator of per-step results for a stream of (eeg, eog) chunks shaped (n_channels, n),
+    with causal versions of the configured preprocessing filters. Each result also has
+    `latency_sec`, the processing time between the arrival of its chunk and its emission.
+    """
+    n_components, ridge, dtype = cca_settings(config)
+    pre = config.preprocess
+    filters = None
+    engine = None
+
+    for eeg, eog in chunks:
+        arrived = time.perf_counter()
+        eeg = np.asarray(eeg, dtype=np.float64)
+        eog = np.asarray(eog, dtype=np.float64)
+        if engine is None:
+            engine = StreamingCCA(len(eeg), len(eog), sfreq, config.time_cca_params.window_length,
+                                  config.time_cca_params.step_length, halflife_sec=halflife_sec,
+                                  n_components=n_components, ridge=ridge, dtype=dtype)
+            if getattr(pre, "enabled", False):
+                line_hz = getattr(pre, "line_hz", None)
+                filters = (CausalFilter(sfreq, pre.eeg.hp, pre.eeg.lp, line_hz),
+                           CausalFilter(sfreq, pre.eog.hp, pre.eog.lp, line_hz))
+        if filters is not None:
+            eeg, eog = filters[0](eeg), filters[1](eog)
+        for result in engine.update(eeg.T, eog.T):
+            result["latency_sec"] = time.perf_counter() - arrived
+            yield result
+
+def array_chunks(eeg, eog, chunk):
+    """(eeg, eog) chunks of `chunk` samples from in-memory arrays (n_channels, n_times)."""
+    for start in range(0, eeg.shape[1], chunk):
+        yield eeg[:, start:start + chunk], eog[:, start:start + chunk]
+
+def socket_chunks(sock, n_eeg, n_eog, chunk):
+    """
+    (eeg, eog) chunks read from a connected socket carrying interleaved little-endian
+    float32 frames of n_eeg + n_eog samples; ends when the peer closes the connection.
+    """
+    frame = 4 * (n_eeg + n_eog)
+    buffer = b""
+    while True:
+        data = sock.recv(frame * chunk)
+        if not data:
+            break
+        buffer += data
+        n_frames = len(buffer) // frame
+        if n_frames == 0:
+            continue
+        samples = np.frombuffer(buffer[:n_frames * frame], dtype="<f4").reshape(n_frames, -1).T
+        buffer = buffer[n_frames * frame:]
+        yield samples[:n_eeg], samples[n_eeg:]
+
+def edf_replay(edf_path, eeg_chs, eog_chs, chunk_sec=1.0, speed=1.0):
+    """
+    Replay an EDF as (eeg, eog) chunks of `chunk_sec` seconds. speed=1 paces the chunks in
+    real time, speed=10 ten times faster and speed=0 as fast as they can be read.
+    Only the current chunk is decoded from the memory-mapped file.
+    """
+    reader = EdfReader(edf_path, channels=list(eeg_chs) + list(eog_chs))
+    chunk = max(int(round(chunk_sec * reader.sfreq)), 1)
+    t0 = time.perf_counter()
+    for start in range(0, reader.n_times, chunk):
+        if speed:
+            # Wait until this chunk would have been recorded
+            delay = t0 + (start + chunk) / reader.sfreq / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield reader.get_data(eeg_chs, start, start + chunk), reader.get_data(eog_chs, start, start + chunk)
+
+def main():
+    """Replay one recording of the cohort through the streaming CCA and save the emitted series."""
+    config = load_config()
+    params = getattr(config, "streaming", None)
+    speed = float(getattr(params, "speed", 0)) if params is not None else 0.0
+    chunk_sec = float(getattr(params, "chunk_sec", 1.0)) if params is not None else 1.0
+    halflife_sec = getattr(params, "halflife_sec", 60) if params is not None else 60
+    edf_file = getattr(params, "edf_file", None) if params is not None else None
+
+    if not edf_file:
+        file_pairs, _ = planned_subjects(build_manifest(config))
+        if not file_pairs:
+            logger.error("No recording to replay")
+            return {}
+        edf_file = file_pairs[0][0]
+    edf_path = os.path.join(config.data.data_dir, edf_file)
+    eeg_chs, eog_chs = list(config.data.eeg_channels), list(config.data.eog_channels)
+    sfreq = EdfReader(edf_path, channels=eeg_chs + eog_chs).sfreq
+
+    logger.info(f"Replaying {edf_file} at {'full' if not speed else f'{speed:g}x'} speed")
+    chunks = edf_replay(edf_path, eeg_chs, eog_chs, chunk_sec=chunk_sec, speed=speed)
+    results = pd.DataFrame(list(stream_cca(chunks, sfreq, config, halflife_sec=halflife_sec)))
+
+    output_path = os.path.join(config.time_cca_params.output_dir, f"streaming_{edf_file.replace('.edf', '')}.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    results.to_csv(output_path, index=False)
+    if len(results):
+        logger.info(f"{len(results)} streaming steps saved to {output_path}; "
+                    f"latency median {results['latency_sec'].median() * 1e3:.2f} ms, max {results['latency_sec'].max() * 1e3:.2f} ms")
+    return {"streaming": results}
+
+if __name__ == "__main__":
+    main()
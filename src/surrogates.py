@@ -0,0 +1,96 @@
+# surrogates.py
+"""
+Surrogate null distributions for windowed CCA.
+
+EOG surrogates keep the EEG of each window and destroy its temporal alignment with
+the EOG, either by phase randomization (the same random phases for every EOG channel,
+so the EOG spectra and cross-spectra, hence Cyy, are kept) or by a circular time shift.
+Neither needs the surrogate signals themselves: with one FFT per window, the
+surrogate cross-covariances are a Parseval sum over the EEG/EOG cross-spectrum
+(phase) or lags of its inverse FFT (shift), so all surrogates of a block of windows
+come from one matrix product. Surrogate draws are shared by the windows of a call.
+"""
+from cca_engine import shared_canonical_correlations
+from memory import rows_within
+import numpy as np
+
+SURROGATE_METHODS = ("phase", "shift")
+
+def _window_spectra(X, Y, starts, n):
+    # rfft of every window, centered per window: (w, F, p) and (w, F, q)
+    idx = starts[:, None] + np.arange(n)[None, :]
+    Xw = X[idx].astype(np.float64)
+    Yw = Y[idx].astype(np.float64)
+    Xw = Xw - Xw.mean(axis=1, keepdims=True)
+    Yw = Yw - Yw.mean(axis=1, keepdims=True)
+    Cxx = np.swapaxes(Xw, 1, 2) @ Xw / (n - 1)
+    Cyy = np.swapaxes(Yw, 1, 2) @ Yw / (n - 1)
+    return np.fft.rfft(Xw, axis=1), np.fft.rfft(Yw, axis=1), Cxx, Cyy
+
+def surrogate_null(X, Y, starts, stops, rho, method="phase", n_surrogates=200, min_shift=1,
+                   n_components=2, ridge=0.0, dtype=np.float64, rng=None, block=64, budget=0):
+    """
+    Surrogate test of the observed window correlations rho (w, k).
+
+    Returns (pvals, null_mean), both (w, k): the permutation p-value
+    (1 + #{null >= observed}) / (n_surrogates + 1) and the mean surrogate correlation.
+    `min_shift` is the smallest circular shift in samples (shift method). Up to `block`
+    windows are processed at once, fewer if their working set exceeds `budget` bytes.
+    """
+    if method not in SURROGATE_METHODS:
+        raise ValueError(f"surrogate method must be one of {SURROGATE_METHODS}, got {method}")
+    rng = np.random.default_rng() if rng is None else rng
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(stops, dtype=np.int64) - starts
+    p, q = X.shape[1], Y.shape[1]
+
+    pvals = np.full((len(starts), n_components), np.nan)
+    null_mean = np.full((len(starts), n_components), np.nan)
+
+    # Windows of equal length share the FFT size and the surrogate draws
+    for n in np.unique(lengths):
+        rows = np.flatnonzero(lengths == n)
+        F = n // 2 + 1
+        # float64 windows, complex spectra and cross-spectra, lagged or projected cross-covariances
+        per_window = 8 * (3 * n * (p + q) + 4 * F * p * q + n * p * q + 2 * n_surrogates * p * q)
+        n_block = rows_within(budget, per_window, block)
+        if method == "phase":
+            # Random phases; DC and Nyquist stay real. One-sided spectrum weights for Parseval
+            phases = np.exp(1j * rng.uniform(0.0, 2.0 * np.pi, size=(n_surrogates, F)))
+            phases[:, 0] = 1.0
+            weights = np.full(F, 2.0)
+            weights[0] = 1.0
+            if n % 2 == 0:
+                phases[:, -1] = 1.0
+                weights[-1] = 1.0
+            kernel = phases * weights / (n * (n - 1.0))
+        else:
+            lo = min(int(min_shift), n // 2)
+            shifts = rng.integers(lo, n - lo + 1, size=n_surrogates) % n
+
+        for b in range(0, len(rows), n_block):
+            sel = rows[b:b + n_block]
+            Xf, Yf, Cxx, Cyy = _window_spectra(X, Y, starts[sel], n)
+            cross = Xf[:, :, :, None] * np.conj(Yf)[:, :, None, :]  # (w, F, p, q)
+
+            if method == "phase":
+                # sum_t x_t y~_t = Re sum_f w_f X_f conj(Y_f) e^{-i phi_f} / n, all surrogates in one product
+                flat = np.moveaxis(cross, 1, 0).reshape(F, -1)
+                Cxy = np.real(np.conj(kernel) @ flat).reshape(n_surrogates, len(sel), p, q)
+                Cxy = np.moveaxis(Cxy, 0, 1)
+            else:
+                # Circular cross-covariance at every lag, then the drawn shifts
+                lagged = np.fft.irfft(np.conj(cross), n=n, axis=1)  # sum_t x_t y_{t+lag}
+                Cxy = lagged[:, shifts] / (n - 1.0)
+
+            null = shared_canonical_correlations(Cxx, Cyy, Cxy, n_components=n_components, ridge=ridge, dtype=dtype)
+            observed = rho[sel][:, None, :]
+            pvals[sel] = (1.0 + (null >= observed).sum(axis=1)) / (n_surrogates + 1.0)
+            null_mean[sel] = null.mean(axis=1)
+
+    invalid = np.isnan(rho)
+    pvals[invalid] = np.nan
+    null_mean[invalid] = np.nan
+    return pvals, null_mean
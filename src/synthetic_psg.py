@@ -0,0 +1,147 @@
+# synthetic_psg.py
+"""
+Synthetic PSG recordings with known, stage-dependent EEG-EOG coupling.
+
+Each recording gets a random hypnogram of 30 s epochs. Two shared latent sources are mixed
+into orthonormal EEG and EOG directions on top of independent unit-variance noise on every
+channel, with a per-stage latent gain g_k = sqrt(rho_k / (1 - rho_k)): the population
+canonical correlations of a stage are then exactly its `coupling` pair (rho_1, rho_2).
+Latents and noise share one spectrum, band-limited to SOURCE_BAND inside the pass bands
+of both modalities, so the configured preprocessing leaves the coupling (nearly) intact.
+
+Recordings are written chunk by chunk as plain 16-bit EDF (1 s records, uV) next to a
+`.annot` table in the format annotations.py reads; memory is bounded by `chunk_sec`.
+"""
+from datetime import datetime, timedelta, timezone
+from scipy import signal
+from logger import logger
+import numpy as np
+import shutil
+import os
+
+STAGE_COUPLING = {"W": (0.3, 0.1), "N1": (0.5, 0.2), "N2": (0.7, 0.3), "N3": (0.85, 0.4), "R": (0.6, 0.25)}
+SOURCE_BAND = (1.0, 6.0) # Hz, shared by the latent sources and the channel noise
+EPOCH_SEC = 30
+NOISE_UV = 20.0 # standard deviation of the channel noise
+PHYSICAL_UV = 500.0 # EDF physical range is +-PHYSICAL_UV, digital +-32767
+START = datetime(2020, 1, 1, 22, 30, 0, tzinfo=timezone.utc)
+
+def random_hypnogram(n_epochs, stages, rng, mean_run=10):
+    """Stage index per epoch: runs of geometric length (mean `mean_run` epochs), each a different stage."""
+    codes = np.empty(n_epochs, dtype=np.int64)
+    pos, current = 0, -1
+    while pos < n_epochs:
+        choices = [k for k in range(len(stages)) if k != current] or [0]
+        current = int(rng.choice(choices))
+        run = int(rng.geometric(1.0 / mean_run))
+        codes[pos:pos + run] = current
+        pos += run
+    return codes
+
+def _edf_header(labels, sfreq, n_records, start):
+    """Plain EDF header for len(labels) signals of `sfreq` samples per 1 s record."""
+    def field(value, width):
+        return f"{value:<{width}}"[:width]
+
+    ns = len(labels)
+    main = (field("0", 8) + field("X X X synthetic", 80) + field("Startdate synthetic PSG", 80)
+            + start.strftime("%d.%m.%y") + start.strftime("%H.%M.%S")
+            + field(256 * (ns + 1), 8) + field("", 44) + field(n_records, 8) + field(1, 8) + field(ns, 4))
+    columns = [(labels, 16), (["synthetic"] * ns, 80), (["uV"] * ns, 8),
+               ([-PHYSICAL_UV] * ns, 8), ([PHYSICAL_UV] * ns, 8), ([-32767] * ns, 8), ([32767] * ns, 8),
+               ([""] * ns, 80), ([int(sfreq)] * ns, 8), ([""] * ns, 32)]
+    signals = "".join(field(v, width) for values, width in columns for v in values)
+    return (main + signals).encode("ascii")
+
+def _write_annot(annot_path, codes, stages, start):
+    with open(annot_path, "w", encoding="utf-8") as f:
+        f.write("stage\tepoch\tsource\tstart\tstop\tduration\n")
+        for i, code in enumerate(codes):
+            t0 = start + timedelta(seconds=i * EPOCH_SEC)
+            t1 = t0 + timedelta(seconds=EPOCH_SEC)
+            f.write(f"{stages[code]}\t{i}\tsynthetic\t{t0:%H:%M:%S}\t{t1:%H:%M:%S}\t{EPOCH_SEC}\n")
+
+def write_recording(edf_path, annot_path, duration_sec, sfreq, eeg_chs, eog_chs, extra_chs=(),
+                    coupling=None, stages=None, rng=None, start=START, chunk_sec=600):
+    """
+    Write one synthetic recording (EDF + .annot). The duration is rounded down to whole
+    epochs; sfreq must be an integer. Extra channels carry independent white noise and are
+    only there to be skipped by the channel-selective reader. Returns the stage codes per epoch.
+    """
+    coupling = dict(coupling or STAGE_COUPLING)
+    stages = list(stages or coupling)
+    rng = rng if rng is not None else np.random.default_rng()
+    if int(sfreq) != sfreq or sfreq <= 2 * SOURCE_BAND[1]:
+        raise ValueError(f"sfreq must be an integer above {2 * SOURCE_BAND[1]:g} Hz, got {sfreq}")
+    sfreq = int(sfreq)
+    n_eeg, n_eog = len(eeg_chs), len(eog_chs)
+    n_latent = min(len(next(iter(coupling.values()))), n_eeg, n_eog)
+
+    n_epochs = int(duration_sec // EPOCH_SEC)
+    codes = random_hypnogram(n_epochs, stages, rng)
+    rho = np.array([coupling[s][:n_latent] for s in stages], dtype=np.float64)
+    gains = np.sqrt(rho / (1.0 - rho)) # (n_stages, n_latent)
+
+    # Orthonormal mixing directions, one per latent source
+    U = np.linalg.qr(rng.standard_normal((n_eeg, n_latent)))[0]
+    V = np.linalg.qr(rng.standard_normal((n_eog, n_latent)))[0]
+
+    # One causal band-pass for latents + noise, its state carried across chunks; unit output variance
+    sos = signal.butter(4, SOURCE_BAND, btype="bandpass", fs=sfreq, output="sos")
+    impulse = np.zeros(sfreq * 60)
+    impulse[0] = 1.0
+    norm = 1.0 / np.sqrt(np.sum(signal.sosfilt(sos, impulse) ** 2))
+    n_src = n_latent + n_eeg + n_eog
+    zi = np.zeros((sos.shape[0], n_src, 2))
+
+    n_records = n_epochs * EPOCH_SEC
+    chunk_records = max(int(chunk_sec), EPOCH_SEC) // EPOCH_SEC * EPOCH_SEC
+    with open(edf_path, "wb") as f:
+        f.write(_edf_header(list(eeg_chs) + list(eog_chs) + list(extra_chs), sfreq, n_records, start))
+        for rec0 in range(0, n_records, chunk_records):
+            n_rec = min(chunk_records, n_records - rec0)
+            n = n_rec * sfreq
+            src, zi = signal.sosfilt(sos, rng.standard_normal((n_src, n)), axis=-1, zi=zi)
+            src *= norm
+            latent = src[:n_latent] * gains[np.repeat(codes[rec0 // EPOCH_SEC:(rec0 + n_rec) // EPOCH_SEC], EPOCH_SEC * sfreq)].T
+            eeg = src[n_latent:n_latent + n_eeg] + U @ latent
+            eog = src[n_latent + n_eeg:] + V @ latent
+            extra = rng.standard_normal((len(extra_chs), n))
+            data = np.vstack([eeg, eog, extra]) * (NOISE_UV * 32767 / PHYSICAL_UV)
+            digital = np.clip(np.rint(data), -32767, 32767).astype("<i2")
+            # Record-major layout: every record holds one second of each signal in turn
+            f.write(digital.reshape(len(data), n_rec, sfreq).transpose(1, 0, 2).tobytes())
+
+    _write_annot(annot_path, codes, stages, start)
+    return codes
+
+def write_cohort(out_dir, n_subjects, duration_sec, sfreq, eeg_chs, eog_chs, extra_chs=(),
+                 coupling=None, stages=None, seed=0, pool_dir=None):
+    """
+    Synthetic cohort of `n_subjects` recordings in out_dir; returns the EDF file names.
+    Subject i always comes from the random stream (seed, i). With `pool_dir`, recordings are
+    generated there once and linked (or copied) into out_dir, so cohorts of growing size
+    share their first subjects; existing recordings are reused.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    source_dir = pool_dir or out_dir
+    os.makedirs(source_dir, exist_ok=True)
+    edf_files = []
+    for i in range(n_subjects):
+        name = f"synthetic-{i:04d}"
+        edf_src, annot_src = (os.path.join(source_dir, name + ext) for ext in (".edf", ".annot"))
+        if not (os.path.exists(edf_src) and os.path.exists(annot_src)):
+            logger.info(f"Generating synthetic recording {edf_src} ({duration_sec / 3600:g} h at {sfreq:g} Hz)")
+            write_recording(edf_src, annot_src, duration_sec, sfreq, eeg_chs, eog_chs, extra_chs,
+                            coupling=coupling, stages=stages, rng=np.random.default_rng([seed, i]))
+        if source_dir != out_dir:
+            for src in (edf_src, annot_src):
+                dst = os.path.join(out_dir, os.path.basename(src))
+                if os.path.lexists(dst):
+                    continue
+                try:
+                    os.symlink(os.path.abspath(src), dst)
+                except OSError:
+                    shutil.copyfile(src, dst)
+        edf_files.append(name + ".edf")
+    return edf_files
@@ -0,0 +1,140 @@
+# telemetry.py
+"""
+Machine-readable performance telemetry, next to the text logger.
+
+Timers, counters and memory snapshots are appended as JSON lines to the file named by
+the METRICS_FILE environment variable (configured like LOG_FILE for the text log);
+without it a timer costs two perf_counter calls and nothing is written. Every record
+has the wall-clock time, the process id, the metric name and free-form tags (subject,
+sleep_stage, ...), so the records of parallel workers can be merged afterwards.
+
+METRICS_TRACEMALLOC=<frames> starts tracemalloc in every process and adds traced
+current/peak memory and the top allocation sites to the memory snapshots.
+PROFILE_DIR=<dir> dumps a cProfile of every pipeline stage as <dir>/<stage>-<pid>.prof.
+
+Summarize a metrics file with: python src/telemetry.py metrics.jsonl
+"""
+import contextlib
+import threading
+import tracemalloc
+import cProfile
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:  # not available on Windows: peak RSS is not reported
+    resource = None
+
+METRICS_FILE = os.getenv("METRICS_FILE")
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+TRACEMALLOC_FRAMES = int(os.getenv("METRICS_TRACEMALLOC", "0") or 0)
+TOP_ALLOCATIONS = 10 # allocation sites listed per tracemalloc snapshot
+
+_lock = threading.Lock()
+
+if TRACEMALLOC_FRAMES and not tracemalloc.is_tracing():
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+
+def emit(kind, metric, **fields):
+    """Append one record to METRICS_FILE (no-op when it is not set)."""
+    if not METRICS_FILE:
+        return
+    record = {"time": time.time(), "pid": os.getpid(), "kind": kind, "metric": metric}
+    record.update(fields)
+    line = json.dumps(record, default=str) + "\n"
+    # One short O_APPEND write per record, so lines of concurrent workers do not interleave
+    with _lock, open(METRICS_FILE, "a", encoding="utf-8") as f:
+        f.write(line)
+
+@contextlib.contextmanager
+def timer(metric, items=None, **tags):
+    """
+    Time the block as a "timer" record with `seconds`. With `items` (windows, samples,
+    series ...) the record also has items_per_sec; the yielded dict can be updated inside
+    the block, e.g. record["items"] = n once it is known. A block that raises is recorded
+    with ok=False.
+    """
+    record = dict(tags)
+    if items is not None:
+        record["items"] = items
+    ok = True
+    t0 = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        if METRICS_FILE:
+            if record.get("items") is not None and seconds > 0:
+                record["items_per_sec"] = record["items"] / seconds
+            emit("timer", metric, seconds=seconds, ok=ok, **record)
+
+def count(metric, value=1, **tags):
+    """A "counter" record: `value` occurrences of `metric`."""
+    emit("counter", metric, value=value, **tags)
+
+def peak_rss_mb(children=False):
+    """Peak resident set size in MB of this process or of its waited-for children (worker processes)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def memory_snapshot(metric, **tags):
+    """A "memory" record: peak RSS and, when tracemalloc is tracing, traced memory and the top allocation sites."""
+    if not METRICS_FILE:
+        return
+    fields = {"peak_rss_mb": peak_rss_mb()}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        fields["traced_mb"] = current / (1 << 20)
+        fields["traced_peak_mb"] = peak / (1 << 20)
+        fields["top_allocations"] = [{"where": str(stat.traceback[0]), "size_mb": stat.size / (1 << 20), "count": stat.count}
+                                     for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+    fields.update(tags)
+    emit("memory", metric, **fields)
+
+@contextlib.contextmanager
+def profiled(name):
+    """cProfile the block (main thread) into PROFILE_DIR/<name>-<pid>.prof when PROFILE_DIR is set."""
+    if not PROFILE_DIR:
+        yield
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}.prof"))
+
+def summarize(metrics_path):
+    """Timers of a metrics file aggregated per metric: count, total/mean/max seconds and throughput."""
+    import pandas as pd
+    records = pd.read_json(metrics_path, lines=True)
+    timers = records[records["kind"] == "timer"]
+    if timers.empty:
+        return pd.DataFrame()
+    if "items" not in timers:
+        timers = timers.assign(items=float("nan"))
+    summary = timers.groupby("metric").agg(count=("seconds", "size"), total_sec=("seconds", "sum"),
+                                           mean_sec=("seconds", "mean"), max_sec=("seconds", "max"),
+                                           items=("items", "sum"))
+    # Throughput over the timers that reported items only
+    timed = timers[timers["items"].notna()].groupby("metric")["seconds"].sum().reindex(summary.index)
+    summary["items"] = summary["items"].where(timed.notna())
+    summary["items_per_sec"] = summary["items"] / timed
+    return summary.sort_values("total_sec", ascending=False)
+
+if __name__ == "__main__":
+    import pandas as pd
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summarize(sys.argv[1] if len(sys.argv) > 1 else METRICS_FILE))
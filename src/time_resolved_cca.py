@@ -1,14 +1,21 @@
 # time_resolved_cca.py
-from preprocessing import apply_preprocessing
-from sklearn.cross_decomposition import CCA
-from datetime import datetime, timedelta
+from preproc_cache import load_preprocessed, preload_subject
+from windowed_cca import DEFAULT_CHUNK, window_bounds, windowed_cca, windowed_cca_sweep
+from cca_engine import cca_settings
+from surrogates import surrogate_null
+from annotations import hypnogram_epochs, load_hypnogram
 from config_loader import load_config
-from logger import logger
-import pandas as pd
+from manifest import build_manifest, planned_subjects
+from result_store import SubjectWriter, read_results
+from ledger import open_ledger, pending_subjects
+from parallel import map_subjects
+from memory import memory_settings, rows_within
+from telemetry import memory_snapshot, timer
+from functools import partial
+from logger import RepeatedLog, logger
 import numpy as np
-import mne
+import zlib
 import os
-import gc
 
 # Parameters
 config = load_config()
@@ -20,122 +27,151 @@ EOG_CHANNELS = config.data.eog_channels # ['LOC', 'ROC']
 SLEEP_STAGES = config.data.sleep_stages # ['W', 'N1', 'N2', 'N3', 'R']
 WINDOW_LENGTH = config.time_cca_params.window_length # 30 seconds
 STEP_LENGTH = config.time_cca_params.step_length # 15 seconds
-fmt = "%H:%M:%S"
+N_COMPONENTS, RIDGE, CCA_DTYPE = cca_settings(config) # 2, 0.0, float64
+HYPNOGRAM_CACHE = getattr(config.data, "hypnogram_cache", True) # .npy hypnogram next to the annotations
+_, MEMORY_BUDGET = memory_settings(config) # bytes per worker, 0 = unlimited
+SURROGATES = getattr(config.time_cca_params, "surrogates", "none") # none | phase | shift
+N_SURROGATES = getattr(config.time_cca_params, "n_surrogates", 200)
+MIN_SHIFT_SEC = getattr(config.time_cca_params, "min_shift_sec", 2) # smallest circular shift (shift surrogates)
+SURROGATE_SEED = getattr(config.time_cca_params, "surrogate_seed", 0)
+SWEEP_WINDOWS = list(getattr(config.time_cca_params, "sweep_window_lengths", None) or []) # e.g. [10, 30, 60] seconds
+SWEEP_STEPS = list(getattr(config.time_cca_params, "sweep_step_lengths", None) or []) # e.g. [5, 15] seconds
 
 if not os.path.exists(OUTPUT_FOLDER):
     os.makedirs(OUTPUT_FOLDER)
 
-# Iterate through .edf/.annot files
-file_pairs = [(f, f.replace(".edf", ".annot")) for f in os.listdir(DATA_FOLDER) if f.endswith(".edf")]
+TIMESERIES = "timeseries" # result-store dataset of per-window correlations
+WINDOW_ERRORS = RepeatedLog(logger) # failed windows, summarized per subject and stage
+SWEEP = "sweep" # result-store dataset of the window/step sweep, tagged by window_length/step_length
 
-for edf_file, annot_file in file_pairs:
+# Completion ledger: subjects whose inputs and CCA-relevant config are unchanged are skipped
+LEDGER = open_ledger(config, OUTPUT_FOLDER, ["data", "preprocess", "cca_params", "time_cca_params"])
+
+def process_subject(edf_file, annot_file, raw_proc=None):
+    """Load, preprocess and run time-resolved CCA for one recording; writes its per-stage timeseries."""
+    saved = []
     edf_path = os.path.join(DATA_FOLDER, edf_file)
     annot_path = os.path.join(DATA_FOLDER, annot_file)
 
     if not os.path.exists(annot_path):
-        continue
+        return saved
 
     try:
-        raw = mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
-        sfreq = int(raw.info['sfreq'])
-        start_datetime = raw.info['meas_date'].replace(tzinfo=None)
-        logger.info(f"EDF {edf_path} Start:", start_datetime)
-
-        try:
-            # Optional preprocessing (EEG/EOG only)
-            raw_proc = apply_preprocessing(raw, EEG_CHANNELS, EOG_CHANNELS, config)
-        except Exception as e:
-            logger.error(f"Failed to preprocess data for subject {edf_file} , error: {e}")
-
-        # Read annotations
-        with open(annot_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()[1:]
-        annotations = []
-        for line in lines:
-            parts = line.strip().split("\t")
-            if len(parts) == 6:
-                stage, _, _, start, stop, _ = parts
-                annotations.append((stage, start, stop))
-
-        parsed_epochs = []
-        for stage, start_str, stop_str in annotations:
-            if stage in SLEEP_STAGES:
-                try:
-                    start_clock = datetime.strptime(start_str, fmt).time()
-                    stop_clock = datetime.strptime(stop_str, fmt).time()
-
-                    start_time = datetime.combine(start_datetime.date(), start_clock)
-                    stop_time = datetime.combine(start_datetime.date(), stop_clock)
-
-                    # Handle midnight crossing
-                    if stop_time < start_time:
-                        stop_time += timedelta(days=1)
-                    if start_time < start_datetime:
-                        start_time += timedelta(days=1)
-                        stop_time += timedelta(days=1)
-
-                    start_sec = (start_time - start_datetime).total_seconds()
-                    stop_sec = (stop_time - start_datetime).total_seconds()
-
-                    parsed_epochs.append((stage, start_sec, stop_sec))
-                except Exception as e:
-                    logger.error(f"Annotation parse error: {e}")
-
-        # Perform time-resolved CCA
-        stage_to_results = {stage: [] for stage in SLEEP_STAGES}
-        for stage, start, stop in parsed_epochs:
-            t = start
-            while t + WINDOW_LENGTH <= stop:
-                start_sample = round(t * sfreq)
-                stop_sample = round((t + WINDOW_LENGTH) * sfreq)
-
-                if start_sample < 0 or stop_sample > raw.n_times:
-                    t += STEP_LENGTH
-                    continue    
-
-                try:
-                    eeg = raw_proc.get_data(picks=EEG_CHANNELS, start=start_sample, stop=stop_sample)
-                    eog = raw_proc.get_data(picks=EOG_CHANNELS, start=start_sample, stop=stop_sample)
-                    X = eeg.T
-                    Y = eog.T
-
-                    min_len = min(len(X), len(Y))
-                    X = X[:min_len]
-                    Y = Y[:min_len]
-
-                    cca = CCA(n_components=2)
-                    X_c, Y_c = cca.fit_transform(X, Y)
-
-                    # Compute canonical correlation coefficients
-                    corr1 = np.corrcoef(X_c[:, 0], Y_c[:, 0])[0, 1]
-                    corr2 = np.corrcoef(X_c[:, 1], Y_c[:, 1])[0, 1]
-
-                    # Compute summary statistics
-                    stage_to_results[stage].append({
-                        "time_sec": t,
-                        "cca_corr1": corr1,
-                        "cca_corr2": corr2,
-                        "subject": edf_file.replace(".edf", ""),
-                        "stage": stage
-                    })
-
-                except Exception as e:
-                    logger.error(f"CCA failed in {edf_file} stage {stage} at t={t}: {e}")
-                t += STEP_LENGTH
-
-            # Save results
-            for stage, results in stage_to_results.items():
-                if results:
-                    df_out = pd.DataFrame(results)
-                    file_prefix = f"{edf_file.replace('.edf','')}_{stage}_cca_timeseries.csv"
-                    df_out.to_csv(os.path.join(OUTPUT_FOLDER, file_prefix), index=False)
-                    logger.info(f"Saved CCA timeseries for {edf_file} stage {stage}")
+        # Filtered EEG/EOG (decoded channel-selectively, served from the preproc cache when enabled)
+        if raw_proc is None:
+            raw_proc = load_preprocessed(edf_path, EEG_CHANNELS, EOG_CHANNELS, config)
+        sfreq = int(raw_proc.info['sfreq'])
+        logger.info(f"EDF {edf_path} Start:", raw_proc.info['meas_date'])
+        hypnogram = load_hypnogram(annot_path, raw_proc.info['meas_date'], sfreq, SLEEP_STAGES, HYPNOGRAM_CACHE)
+        parsed_epochs = hypnogram_epochs(hypnogram, SLEEP_STAGES, sfreq)
+
+        # Perform time-resolved CCA: one signal read, all windows solved as one batch
+        X = raw_proc.get_data(picks=EEG_CHANNELS).T
+        Y = raw_proc.get_data(picks=EOG_CHANNELS).T
+        min_len = min(len(X), len(Y))
+        X = X[:min_len]
+        Y = Y[:min_len]
+
+        # Prefix-sum chunk sized to the memory budget (float64 outer products and their cumulative sums)
+        d = X.shape[1] + Y.shape[1]
+        chunk = rows_within(MEMORY_BUDGET, 8 * (2 * d * d + 2 * d), DEFAULT_CHUNK)
+
+        stages, times, starts, stops = window_bounds(parsed_epochs, sfreq, raw_proc.n_times, WINDOW_LENGTH, STEP_LENGTH)
+        subject = edf_file.replace(".edf", "")
+        with timer("time_resolved_cca.cca", items=len(starts), subject=subject):
+            rho = windowed_cca(X, Y, starts, stops, n_components=N_COMPONENTS, ridge=RIDGE, dtype=CCA_DTYPE, chunk=chunk)
+
+        # Surrogate null of every window; the seed depends on the subject only, so reruns are reproducible
+        if SURROGATES != "none":
+            rng = np.random.default_rng([SURROGATE_SEED, zlib.crc32(subject.encode())])
+            with timer("time_resolved_cca.surrogates", items=len(starts), subject=subject, method=SURROGATES):
+                pvals, null_mean = surrogate_null(X, Y, starts, stops, rho, method=SURROGATES, n_surrogates=N_SURROGATES,
+                                                  min_shift=int(MIN_SHIFT_SEC * sfreq), n_components=N_COMPONENTS,
+                                                  ridge=RIDGE, dtype=CCA_DTYPE, rng=rng, budget=MEMORY_BUDGET)
+
+        # Buffer per-stage series, write the subject once
+        writer = SubjectWriter(OUTPUT_FOLDER, TIMESERIES, subject)
+        stages, times = np.asarray(stages), np.asarray(times, dtype=np.float64)
+        failed = np.isnan(rho).any(axis=1)
+        for stage in SLEEP_STAGES:
+            bad = failed & (stages == stage)
+            if bad.any():
+                WINDOW_ERRORS.add((edf_file, stage), "CCA failed in %s stage %s at t=%s: degenerate window covariance",
+                                  edf_file, stage, times[bad][0], count=int(bad.sum()))
+            sel = (stages == stage) & ~failed
+            if not sel.any():
+                continue
+            columns = {"time_sec": times[sel]}
+            columns.update({f"cca_corr{k+1}": rho[sel, k] for k in range(rho.shape[1])})
+            if SURROGATES != "none":
+                for k in range(rho.shape[1]):
+                    columns[f"cca_corr{k+1}_pval"] = pvals[sel, k]
+                    columns[f"cca_corr{k+1}_null"] = null_mean[sel, k]
+                    columns[f"cca_corr{k+1}_corrected"] = rho[sel, k] - null_mean[sel, k]
+            writer.add(stage, columns, dtypes={"time_sec": np.float64})
+        saved = writer.flush()
+        for path in saved:
+            logger.info(f"Saved CCA timeseries {path}")
+
+        # Window/step sweep on the same loaded signal
+        if SWEEP_WINDOWS and SWEEP_STEPS:
+            saved += sweep_subject(X, Y, parsed_epochs, sfreq, raw_proc.n_times, subject, chunk)
+        memory_snapshot("time_resolved_cca.subject", subject=subject)
 
     except Exception as e:
         logger.error(f"Failed on {edf_file}: {e}")
-
     finally:
-        raw_proc._data = None  # Detach memory-mapped data if present
-        raw_proc.set_annotations(None)  # Clear MNE annotations    
-        del raw_proc
-        gc.collect() # Clean up memory
+        WINDOW_ERRORS.flush()
+
+    return saved
+
+def sweep_subject(X, Y, parsed_epochs, sfreq, n_times, subject, chunk=DEFAULT_CHUNK):
+    """All window/step combinations of one loaded recording, written as the subject's sweep tables."""
+    with timer("time_resolved_cca.sweep", subject=subject) as timing:
+        stages, times, windows, steps, rho = windowed_cca_sweep(X, Y, parsed_epochs, sfreq, n_times, SWEEP_WINDOWS, SWEEP_STEPS,
+                                                                n_components=N_COMPONENTS, ridge=RIDGE, dtype=CCA_DTYPE,
+                                                                chunk=chunk)
+        timing["items"] = len(rho)
+    writer = SubjectWriter(OUTPUT_FOLDER, SWEEP, subject)
+    stages = np.asarray(stages)
+    valid = ~np.isnan(rho).any(axis=1)
+    for stage in SLEEP_STAGES:
+        sel = (stages == stage) & valid
+        if not sel.any():
+            continue
+        columns = {"window_length": windows[sel], "step_length": steps[sel], "time_sec": times[sel]}
+        columns.update({f"cca_corr{k+1}": rho[sel, k] for k in range(rho.shape[1])})
+        writer.add(stage, columns, dtypes={"window_length": np.float64, "step_length": np.float64, "time_sec": np.float64})
+    saved = writer.flush()
+    logger.info(f"Saved window/step sweep of {subject}: {int(valid.sum())} windows")
+    return saved
+
+def _checkpoint(file_pair, saved):
+    """Ledger entry for one finished subject (its per-stage timeseries files)."""
+    edf_file, annot_file = file_pair
+    if saved and LEDGER is not None:
+        LEDGER.record(os.path.join(DATA_FOLDER, edf_file), os.path.join(DATA_FOLDER, annot_file), saved)
+
+def main():
+    # Plan from the cohort manifest (EDF headers + annotations only); unusable recordings are skipped up front
+    file_pairs, costs = planned_subjects(build_manifest(config))
+    todo, todo_costs = pending_subjects(LEDGER, file_pairs, DATA_FOLDER, costs)
+
+    # One process per subject; each writes only its own <subject>_<stage> files
+    saved = map_subjects(process_subject, todo, config, costs=todo_costs, on_result=_checkpoint,
+                         preload=partial(preload_subject, config=config))
+    logger.info(f"Time-resolved CCA finished: {sum(len(s or []) for s in saved)} stage timeseries written")
+
+    # Stage-wise summary of every window/step combination
+    if SWEEP_WINDOWS and SWEEP_STEPS:
+        sweep = read_results(OUTPUT_FOLDER, SWEEP)
+        corr_cols = [c for c in sweep.columns if c.startswith("cca_corr")]
+        summary = sweep.groupby(["window_length", "step_length", "stage"])[corr_cols].agg(["mean", "std", "count"])
+        summary.columns = [f"{col}_{stat}" for col, stat in summary.columns]
+        summary_path = os.path.join(OUTPUT_FOLDER, "sweep_summary.csv")
+        summary.reset_index().to_csv(summary_path, index=False)
+        logger.info(f"Window/step sweep summary saved to {summary_path}")
+    return {}
+
+if __name__ == "__main__":
+    main()
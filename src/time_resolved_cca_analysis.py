@@ -1,64 +1,107 @@
 # time_resolved_cca_analysis.py
-from scipy.stats import entropy, skew, kurtosis
+from group_stats import factorize_groups, group_histogram, group_moments
 from config_loader import load_config
+from result_store import read_results
 from logger import logger
-from glob import glob
 import pandas as pd
 import numpy as np
 import os
 
-# Parameters
-config = load_config()
+def main(timeseries=None):
+    """Stagewise summaries, binned trajectories, entropy statistics and sample trajectories."""
+    # Parameters
+    config = load_config()
 
-OUTPUT_FOLDER = config.time_cca_params.output_dir  # "data/time_resolved_cca"
-RESULTS_FOLDER = config.time_cca_params.results_dir  # "data/time_resolved_cca_analysis"
-TRAJECTORY_BINS = config.time_cca_params.trajectory_bins # 600 
-ENTROPY_BINS = config.time_cca_params.entropy_bins # 20 
+    OUTPUT_FOLDER = config.time_cca_params.output_dir  # "data/time_resolved_cca"
+    RESULTS_FOLDER = config.time_cca_params.results_dir  # "data/time_resolved_cca_analysis"
+    TRAJECTORY_BINS = config.time_cca_params.trajectory_bins # 600 
+    ENTROPY_BINS = config.time_cca_params.entropy_bins # 20 
 
-if not os.path.exists(RESULTS_FOLDER):
-    os.makedirs(RESULTS_FOLDER)
+    if not os.path.exists(RESULTS_FOLDER):
+        os.makedirs(RESULTS_FOLDER)
 
-# Load all *_cca_timeseries.csv files
-all_files = glob(os.path.join(OUTPUT_FOLDER, "*_cca_timeseries.csv"))
-aggregated_data = pd.concat([pd.read_csv(f) for f in all_files], ignore_index=True)
+    # Load every subject x stage timeseries from the result store
+    if timeseries is None:
+        timeseries = read_results(OUTPUT_FOLDER, "timeseries", columns=["time_sec", "cca_corr1", "cca_corr2"])
+    aggregated_data = timeseries.copy()
 
-# Function 1: Stagewise mean and std of CCA1 and CCA2
-stagewise_stats = aggregated_data.groupby("stage")[["cca_corr1", "cca_corr2"]].agg(["mean", "std", "count"])
-stagewise_stats.columns = ['_'.join(col).strip() for col in stagewise_stats.columns.values]
-stagewise_stats.reset_index(inplace=True)
-stagewise_stats_path = os.path.join(RESULTS_FOLDER, "stagewise_summary.csv")
-stagewise_stats.to_csv(stagewise_stats_path, index=False)
-logger.info(f"Stagewise summary saved to {stagewise_stats_path}")
+    # Group keys are factorized once; every statistic is a bincount over the group codes
+    value_cols = ["cca_corr1", "cca_corr2"]
+    values = aggregated_data[value_cols].to_numpy(dtype=np.float64)
+    out_dtype = np.result_type(*aggregated_data[value_cols].dtypes)
 
-# Function 2: Compute temporal mean trajectories (binned over time)
-aggregated_data["time_bin"] = pd.cut(aggregated_data["time_sec"], bins=np.arange(0, aggregated_data["time_sec"].max() + TRAJECTORY_BINS, TRAJECTORY_BINS))
-trajectory = aggregated_data.groupby(["stage", "time_bin"])[["cca_corr1", "cca_corr2"]].mean().reset_index()
-trajectory_path = os.path.join(RESULTS_FOLDER, "mean_cca_trajectory_by_stage.csv")
-trajectory.to_csv(trajectory_path, index=False)
-logger.info(f"Temporal mean trajectories saved to {trajectory_path}")
+    # Function 1: Stagewise mean and std of CCA1 and CCA2
+    stage_codes, stagewise_stats = factorize_groups(aggregated_data["stage"])
+    stagewise_stats.columns = ["stage"]
+    moments = group_moments(stage_codes, len(stagewise_stats), values)
+    for i, col in enumerate(value_cols):
+        stagewise_stats[f"{col}_mean"] = moments.mean[:, i].astype(out_dtype)
+        stagewise_stats[f"{col}_std"] = moments.std(ddof=1)[:, i].astype(out_dtype)
+        stagewise_stats[f"{col}_count"] = moments.n[:, i].astype(np.int64)
+    stagewise_stats_path = os.path.join(RESULTS_FOLDER, "stagewise_summary.csv")
+    stagewise_stats.to_csv(stagewise_stats_path, index=False)
+    logger.info(f"Stagewise summary saved to {stagewise_stats_path}")
 
-# Function 3: Compute subjectwise entropy of CCA1 and CCA2 per stage
-def compute_entropy(x):
-    hist, _ = np.histogram(x, bins=ENTROPY_BINS, range=(0, 1), density=True)
-    return entropy(hist + 1e-12)  # add small value to avoid log(0)
+    # Function 2: Compute temporal mean trajectories (binned over time)
+    # Right-closed bins (a, b] over [0, max], labelled like pd.cut intervals
+    time_sec = aggregated_data["time_sec"].to_numpy(dtype=np.float64)
+    edges = np.arange(0, np.nanmax(time_sec) + TRAJECTORY_BINS, TRAJECTORY_BINS, dtype=np.float64)
+    bin_labels = np.array([f"({edges[b]}, {edges[b + 1]}]" for b in range(len(edges) - 1)], dtype=object)
+    time_bins = np.searchsorted(edges, time_sec, side="left") - 1
+    in_bin = (time_bins >= 0) & (time_bins < len(edges) - 1)
+    aggregated_data["time_bin"] = np.where(in_bin, bin_labels[np.clip(time_bins, 0, len(bin_labels) - 1)], np.nan)
 
-entropy_stats = (
-    aggregated_data.groupby(["subject", "stage"])
-    .agg({
-        "cca_corr1": [compute_entropy, np.mean, np.std, skew, kurtosis],
-        "cca_corr2": [compute_entropy, np.mean, np.std, skew, kurtosis]
-    })
-)
+    # One row per stage x bin like the categorical groupby, empty bins included (NaN means)
+    traj_stages, stage_names = pd.factorize(aggregated_data["stage"].to_numpy()[in_bin], sort=True)
+    n_bins = len(bin_labels)
+    trajectory = pd.DataFrame({"stage": np.repeat(np.asarray(stage_names, dtype=object), n_bins),
+                               "time_bin": np.tile(bin_labels, len(stage_names))})
+    traj_means = group_moments(traj_stages * n_bins + time_bins[in_bin], len(trajectory), values[in_bin])
+    for i, col in enumerate(value_cols):
+        trajectory[col] = np.where(traj_means.n[:, i] > 0, traj_means.mean[:, i], np.nan).astype(out_dtype)
+    trajectory_path = os.path.join(RESULTS_FOLDER, "mean_cca_trajectory_by_stage.csv")
+    trajectory.to_csv(trajectory_path, index=False)
+    logger.info(f"Temporal mean trajectories saved to {trajectory_path}")
 
-entropy_stats.columns = ['_'.join(col).strip() for col in entropy_stats.columns.values]
-entropy_stats.reset_index(inplace=True)
-entropy_stats_path = os.path.join(RESULTS_FOLDER, "entropy_by_subject_stage.csv")
-entropy_stats.to_csv(entropy_stats_path, index=False)
-logger.info(f"Entropy statistics saved to {entropy_stats_path}")
+    # Function 3: Compute subjectwise entropy of CCA1 and CCA2 per stage
+    group_codes, entropy_stats = factorize_groups(aggregated_data["subject"], aggregated_data["stage"])
+    entropy_stats.columns = ["subject", "stage"]
+    n_groups = len(entropy_stats)
+    moments = group_moments(group_codes, n_groups, values)
+    hist_edges = np.linspace(0, 1, ENTROPY_BINS + 1)
+    for i, col in enumerate(value_cols):
+        # Entropy of the density histogram over [0, 1] (small value added to avoid log(0))
+        counts = group_histogram(group_codes, n_groups, values[:, i], hist_edges)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            density = counts / counts.sum(axis=1, keepdims=True) / np.diff(hist_edges)
+        pk = density + 1e-12
+        pk = pk / pk.sum(axis=1, keepdims=True)
 
-# Function 4: Save a few representative trajectories
-sampled_subjects = aggregated_data["subject"].drop_duplicates().sample(3, random_state=42).tolist()
-subset = aggregated_data[aggregated_data["subject"].isin(sampled_subjects)]
-subset_path = os.path.join(RESULTS_FOLDER, "subset_trajectories.csv")
-subset.to_csv(subset_path, index=False)
-logger.info(f"Sample trajectories saved to {subset_path}")
+        entropy_stats[f"{col}_compute_entropy"] = (-(pk * np.log(pk)).sum(axis=1)).astype(out_dtype)
+        entropy_stats[f"{col}_mean"] = moments.mean[:, i].astype(out_dtype)
+        entropy_stats[f"{col}_std"] = moments.std(ddof=1)[:, i].astype(out_dtype)
+        entropy_stats[f"{col}_skew"] = moments.skewness()[:, i].astype(out_dtype)
+        entropy_stats[f"{col}_kurtosis"] = moments.kurtosis()[:, i].astype(out_dtype)
+
+    entropy_stats_path = os.path.join(RESULTS_FOLDER, "entropy_by_subject_stage.csv")
+    entropy_stats.to_csv(entropy_stats_path, index=False)
+    logger.info(f"Entropy statistics saved to {entropy_stats_path}")
+
+    # Function 4: Save a few representative trajectories
+    subjects = aggregated_data["subject"].drop_duplicates()
+    sampled_subjects = subjects.sample(min(3, len(subjects)), random_state=42).tolist()
+    subset = aggregated_data[aggregated_data["subject"].isin(sampled_subjects)]
+    subset_path = os.path.join(RESULTS_FOLDER, "subset_trajectories.csv")
+    subset.to_csv(subset_path, index=False)
+    logger.info(f"Sample trajectories saved to {subset_path}")
+
+    return {
+        "timeseries": timeseries,
+        "stagewise_summary": stagewise_stats,
+        "mean_cca_trajectory_by_stage": trajectory,
+        "entropy_by_subject_stage": entropy_stats,
+        "subset_trajectories": subset,
+    }
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,138 @@
 # time_resolved_cca_check_stationarity.py
-from statsmodels.tsa.stattools import adfuller, kpss
+from stationarity import RESULT_COLUMNS, stationarity_tests
+from annotations import hypnogram_epochs, load_hypnogram
+from manifest import build_manifest, planned_subjects
+from parallel import map_subjects, parallel_settings
+from result_store import SubjectWriter, read_results
+from preproc_cache import load_preprocessed, preload_subject
+from windowed_cca import window_bounds
 from config_loader import load_config
+from telemetry import timer
+from functools import partial
 from logger import logger
 import pandas as pd
+import numpy as np
 import os
 
-# Parameters
-config = load_config()
+RAW_STATIONARITY = "raw_stationarity" # result-store dataset of per-window raw-signal tests
 
-DATA_FOLDER = config.time_cca_params.output_dir  # "data/time_resolved_cca"
-OUTPUT_PATH = os.path.join(DATA_FOLDER, "stationarity_results.csv")
+def _settings(config):
+    params = getattr(config, "stationarity", None)
+    return {
+        "min_batch": getattr(params, "min_batch", 8) if params is not None else 8,
+        "batch_size": getattr(params, "batch_size", 256) if params is not None else 256,
+        "raw_windows": getattr(params, "raw_windows", False) if params is not None else False,
+        "raw_sfreq": getattr(params, "raw_sfreq", 128) if params is not None else 128,
+    }
 
-# List CCA timeseries files
-cca_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith("_cca_timeseries.csv")]
+def raw_window_stationarity(edf_file, annot_file, raw_proc=None, *, config):
+    """ADF/KPSS of every EEG/EOG channel inside every time-resolved CCA window of one recording."""
+    settings = _settings(config)
+    data_dir = config.data.data_dir
+    channels = list(config.data.eeg_channels) + list(config.data.eog_channels)
+    stages_all = config.data.sleep_stages
 
-results = []
+    if raw_proc is None:
+        raw_proc = load_preprocessed(os.path.join(data_dir, edf_file), config.data.eeg_channels, config.data.eog_channels, config)
+    sfreq = int(raw_proc.info['sfreq'])
+    hypnogram = load_hypnogram(os.path.join(data_dir, annot_file), raw_proc.info['meas_date'], sfreq,
+                               stages_all, getattr(config.data, "hypnogram_cache", True))
+    stages, times, starts, stops = window_bounds(hypnogram_epochs(hypnogram, stages_all, sfreq), sfreq, raw_proc.n_times,
+                                                 config.time_cca_params.window_length, config.time_cca_params.step_length)
+    if len(starts) == 0:
+        return []
 
-for fname in cca_files:
-    df = pd.read_csv(os.path.join(DATA_FOLDER, fname))
-    subject = fname.replace("_cca_timeseries.csv", "")
+    # Windows of the band-passed signal, subsampled to raw_sfreq (all the same length)
+    step = max(sfreq // settings["raw_sfreq"], 1)
+    data = raw_proc.get_data(picks=channels)
+    offsets = np.arange(0, int((stops - starts).min()), step)
 
-    for comp in ["cca_corr1", "cca_corr2"]:
-        values = df[comp].dropna().values
+    # Every channel of every window is one series; windows are cut and tested a block at a time
+    block = max(settings["batch_size"] // len(channels), 1)
+    tests = []
+    with timer("stationarity.raw_windows", items=len(starts) * len(channels), subject=edf_file):
+        for w in range(0, len(starts), block):
+            windows = data[:, starts[w:w + block, None] + offsets[None, :]].transpose(1, 0, 2)
+            tests.append(stationarity_tests(windows.reshape(-1, len(offsets)), min_batch=settings["min_batch"],
+                                            batch_size=settings["batch_size"]))
+    tests = pd.concat(tests, ignore_index=True)
 
-        if len(values) < 10:
-            continue  # too few values to test
+    writer = SubjectWriter(config.time_cca_params.output_dir, RAW_STATIONARITY, edf_file.replace(".edf", ""))
+    stages = np.repeat(np.asarray(stages), len(channels))
+    columns = {
+        "time_sec": np.repeat(np.asarray(times, dtype=np.float64), len(channels)),
+        "channel": np.tile(np.asarray(channels, dtype=object), len(starts)),
+        **{col: tests[col].to_numpy() for col in RESULT_COLUMNS},
+    }
+    for stage in stages_all:
+        sel = stages == stage
+        if sel.any():
+            writer.add(stage, {name: values[sel] for name, values in columns.items()},
+                       dtype=np.float64)
+    return writer.flush()
 
-        # ADF Test
-        adf_stat, adf_pval, _, _, _, _ = adfuller(values)
+def main(timeseries=None):
+    """ADF/KPSS stationarity tests of every subject x stage CCA timeseries (and optionally of the raw windows)."""
+    # Parameters
+    config = load_config()
+    settings = _settings(config)
+    n_workers, blas_threads = parallel_settings(config)
 
-        # KPSS Test
-        try:
-            kpss_stat, kpss_pval, _, _ = kpss(values, regression='c')
-        except:
-            kpss_stat, kpss_pval = None, None
+    DATA_FOLDER = config.time_cca_params.output_dir  # "data/time_resolved_cca"
+    OUTPUT_PATH = os.path.join(DATA_FOLDER, "stationarity_results.csv")
+    RAW_SUMMARY_PATH = os.path.join(DATA_FOLDER, "raw_stationarity_summary.csv")
 
-        results.append({
-            "subject": subject,
-            "component": comp,
-            "adf_pval": adf_pval,
-            "adf_stationary": adf_pval < 0.05,
-            "kpss_pval": kpss_pval,
-            "kpss_stationary": kpss_pval is not None and kpss_pval > 0.05
-        })
+    # CCA timeseries of every subject x stage, from the result store
+    if timeseries is None:
+        timeseries = read_results(DATA_FOLDER, "timeseries", columns=["time_sec", "cca_corr1", "cca_corr2"])
 
-results_df = pd.DataFrame(results)
+    keys, series = [], []
+    for (subj, stage), df in timeseries.groupby(["subject", "stage"], sort=True):
+        df = df.sort_values("time_sec", kind="stable")
+        for comp in ["cca_corr1", "cca_corr2"]:
+            values = df[comp].dropna().values
+            if len(values) < 10:
+                continue  # too few values to test
+            keys.append((f"{subj}_{stage}", comp))
+            series.append(values)
 
-# Save results to CSV
-results_df.to_csv(OUTPUT_PATH, index=False)
-logger.info(f"Stationarity results saved to {OUTPUT_PATH}")
+    # Stage series have different lengths: mostly the statsmodels fallback, run in the process pool
+    with timer("stationarity.tests", items=len(series)):
+        tests = stationarity_tests(series, min_batch=settings["min_batch"], batch_size=settings["batch_size"],
+                                   n_workers=n_workers, blas_threads=blas_threads)
+    results_df = pd.DataFrame({
+        "subject": [k[0] for k in keys],
+        "component": [k[1] for k in keys],
+        "adf_pval": tests["adf_pval"],
+        "adf_stationary": tests["adf_pval"] < 0.05,
+        "kpss_pval": tests["kpss_pval"],
+        "kpss_stationary": tests["kpss_pval"] > 0.05,
+    })
+
+    # Save results to CSV
+    results_df.to_csv(OUTPUT_PATH, index=False)
+    logger.info(f"Stationarity results saved to {OUTPUT_PATH}")
+    artifacts = {"stationarity": results_df}
+
+    # Local stationarity of the raw EEG/EOG inside the CCA windows (one subject per worker)
+    if settings["raw_windows"]:
+        file_pairs, costs = planned_subjects(build_manifest(config))
+        map_subjects(partial(raw_window_stationarity, config=config), file_pairs, config, costs=costs,
+                     preload=partial(preload_subject, config=config))
+
+        raw = read_results(DATA_FOLDER, RAW_STATIONARITY, columns=["channel", "adf_pval", "kpss_pval"])
+        raw["adf_stationary"] = raw["adf_pval"] < 0.05
+        raw["kpss_stationary"] = raw["kpss_pval"] > 0.05
+        raw_summary = (raw.groupby(["stage", "channel"])
+                       .agg(n_windows=("adf_pval", "size"),
+                            adf_stationary_rate=("adf_stationary", "mean"),
+                            kpss_stationary_rate=("kpss_stationary", "mean"))
+                       .reset_index())
+        raw_summary.to_csv(RAW_SUMMARY_PATH, index=False)
+        logger.info(f"Raw-window stationarity summary saved to {RAW_SUMMARY_PATH}")
+        artifacts["raw_stationarity_summary"] = raw_summary
+
+    return artifacts
+
+if __name__ == "__main__":
+    main()
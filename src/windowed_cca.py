@@ -0,0 +1,140 @@
+# windowed_cca.py
+"""
+Batched sliding-window CCA.
+
+Cumulative sums of the first and second moments of the stacked [EEG, EOG] signal
+are built once per recording, so every window's Cxx/Cyy/Cxy blocks are read as a
+difference of two prefix rows. All windows are then solved as one stacked batch.
+"""
+from cca_engine import canonical_correlations
+import numpy as np
+
+DEFAULT_CHUNK = 1 << 16 # samples per cumulative-sum chunk
+
+def prefix_moments(Z, boundaries, chunk=DEFAULT_CHUNK, shift=None):
+    """
+    Cumulative first/second moments of Z - shift (n_samples, n_features) evaluated at
+    the sample indices in `boundaries` (0..n_samples). Returns (S1, S2) with shapes
+    (n_boundaries, n_features) and (n_boundaries, n_features, n_features).
+    Z may be float32; one float64 chunk of outer products is held in memory at a time.
+    """
+    n, d = Z.shape
+    boundaries = np.asarray(boundaries, dtype=np.int64)
+    order = np.argsort(boundaries, kind="stable")
+    sorted_b = boundaries[order]
+
+    S1 = np.zeros((len(boundaries), d))
+    S2 = np.zeros((len(boundaries), d, d))
+
+    shift = np.zeros(d) if shift is None else shift
+    run1 = np.zeros(d)
+    run2 = np.zeros((d, d))
+    pos = 0  # index into sorted_b
+
+    # Boundaries at 0 stay zero
+    while pos < len(sorted_b) and sorted_b[pos] <= 0:
+        pos += 1
+
+    for c0 in range(0, n, chunk):
+        if pos >= len(sorted_b):
+            break
+        c1 = min(c0 + chunk, n)
+        z = np.asarray(Z[c0:c1], dtype=np.float64) - shift
+
+        # boundaries that fall inside (c0, c1]
+        hi = np.searchsorted(sorted_b, c1, side="right")
+        if hi > pos:
+            local = sorted_b[pos:hi] - c0 - 1  # last included row in this chunk
+            c1_cum = np.cumsum(z, axis=0)
+            c2_cum = np.cumsum(z[:, :, None] * z[:, None, :], axis=0)
+            S1[order[pos:hi]] = run1 + c1_cum[local]
+            S2[order[pos:hi]] = run2 + c2_cum[local]
+            run1 = run1 + c1_cum[-1]
+            run2 = run2 + c2_cum[-1]
+            pos = hi
+        else:
+            run1 = run1 + z.sum(axis=0)
+            run2 = run2 + z.T @ z
+
+    return S1, S2
+
+def window_covariances(X, Y, starts, stops, chunk=DEFAULT_CHUNK):
+    """
+    Sample covariance blocks for every [start, stop) window of X (n, p) and Y (n, q).
+    Returns Cxx (w, p, p), Cyy (w, q, q), Cxy (w, p, q).
+    """
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    p = X.shape[1]
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+
+    # Center globally so the second-moment differences do not cancel catastrophically;
+    # the float64 means are subtracted chunk by chunk, so Z keeps the signal dtype
+    Z = np.hstack([X, Y])
+    S1, S2 = prefix_moments(Z, np.concatenate([starts, stops]), chunk=chunk, shift=Z.mean(axis=0, dtype=np.float64))
+    w = len(starts)
+    n = (stops - starts).astype(np.float64)[:, None]
+    s1 = S1[w:] - S1[:w]
+    s2 = S2[w:] - S2[:w]
+
+    mean = s1 / n
+    C = (s2 - n[:, :, None] * mean[:, :, None] * mean[:, None, :]) / (n[:, :, None] - 1.0)
+    return C[:, :p, :p], C[:, p:, p:], C[:, :p, p:]
+
+def window_bounds(epochs, sfreq, n_times, window_length, step_length):
+    """
+    Sliding windows inside each (stage, start_sec, stop_sec) epoch, reproducing the
+    original per-window loop: t advances by `step_length` while t + window <= stop,
+    and windows running past the recording are skipped.
+    Returns (stages, times, starts, stops).
+    """
+    stages, times, starts, stops = [], [], [], []
+    for stage, start, stop in epochs:
+        n_win = int(np.floor((stop - start - window_length) / step_length + 1e-9)) + 1
+        if n_win <= 0:
+            continue
+        t = start + step_length * np.arange(n_win)
+        t = t[t + window_length <= stop]
+        s0 = np.round(t * sfreq).astype(np.int64)
+        s1 = np.round((t + window_length) * sfreq).astype(np.int64)
+        ok = (s0 >= 0) & (s1 <= n_times)
+        stages.extend([stage] * int(ok.sum()))
+        times.append(t[ok])
+        starts.append(s0[ok])
+        stops.append(s1[ok])
+
+    if not times:
+        empty = np.zeros(0, dtype=np.int64)
+        return [], np.zeros(0), empty, empty
+    return stages, np.concatenate(times), np.concatenate(starts), np.concatenate(stops)
+
+def windowed_cca(X, Y, starts, stops, n_components=2, ridge=0.0, dtype=np.float64, chunk=DEFAULT_CHUNK):
+    """Canonical correlations (n_windows, n_components) for every [start, stop) window."""
+    if len(starts) == 0:
+        return np.zeros((0, n_components))
+    Cxx, Cyy, Cxy = window_covariances(X, Y, starts, stops, chunk=chunk)
+    return canonical_correlations(Cxx, Cyy, Cxy, n_components=n_components, ridge=ridge, dtype=dtype)
+
+def windowed_cca_sweep(X, Y, epochs, sfreq, n_times, window_lengths, step_lengths, n_components=2,
+                       ridge=0.0, dtype=np.float64, chunk=DEFAULT_CHUNK):
+    """
+    Windowed CCA for every (window_length, step_length) combination of one recording.
+    The prefix moments are accumulated once over the windows of all combinations and
+    every window is solved in the same batch.
+    Returns (stages, times, windows, steps, rho) with one row per window.
+    """
+    stages, times, windows, steps, starts, stops = [], [], [], [], [], []
+    for window_length in window_lengths:
+        for step_length in step_lengths:
+            s, t, a, b = window_bounds(epochs, sfreq, n_times, window_length, step_length)
+            stages.extend(s)
+            times.append(t)
+            windows.append(np.full(len(t), float(window_length)))
+            steps.append(np.full(len(t), float(step_length)))
+            starts.append(a)
+            stops.append(b)
+
+    rho = windowed_cca(X, Y, np.concatenate(starts), np.concatenate(stops), n_components=n_components,
+                       ridge=ridge, dtype=dtype, chunk=chunk)
+    return stages, np.concatenate(times), np.concatenate(windows), np.concatenate(steps), rho
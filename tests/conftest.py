@@ -0,0 +1,27 @@
+# conftest.py
+"""Shared fixtures: a short synthetic PSG recording (EDF + .annot) on disk."""
+from synthetic_psg import write_recording
+import numpy as np
+import os
+import pytest
+
+EEG_CHANNELS = ["C3_M2", "C4_M1", "O1_M2", "O2_M1"]
+EOG_CHANNELS = ["LOC", "ROC"]
+SFREQ = 128
+
+@pytest.fixture(scope="session")
+def recording(tmp_path_factory):
+    """(edf_path, annot_path) of a 10 min, 128 Hz recording with two extra channels."""
+    data_dir = tmp_path_factory.mktemp("psg")
+    edf_path, annot_path = str(data_dir / "rec.edf"), str(data_dir / "rec.annot")
+    write_recording(edf_path, annot_path, 600, SFREQ, EEG_CHANNELS, EOG_CHANNELS, ["ECG", "EMG"],
+                    rng=np.random.default_rng(0), chunk_sec=120)
+    return edf_path, annot_path
+
+def make_config(**overrides):
+    """The repository config with dotted-key overrides, e.g. make_config(**{"cache.enabled": True})."""
+    from config_loader import load_config
+    from omegaconf import OmegaConf
+    config_path = os.path.join(os.path.dirname(__file__), "..", "src", "config", "config.yaml")
+    return OmegaConf.merge(load_config(config_path),
+                           OmegaConf.from_dotlist([f"{k}={v}" for k, v in overrides.items()]))
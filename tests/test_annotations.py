@@ -0,0 +1,102 @@
+# test_annotations.py
+"""Annotation parsing and the on-disk hypnogram cache."""
+from annotations import clock_seconds, hypnogram_epochs, load_hypnogram, parse_hypnogram
+from synthetic_psg import START, _write_annot
+from datetime import datetime, timedelta
+import numpy as np
+import glob
+import os
+
+STAGES = ["W", "N1", "N2", "N3", "R"]
+
+def _annot(tmp_path, n_epochs=40, seed=0):
+    codes = np.random.default_rng(seed).integers(0, len(STAGES), n_epochs)
+    annot_path = str(tmp_path / "rec.annot")
+    _write_annot(annot_path, codes, STAGES, START)
+    return annot_path, codes
+
+def test_clock_seconds_matches_strptime():
+    clocks = ["00:00:00", "23:59:59", "12:34:56.5", "01:02:03.000250", "7:05:00", "25:00:00", "bad"]
+    expected = []
+    for c in clocks:
+        for fmt in ("%H:%M:%S", "%H:%M:%S.%f"):
+            try:
+                t = datetime.strptime(c, fmt).time()
+                expected.append(t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6)
+                break
+            except ValueError:
+                continue
+        else:
+            expected.append(np.nan)
+    np.testing.assert_allclose(clock_seconds(clocks), expected)
+
+def _reference_epochs(annot_path, start_datetime, stages):
+    # The original per-line strptime parser of the CCA scripts
+    with open(annot_path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.readlines()[1:]
+    epochs = []
+    for line in lines:
+        parts = line.strip().split("\t")
+        if len(parts) != 6 or parts[0] not in stages:
+            continue
+        stage, _, _, start_str, stop_str, _ = parts
+        try:
+            start_clock = datetime.strptime(start_str, "%H:%M:%S").time()
+            stop_clock = datetime.strptime(stop_str, "%H:%M:%S").time()
+        except ValueError:
+            continue
+        start_time = datetime.combine(start_datetime.date(), start_clock)
+        stop_time = datetime.combine(start_datetime.date(), stop_clock)
+        if stop_time < start_time:
+            stop_time += timedelta(days=1)
+        if start_time < start_datetime:
+            start_time += timedelta(days=1)
+            stop_time += timedelta(days=1)
+        epochs.append((stage, (start_time - start_datetime).total_seconds(), (stop_time - start_datetime).total_seconds()))
+    return epochs
+
+def test_parse_hypnogram_matches_original_parser(tmp_path):
+    annot_path = str(tmp_path / "messy.annot")
+    rows = ["W\t0\tx\t22:29:50\t22:30:20\t30",     # starts before the recording: next day
+            "N1\t1\tx\t22:30:20\t22:30:50\t30",
+            "Lights\t2\tx\t22:30:50\t22:31:20\t30",  # not a sleep stage
+            "N2\t3\tx\t23:59:45\t00:00:15\t30",     # crosses midnight
+            "N3\t4\tx\t00:00:15\t00:00:45\t30",
+            "R\t5\tx\t00:00:45\t00:01:15",           # 5 columns
+            "R\t6\tx\t0x:01:15\t00:01:45\t30",      # unparseable
+            "R\t7\tx\t01:00:00\t01:00:30\t30"]
+    with open(annot_path, "w", encoding="utf-8") as f:
+        f.write("stage\tepoch\tsource\tstart\tstop\tduration\n" + "\n".join(rows) + "\n")
+    meas_date = datetime(2020, 1, 1, 22, 30, 0, 250000)
+    got = hypnogram_epochs(parse_hypnogram(annot_path, meas_date, 1000.0, STAGES), STAGES, 1000.0)
+    want = _reference_epochs(annot_path, meas_date, STAGES)
+    assert [g[0] for g in got] == [w[0] for w in want]
+    np.testing.assert_allclose([g[1:] for g in got], [w[1:] for w in want], atol=1e-3)
+
+def test_parse_hypnogram_crosses_midnight(tmp_path):
+    # START is 22:30, so 3 h of 30 s epochs run past midnight
+    annot_path, codes = _annot(tmp_path, n_epochs=360)
+    hyp = parse_hypnogram(annot_path, START, 100.0, STAGES)
+    np.testing.assert_array_equal(hyp["stage"], codes)
+    np.testing.assert_array_equal(hyp["start_sample"], np.arange(360) * 3000)
+    np.testing.assert_array_equal(hyp["stop_sample"], np.arange(1, 361) * 3000)
+
+def test_hypnogram_cache_is_shared_across_rates(tmp_path):
+    annot_path, _ = _annot(tmp_path)
+    for sfreq in (256.0, 128.0, 256.0, 100.0):
+        cached = load_hypnogram(annot_path, START, sfreq, STAGES)
+        np.testing.assert_array_equal(cached, parse_hypnogram(annot_path, START, sfreq, STAGES))
+    assert len(glob.glob(str(tmp_path / "rec.hypno-*.npy"))) == 1
+
+def test_hypnogram_cache_invalidated_by_annotation_change(tmp_path):
+    annot_path, _ = _annot(tmp_path, seed=0)
+    load_hypnogram(annot_path, START, 128.0, STAGES)
+    load_hypnogram(annot_path, START, 128.0, STAGES[:3])  # another stage list is kept next to it
+    assert len(glob.glob(str(tmp_path / "rec.hypno-*.npy"))) == 2
+
+    _, codes = _annot(tmp_path, n_epochs=50, seed=1)
+    st = os.stat(annot_path)
+    os.utime(annot_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    hyp = load_hypnogram(annot_path, START, 128.0, STAGES)
+    np.testing.assert_array_equal(hyp["stage"], codes)
+    assert len(glob.glob(str(tmp_path / "rec.hypno-*.npy"))) == 1
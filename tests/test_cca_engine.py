@@ -0,0 +1,60 @@
+# test_cca_engine.py
+"""Closed-form CCA against scikit-learn's iterative CCA."""
+from sklearn.cross_decomposition import CCA
+from cca_engine import MomentAccumulator, canonical_correlations, covariance_blocks, fit_cca_data
+import numpy as np
+import pytest
+
+def _coupled(n, p, q, n_latent, seed):
+    # Latents of decreasing strength shared by X and Y; channels on very different scales
+    rng = np.random.default_rng(seed)
+    latent = rng.standard_normal((n, n_latent)) * np.linspace(1.5, 0.6, n_latent)
+    X = rng.standard_normal((n, p)) + latent @ rng.standard_normal((n_latent, p))
+    Y = rng.standard_normal((n, q)) + latent @ rng.standard_normal((n_latent, q))
+    return X * rng.uniform(0.5, 5.0, p), Y * rng.uniform(0.5, 5.0, q)
+
+def _align_signs(ref, other):
+    return other * np.sign(np.sum(ref * other, axis=0))
+
+@pytest.mark.parametrize("n_components", [2, 3])
+def test_fit_cca_matches_sklearn(n_components):
+    X, Y = _coupled(4000, 6, 4, 3, seed=n_components)
+    x_ref, y_ref = CCA(n_components=n_components, max_iter=5000, tol=1e-12).fit_transform(X, Y)
+    result = fit_cca_data(X, Y, n_components=n_components)
+
+    # Same projections (scale included) up to the sign of each component
+    np.testing.assert_allclose(_align_signs(x_ref, result["X_c"]), x_ref, atol=1e-4)
+    np.testing.assert_allclose(_align_signs(y_ref, result["Y_c"]), y_ref, atol=1e-4)
+    rho_ref = [np.corrcoef(x_ref[:, k], y_ref[:, k])[0, 1] for k in range(n_components)]
+    np.testing.assert_allclose(result["correlations"], rho_ref, atol=1e-6)
+
+def test_batched_correlations_match_single_fits():
+    blocks = [covariance_blocks(*_coupled(500, 5, 3, 2, seed))[2:] for seed in range(4)]
+    Cxx, Cyy, Cxy = (np.stack(b) for b in zip(*blocks))
+    batched = canonical_correlations(Cxx, Cyy, Cxy, n_components=3)
+    for i, (cxx, cyy, cxy) in enumerate(blocks):
+        np.testing.assert_allclose(batched[i], canonical_correlations(cxx, cyy, cxy, n_components=3), atol=1e-12)
+
+def test_moment_accumulator_matches_single_pass():
+    X, Y = _coupled(3001, 5, 3, 2, seed=7)
+    X += 1e3  # offset: the pairwise update must not lose precision to large means
+    ref = covariance_blocks(X, Y)
+
+    # Uneven chunks, streamed and merged from two halves
+    cuts = [0, 1, 17, 900, 2000, 3001]
+    stream = MomentAccumulator(5, 3)
+    halves = [MomentAccumulator(5, 3), MomentAccumulator(5, 3)]
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        stream.update(X[a:b], Y[a:b])
+        halves[a >= 900].update(X[a:b], Y[a:b])
+    merged = halves[0].merge(halves[1])
+    for acc in (stream, merged):
+        for got, want in zip(acc.covariance_blocks(), ref):
+            np.testing.assert_allclose(got, want, rtol=1e-10, atol=1e-9)
+
+def test_moment_accumulator_empty_merge_and_too_few_samples():
+    acc = MomentAccumulator(2, 1).merge(MomentAccumulator(2, 1))
+    acc.update(np.zeros((0, 2)), np.zeros((0, 1)))
+    assert acc.n == 0
+    with pytest.raises(ValueError):
+        acc.update(np.ones((1, 2)), np.ones((1, 1))).covariance_blocks()
@@ -0,0 +1,39 @@
+# test_edf_reader.py
+"""Channel-selective memory-mapped EDF reader against MNE's reader."""
+from conftest import EEG_CHANNELS, EOG_CHANNELS, SFREQ
+from edf_reader import EdfReader, load_recording, read_edf_header
+from omegaconf import OmegaConf
+import numpy as np
+import mne
+import pytest
+
+def test_header(recording):
+    header = read_edf_header(recording[0])
+    assert header["labels"] == EEG_CHANNELS + EOG_CHANNELS + ["ECG", "EMG"]
+    assert header["n_records"] == 600 and header["record_duration"] == 1.0
+
+def test_get_data_matches_mne(recording):
+    ref = mne.io.read_raw_edf(recording[0], preload=True, verbose=False)
+    reader = EdfReader(recording[0], channels=EOG_CHANNELS + ["C4_M1"])
+    assert reader.sfreq == SFREQ and reader.n_times == ref.n_times
+    assert reader.info["meas_date"] == ref.info["meas_date"]
+    # Slices starting and ending inside a data record
+    for start, stop in [(0, None), (5, 6), (SFREQ - 3, 7 * SFREQ + 11), (ref.n_times - 40, ref.n_times + 100)]:
+        got = reader.get_data(["ROC", "C4_M1"], start=start, stop=stop)
+        want = ref.get_data(picks=["ROC", "C4_M1"], start=start, stop=stop)
+        np.testing.assert_allclose(got, want, rtol=1e-12, atol=1e-15)
+    assert reader.get_data(["LOC"], start=10, stop=10).shape == (1, 0)
+
+def test_unselected_or_missing_channels(recording):
+    reader = EdfReader(recording[0], channels=["LOC"])
+    with pytest.raises(ValueError):
+        reader.get_data(["ROC"])
+    with pytest.raises(ValueError):
+        EdfReader(recording[0], channels=["LOC", "NOPE"])
+
+def test_load_recording_only_requested_channels(recording):
+    cfg = OmegaConf.create({"data": {"reader": "mmap"}})
+    raw = load_recording(recording[0], EEG_CHANNELS + ["NOPE"], cfg)
+    assert raw.ch_names == EEG_CHANNELS
+    ref = mne.io.read_raw_edf(recording[0], preload=True, verbose=False)
+    np.testing.assert_allclose(raw.get_data(), ref.get_data(picks=EEG_CHANNELS), rtol=1e-12, atol=1e-15)
@@ -0,0 +1,87 @@
+# test_filtering.py
+"""Fused notch + band-pass filters against MNE, and the anti-aliased resamplers."""
+from filtering import (StreamDecimator, design_filter, fused_filter, polyphase_resample, resample_ratio,
+                       resampled_length)
+from scipy import signal
+import numpy as np
+import mne
+import pytest
+
+@pytest.mark.parametrize("sfreq, hp, lp", [(128.0, 0.3, 35.0), (256.0, 0.1, 10.0), (200.0, 0.5, 30.0)])
+def test_fft_backend_matches_mne_filter_data(sfreq, hp, lp):
+    # The line frequency is above lp, so the fused kernel is MNE's firwin band-pass
+    x = np.random.default_rng(0).standard_normal((3, int(sfreq * 200))) * 1e-5
+    want = mne.filter.filter_data(x, sfreq, hp, lp, method="fir", phase="zero", fir_design="firwin", verbose=False)
+    np.testing.assert_allclose(fused_filter(x, sfreq, hp, lp, 60.0, method="fft"), want, rtol=0, atol=1e-12 * np.abs(want).max())
+    np.testing.assert_allclose(design_filter(sfreq, hp, lp, 60.0, "fft"),
+                               mne.filter.create_filter(x, sfreq, hp, lp, fir_design="firwin", verbose=False), atol=1e-15)
+
+def test_iir_backend_matches_mne_butterworth():
+    sfreq = 256.0
+    x = np.random.default_rng(1).standard_normal((2, int(sfreq * 300)))
+    want = mne.filter.filter_data(x, sfreq, 0.3, 35.0, method="iir",
+                                  iir_params=dict(order=4, ftype="butter", output="sos"), verbose=False)
+    # Edge handling differs; the 0.3 Hz high-pass transient has died out after 60 s
+    inner = slice(int(60 * sfreq), -int(60 * sfreq))
+    np.testing.assert_allclose(fused_filter(x, sfreq, 0.3, 35.0, None, method="iir")[:, inner], want[:, inner],
+                               atol=1e-9 * np.abs(want).max())
+
+@pytest.mark.parametrize("method", ["fft", "iir"])
+def test_line_noise_inside_the_band_is_removed(method):
+    sfreq, n = 512.0, 512 * 120
+    t = np.arange(n) / sfreq
+    clean = np.sin(2 * np.pi * 10.0 * t)
+    out = fused_filter(clean + np.sin(2 * np.pi * 50.0 * t) + 0.5 * np.sin(2 * np.pi * 100.0 * t),
+                       sfreq, 0.3, 120.0, 50.0, method=method)
+    inner = slice(10 * 512, -10 * 512)
+    assert np.abs(out[inner] - clean[inner]).max() < 0.02
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        fused_filter(np.zeros((1, 100)), 100.0, 0.3, 30.0, None, method="fir")
+
+@pytest.mark.parametrize("factor, n", [(4, 1000), (5, 999), (1, 37), (4, 81), (4, 30)])
+def test_stream_decimator_blocks_match_one_shot_filtering(factor, n):
+    x = np.random.default_rng(2).standard_normal((n, 3))
+    decimator = StreamDecimator(factor)
+    out = np.vstack([np.zeros((0, 3))] + [decimator.update(x[a:a + 77]) for a in range(0, n, 77)])
+
+    # Centered kernel at every factor-th sample whose window lies inside the stream
+    half = decimator.half
+    centers = range(half, n - half, factor)
+    want = np.array([decimator.kernel @ x[j - half:j + half + 1] for j in centers]).reshape(-1, 3)
+    assert len(out) == len(centers)
+    np.testing.assert_allclose(out, want, atol=1e-12)
+
+def test_stream_decimator_suppresses_aliases():
+    sfreq, factor = 128.0, 4
+    t = np.arange(128 * 60) / sfreq
+    kept, alias = np.sin(2 * np.pi * 3.0 * t), np.sin(2 * np.pi * 29.0 * t)  # 29 Hz folds onto 3 Hz at 32 Hz
+    decimator = StreamDecimator(factor)
+    out = decimator.update((kept + alias)[:, None])[:, 0]
+    reference = kept[decimator.half::factor][:len(out)]
+    assert np.abs(out - reference).max() < 0.01
+    assert np.abs((kept + alias)[::factor] - kept[::factor]).max() > 0.5  # plain subsampling aliases
+
+def test_stream_decimator_ends_do_not_leak_the_stop_band():
+    # Everything above the new Nyquist frequency: no output, including the first and last ones
+    t = np.arange(128 * 45) / 128.0
+    x = np.sin(2 * np.pi * 3.0 * t + 0.7)[:, None]
+    decimator = StreamDecimator(128)
+    out = np.vstack([decimator.update(x[a:a + 500]) for a in range(0, len(x), 500)])
+    assert len(out) == 45 - 2 * 10 and np.abs(out).max() < 1e-3
+
+@pytest.mark.parametrize("sfreq, target", [(256.0, 128.0), (200.0, 128.0), (100.0, 128.0), (128.0, 128.0)])
+def test_polyphase_resample_lengths_and_passband(sfreq, target):
+    n = int(sfreq * 30) + 3
+    t = np.arange(n) / sfreq
+    x = np.vstack([np.sin(2 * np.pi * 5.0 * t), np.cos(2 * np.pi * 11.0 * t)])
+    up, down = resample_ratio(sfreq, target)
+    assert up * sfreq == down * target
+    out = polyphase_resample(x, sfreq, target)
+    assert out.shape == (2, resampled_length(n, sfreq, target))
+    np.testing.assert_allclose(out, signal.resample_poly(x, up, down, axis=-1))
+    t_out = np.arange(out.shape[1]) / target
+    want = np.vstack([np.sin(2 * np.pi * 5.0 * t_out), np.cos(2 * np.pi * 11.0 * t_out)])
+    inner = slice(int(target), -int(target))
+    assert np.abs(out[:, inner] - want[:, inner]).max() < 0.01
@@ -0,0 +1,82 @@
+# test_group_stats.py
+"""Mergeable moments, sufficient-statistic ANOVA and grouped statistics against single passes."""
+from group_stats import MomentStats, factorize_groups, group_histogram, group_moments, one_way_anova
+from scipy import stats
+import pandas as pd
+import numpy as np
+
+def _samples(seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.gamma(2.0 + k, 1.0, (n, 2)) + 100.0 * k for k, n in enumerate([1, 7, 300, 5000])]
+
+def _assert_moments_equal(got, want):
+    for field in ("n", "mean", "M2", "M3", "M4"):
+        np.testing.assert_allclose(getattr(got, field), getattr(want, field), rtol=1e-9, atol=1e-9)
+
+def test_merge_matches_single_pass():
+    parts = _samples()
+    merged = MomentStats()
+    for part in parts:
+        merged.merge(MomentStats.from_values(part))
+    whole = np.vstack(parts)
+    _assert_moments_equal(merged, MomentStats.from_values(whole))
+    np.testing.assert_allclose(merged.std(ddof=1), whole.std(axis=0, ddof=1), rtol=1e-12)
+    np.testing.assert_allclose(merged.skewness(), stats.skew(whole), rtol=1e-9)
+    np.testing.assert_allclose(merged.kurtosis(), stats.kurtosis(whole), rtol=1e-9)
+
+def test_merge_is_order_independent_and_handles_empty_parts():
+    parts = _samples(1)
+    forward, backward = MomentStats(), MomentStats()
+    for part in parts:
+        forward.merge(MomentStats.from_values(part)).merge(MomentStats.from_values(np.zeros((0, 2))))
+    for part in reversed(parts):
+        backward.merge(MomentStats.from_values(part))
+    _assert_moments_equal(forward, backward)
+
+def test_from_values_skips_nan_per_column():
+    values = np.array([[1.0, np.nan], [2.0, 5.0], [4.0, np.nan]])
+    m = MomentStats.from_values(values)
+    np.testing.assert_array_equal(m.n, [3, 1])
+    np.testing.assert_allclose(m.mean, [7 / 3, 5.0])
+
+def test_anova_matches_f_oneway():
+    parts = _samples(2)
+    F, p = one_way_anova([MomentStats.from_values(part) for part in parts])
+    want = stats.f_oneway(*parts, axis=0)
+    np.testing.assert_allclose(F, want.statistic, rtol=1e-9)
+    np.testing.assert_allclose(p, want.pvalue, rtol=1e-6, atol=1e-300)
+
+def _long_table(seed=3):
+    rng = np.random.default_rng(seed)
+    n = 4000
+    df = pd.DataFrame({"subject": rng.choice(["s2", "s10", "s1"], n), "stage": rng.choice(["W", "N2", "R"], n),
+                       "cca_corr1": rng.uniform(0, 1, n), "cca_corr2": rng.uniform(0, 1, n)})
+    df.loc[rng.random(n) < 0.05, "cca_corr2"] = np.nan
+    return df[~((df["subject"] == "s10") & (df["stage"] == "R"))]  # one unobserved combination
+
+def test_factorized_groups_follow_groupby_order():
+    df = _long_table()
+    codes, keys = factorize_groups(df["subject"], df["stage"])
+    want = df.groupby(["subject", "stage"], sort=True).size()
+    assert list(map(tuple, keys.to_numpy())) == list(want.index)
+    np.testing.assert_array_equal(np.bincount(codes), want.to_numpy())
+
+def test_group_moments_match_groupby():
+    df = _long_table()
+    codes, keys = factorize_groups(df["subject"], df["stage"])
+    m = group_moments(codes, len(keys), df[["cca_corr1", "cca_corr2"]].to_numpy())
+    grouped = df.groupby(["subject", "stage"], sort=True)[["cca_corr1", "cca_corr2"]]
+    np.testing.assert_array_equal(m.n, grouped.count().to_numpy())
+    np.testing.assert_allclose(m.mean, grouped.mean().to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(m.std(ddof=1), grouped.std().to_numpy(), rtol=1e-10)
+    np.testing.assert_allclose(m.skewness(), grouped.agg(lambda x: stats.skew(x.dropna())).to_numpy(), rtol=1e-8)
+
+def test_group_histogram_matches_np_histogram():
+    df = _long_table()
+    codes, keys = factorize_groups(df["subject"], df["stage"])
+    edges = np.linspace(0.0, 0.9, 10)  # values above 0.9 fall outside, the last bin is closed
+    values = df["cca_corr2"].to_numpy()
+    counts = group_histogram(codes, len(keys), values, edges)
+    for g in range(len(keys)):
+        sel = values[codes == g]
+        np.testing.assert_array_equal(counts[g], np.histogram(sel[~np.isnan(sel)], bins=edges)[0])
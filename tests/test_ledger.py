@@ -0,0 +1,81 @@
+# test_ledger.py
+"""Per-subject completion ledger: skip unchanged subjects, redo changed ones."""
+from conftest import EEG_CHANNELS, EOG_CHANNELS, SFREQ, make_config
+from ledger import Ledger, open_ledger, pending_subjects, settings_digest
+from synthetic_psg import write_cohort
+from omegaconf import OmegaConf
+import subprocess
+import sys
+import os
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+def _subject_files(tmp_path, names=("a", "b", "c")):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for name in names:
+        (data_dir / f"{name}.edf").write_bytes(name.encode() * 100)
+        (data_dir / f"{name}.annot").write_text(f"stage\n{name}\n")
+    return str(data_dir), [(f"{name}.edf", f"{name}.annot") for name in names]
+
+def _record_all(ledger, data_dir, file_pairs, out_dir):
+    for edf_file, annot_file in file_pairs:
+        out = f"{edf_file}.csv"
+        open(os.path.join(out_dir, out), "w").close()
+        ledger.record(os.path.join(data_dir, edf_file), os.path.join(data_dir, annot_file), [out])
+
+def test_unchanged_subjects_are_skipped(tmp_path):
+    data_dir, file_pairs = _subject_files(tmp_path)
+    out_dir = str(tmp_path / "out")
+    os.makedirs(out_dir)
+    _record_all(Ledger(out_dir, "s1"), data_dir, file_pairs, out_dir)
+
+    # A fresh ledger object reads the records back
+    assert pending_subjects(Ledger(out_dir, "s1"), file_pairs, data_dir, [3, 2, 1]) == ([], [])
+
+    # Touched but identical content: still current; changed content, missing output: redone
+    os.utime(os.path.join(data_dir, "a.edf"), ns=(0, 10**9))
+    with open(os.path.join(data_dir, "b.annot"), "a") as f:
+        f.write("N2\n")
+    os.remove(os.path.join(out_dir, "c.edf.csv"))
+    assert pending_subjects(Ledger(out_dir, "s1"), file_pairs, data_dir, [3, 2, 1]) == (file_pairs[1:], [2, 1])
+
+    # Other settings: everything is redone
+    assert pending_subjects(Ledger(out_dir, "s2"), file_pairs, data_dir)[0] == file_pairs
+
+def test_settings_digest_ignores_paths_and_cache_switches():
+    cfg = make_config()
+    digest = settings_digest(cfg, ["data", "preprocess"])
+    assert digest == settings_digest(make_config(**{"data.data_dir": "x", "data.manifest_dir": "y",
+                                                    "data.hypnogram_cache": False}), ["data", "preprocess"])
+    assert digest != settings_digest(make_config(**{"preprocess.eeg.hp": 0.5}), ["data", "preprocess"])
+    assert open_ledger(make_config(**{"ledger.enabled": False}), "unused", ["data"]) is None
+
+def _run_static_cca(config_path):
+    env = dict(os.environ, BESPACE_CONFIG=config_path)
+    proc = subprocess.run([sys.executable, os.path.join(SRC, "static_cca.py")], env=env,
+                          capture_output=True, text=True, check=True)
+    return proc.stdout
+
+def test_static_cca_rerun_skips_unchanged_subjects(tmp_path):
+    data_dir = str(tmp_path / "cohort")
+    write_cohort(data_dir, 2, 300, SFREQ, EEG_CHANNELS, EOG_CHANNELS, seed=0)
+    out_dir = str(tmp_path / "static_cca")
+    cfg = make_config(**{"data.data_dir": data_dir, "data.manifest_dir": str(tmp_path / "manifest"),
+                         "ledger.enabled": True, "cache.enabled": False, "parallel.n_workers": 1,
+                         "static_cca_params.output_dir": out_dir})
+    config_path = str(tmp_path / "config.yaml")
+    OmegaConf.save(cfg, config_path)
+
+    _run_static_cca(config_path)
+    summary_path = os.path.join(out_dir, "eeg_eog_cca_summary_stats.csv")
+    parts = sorted(os.listdir(os.path.join(out_dir, "summary_parts")))
+    mtimes = {p: os.stat(os.path.join(out_dir, "summary_parts", p)).st_mtime_ns for p in parts}
+    with open(summary_path, "r", encoding="utf-8") as f:
+        summary = f.read()
+
+    log = _run_static_cca(config_path)
+    assert "2 of 2 subjects up to date, skipped" in log
+    assert {p: os.stat(os.path.join(out_dir, "summary_parts", p)).st_mtime_ns for p in parts} == mtimes
+    with open(summary_path, "r", encoding="utf-8") as f:
+        assert f.read() == summary
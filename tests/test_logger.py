@@ -0,0 +1,77 @@
+# test_logger.py
+"""Aggregated repeated messages, the dropping queue handler and lazy print-style messages."""
+from logger import RepeatedLog, _DroppingQueueHandler
+import logging
+import queue
+
+class _Recorder:
+    def __init__(self):
+        self.lines = []
+
+    def log(self, level, msg, *args):
+        self.lines.append((level, msg % args))
+
+def _record(msg, *args):
+    return logging.LogRecord("bespace", logging.INFO, __file__, 0, msg, args, None)
+
+def test_repeats_are_counted_until_flushed():
+    log = _Recorder()
+    repeated = RepeatedLog(log, interval=3600)
+    repeated.add(("s1", "N2"), "window %d failed", 1)
+    for w in range(2, 6):
+        repeated.add(("s1", "N2"), "window %d failed", w)
+    repeated.add("s2", "window %d failed", 7, count=3)
+    assert log.lines == [(logging.ERROR, "window 1 failed"), (logging.ERROR, "window 7 failed")]
+
+    repeated.flush()
+    assert log.lines[2][1].startswith("s1 N2: 4 more in ") and log.lines[2][1].endswith("s, last: window 5 failed")
+    assert log.lines[3][1].startswith("s2: 2 more in ")
+    # Flushed keys start over
+    repeated.add(("s1", "N2"), "window %d failed", 9)
+    repeated.flush()
+    assert log.lines[4:] == [(logging.ERROR, "window 9 failed")]
+
+def test_repeats_are_reported_every_interval():
+    log = _Recorder()
+    repeated = RepeatedLog(log, level=logging.WARNING, interval=0.0)
+    for w in range(3):
+        repeated.add("s1", "epoch %d skipped", w)
+    assert log.lines[0][1] == "epoch 0 skipped" and len(log.lines) == 3
+    for w, (_, line) in enumerate(log.lines[1:], 1):
+        assert line.startswith("s1: 1 more in ") and line.endswith(f"s, last: epoch {w} skipped")
+    assert all(level == logging.WARNING for level, _ in log.lines)
+    repeated.flush()
+    assert len(log.lines) == 3  # nothing left to report
+
+def test_full_queue_drops_records_and_reports_the_count():
+    handler = _DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.enqueue(_record("message %d", i))
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().getMessage() for _ in range(2)] == ["message 0", "message 1"]
+
+    handler.enqueue(_record("message %d", 5))
+    notice, record = handler.queue.get_nowait(), handler.queue.get_nowait()
+    assert notice.levelno == logging.WARNING and notice.getMessage() == "3 log records dropped (logging queue full)"
+    assert record.getMessage() == "message 5" and handler.dropped == 0
+
+def test_extra_args_are_joined_only_when_formatted():
+    class Lazy:
+        calls = 0
+
+        def __str__(self):
+            Lazy.calls += 1
+            return "lazy"
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    log = logging.getLogger("bespace.test_logger")
+    log.addHandler(handler)
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.info("subjects:", 3, Lazy())
+    log.debug("not formatted", Lazy())
+    log.info("%d%% done", 50)
+    assert Lazy.calls == 0 and len(records) == 2
+    assert [r.getMessage() for r in records] == ["subjects: 3 lazy", "50% done"]
@@ -0,0 +1,39 @@
+# test_manifest.py
+"""Cohort manifest from EDF headers and annotations."""
+from conftest import EEG_CHANNELS, EOG_CHANNELS, SFREQ, make_config
+from manifest import build_manifest, manifest_path, planned_subjects
+from synthetic_psg import write_cohort, write_recording
+import numpy as np
+import os
+
+STAGES = ["W", "N1", "N2", "N3", "R"]
+
+def test_manifest_flags_and_counts(tmp_path):
+    data_dir = tmp_path / "cohort"
+    write_cohort(str(data_dir), 2, 300, SFREQ, EEG_CHANNELS, EOG_CHANNELS, seed=3)
+    codes = write_recording(str(data_dir / "long.edf"), str(data_dir / "long.annot"), 600, SFREQ,
+                            EEG_CHANNELS, EOG_CHANNELS, rng=np.random.default_rng(1))
+    write_recording(str(data_dir / "no-roc.edf"), str(data_dir / "no-roc.annot"), 300, SFREQ,
+                    EEG_CHANNELS, ["LOC"], rng=np.random.default_rng(2))
+    write_recording(str(data_dir / "unscored.edf"), str(data_dir / "unscored.annot"), 300, SFREQ,
+                    EEG_CHANNELS, EOG_CHANNELS, rng=np.random.default_rng(4))
+    os.remove(data_dir / "unscored.annot")
+
+    cfg = make_config(**{"data.data_dir": str(data_dir), "data.manifest_dir": str(tmp_path / "manifest")})
+    manifest = build_manifest(cfg).set_index("subject")
+    assert os.path.exists(manifest_path(cfg))
+
+    assert manifest["usable"].to_dict() == {"long": True, "no-roc": False, "synthetic-0000": True,
+                                            "synthetic-0001": True, "unscored": False}
+    assert "missing channels" in manifest.loc["no-roc", "issue"]
+    assert manifest.loc["unscored", "issue"] == "missing annot"
+
+    long = manifest.loc["long"]
+    assert long["sfreq"] == SFREQ and long["n_times"] == 600 * SFREQ and long["duration_s"] == 600
+    assert [long[f"n_{s}"] for s in STAGES] == np.bincount(codes, minlength=len(STAGES)).tolist()
+    assert [long[f"dur_{s}"] for s in STAGES] == (30.0 * np.bincount(codes, minlength=len(STAGES))).tolist()
+
+    file_pairs, costs = planned_subjects(manifest.reset_index())
+    assert file_pairs == [("long.edf", "long.annot"), ("synthetic-0000.edf", "synthetic-0000.annot"),
+                          ("synthetic-0001.edf", "synthetic-0001.annot")]
+    assert costs == [600 * SFREQ, 300 * SFREQ, 300 * SFREQ]
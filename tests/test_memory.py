@@ -0,0 +1,57 @@
+# test_memory.py
+"""float32 signals against float64 results, and the memory-budget settings and chunk sizes."""
+from conftest import EEG_CHANNELS, EOG_CHANNELS, make_config
+from cca_engine import canonical_correlations, covariance_blocks
+from memory import check_fits, memory_settings, rows_within
+from preproc_cache import load_preprocessed
+import numpy as np
+import pytest
+
+def _config(**overrides):
+    return make_config(**{"cache.enabled": False, **overrides})
+
+def test_memory_settings():
+    assert memory_settings(_config()) == (np.float32, 0)
+    dtype, budget = memory_settings(_config(**{"memory.signal_dtype": "float64", "memory.budget_gb": 2,
+                                                "parallel.n_workers": 4}))
+    assert dtype == np.float64 and budget == (1 << 30) // 2  # shared by the workers
+    # One worker prefetching 2 subjects holds 4 recordings: the one analyzed, 2 queued, 1 loading
+    assert memory_settings(_config(**{"memory.budget_gb": 2, "parallel.prefetch_depth": 2}))[1] == (1 << 30) // 2
+    assert memory_settings(_config(**{"memory.budget_gb": 2, "parallel.prefetch_depth": 0}))[1] == 2 << 30
+    with pytest.raises(ValueError):
+        memory_settings(_config(**{"memory.signal_dtype": "float16"}))
+
+def test_rows_within_budget():
+    assert rows_within(0, 8, 1000) == 1000  # unlimited
+    assert rows_within(800, 8, 1000) == 100
+    assert rows_within(8000, 8, 10) == 10
+    assert rows_within(10, 8, 1000, minimum=4) == 4
+    assert check_fits(0, 1 << 40, "x") and check_fits(100, 100, "x") and not check_fits(100, 101, "x")
+
+def test_covariances_of_float32_signals_accumulate_in_float64():
+    rng = np.random.default_rng(0)
+    latent = rng.standard_normal((200000, 1))
+    X = rng.standard_normal((200000, 4)) + latent + 100.0  # offset: float32 accumulation would lose digits
+    Y = rng.standard_normal((200000, 2)) + latent
+    ref = covariance_blocks(X, Y)
+    got = covariance_blocks(X.astype(np.float32), Y.astype(np.float32), chunk=4096)
+    assert all(g.dtype == np.float64 for g in got)
+    for r, g in zip(ref[2:], got[2:]):
+        np.testing.assert_allclose(g, r, rtol=1e-5, atol=1e-6)
+    rho = [canonical_correlations(*(c[None] for c in blocks[2:]))[0] for blocks in (ref, got)]
+    np.testing.assert_allclose(rho[1], rho[0], atol=1e-6)
+
+@pytest.mark.parametrize("backend", ["fft", "iir"])
+def test_float32_and_budgeted_loading_match_float64(recording, backend):
+    reference = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS,
+                                  _config(**{"preprocess.backend": backend, "memory.signal_dtype": "float64"}))
+    single = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, _config(**{"preprocess.backend": backend}))
+    # A budget that only fits the output and one channel at a time
+    tight = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS,
+                              _config(**{"preprocess.backend": backend, "memory.budget_gb": 6e6 / (1 << 30),
+                                         "parallel.prefetch_depth": 0}))
+    data = reference.get_data()
+    assert single.get_data().dtype == np.float32 and data.dtype == np.float64
+    scale = np.abs(data).max()
+    np.testing.assert_allclose(single.get_data(), data, rtol=0, atol=1e-6 * scale)
+    np.testing.assert_array_equal(tight.get_data(), single.get_data())
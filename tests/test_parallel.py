@@ -0,0 +1,38 @@
+# test_parallel.py
+"""Subject-level process pool and single-process prefetching."""
+from parallel import map_subjects
+from omegaconf import OmegaConf
+import os
+
+PAIRS = [(f"s{i}.edf", f"s{i}.annot") for i in range(6)]
+
+def _work(edf_file, annot_file, preloaded=None):
+    if edf_file == "s3.edf":
+        raise RuntimeError("corrupt recording")
+    return (edf_file, annot_file, preloaded, os.getpid())
+
+def _preload(edf_file, annot_file):
+    return edf_file.upper()
+
+def _run(n_workers, prefetch_depth=0, preload=None):
+    cfg = OmegaConf.create({"parallel": {"n_workers": n_workers, "prefetch_depth": prefetch_depth}})
+    finished = []
+    results = map_subjects(_work, PAIRS, cfg, costs=[1, 5, 2, 9, 3, 4],
+                           on_result=lambda pair, result: finished.append(pair), preload=preload)
+    return results, finished
+
+def test_pool_keeps_input_order_and_isolates_failures():
+    results, finished = _run(n_workers=2)
+    assert [r and r[0] for r in results] == ["s0.edf", "s1.edf", "s2.edf", None, "s4.edf", "s5.edf"]
+    assert all(r is None or r[3] != os.getpid() for r in results)  # ran in workers
+    assert sorted(finished) == sorted(p for p in PAIRS if p[0] != "s3.edf")
+
+def test_serial_run_matches_pool():
+    serial, finished = _run(n_workers=1)
+    pooled, _ = _run(n_workers=2)
+    assert [r and r[:3] for r in serial] == [r and r[:3] for r in pooled]
+    assert finished == [p for p in PAIRS if p[0] != "s3.edf"]  # in order
+
+def test_prefetched_subjects_are_passed_on():
+    results, _ = _run(n_workers=1, prefetch_depth=2, preload=_preload)
+    assert [r and r[2] for r in results] == ["S0.EDF", "S1.EDF", "S2.EDF", None, "S4.EDF", "S5.EDF"]
@@ -0,0 +1,76 @@
+# test_pipeline.py
+"""In-process DAG runner: in-memory handoff and skipping of up-to-date stages."""
+from pipeline import Stage, run_pipeline
+from omegaconf import OmegaConf
+import importlib
+import json
+import sys
+import os
+
+STAGE_MODULE = '''
+import os
+CALLS = []
+
+def main(**artifacts):
+    CALLS.append(sorted(artifacts))
+    {body}
+'''
+
+def _stages(tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    bodies = {
+        "up_stage": f"open({str(out / 'up.csv')!r}, 'a').write('x')\n    return {{'table': len(CALLS)}}",
+        "down_stage": f"open({str(out / 'down.csv')!r}, 'w').write(str(artifacts))\n    return {{'report': 1}}",
+        "broken_stage": "raise RuntimeError('boom')",
+    }
+    for module, body in bodies.items():
+        (tmp_path / f"{module}.py").write_text(STAGE_MODULE.format(body=body))
+        sys.modules.pop(module, None)  # written for this test's directory
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return [
+        Stage("up", "up_stage", "run_up", always=True, outputs=lambda cfg: [str(out / "up.csv")]),
+        Stage("down", "down_stage", "run_down", deps=["up"], inputs=["table"], sections=["params"],
+              outputs=lambda cfg: [str(out / "down.csv")]),
+        Stage("broken", "broken_stage", "run_broken", deps=["down"], outputs=lambda cfg: [str(out / "never.csv")]),
+    ]
+
+def _config(tmp_path, **params):
+    return OmegaConf.create({"run_params": {"run_up": True, "run_down": True, "run_broken": True},
+                             "pipeline": {"state_file": str(tmp_path / "state.json"), "force": False},
+                             "params": {"alpha": 1, **params}})
+
+def test_skips_up_to_date_stages(tmp_path, monkeypatch):
+    stages = _stages(tmp_path, monkeypatch)
+    up, down = importlib.import_module("up_stage"), importlib.import_module("down_stage")
+
+    artifacts = run_pipeline(_config(tmp_path), stages)
+    assert artifacts == {"table": 1, "report": 1}
+    assert down.CALLS == [["table"]]  # handed over in memory
+
+    # The always-run upstream stage rewrites its output, so "down" reruns
+    run_pipeline(_config(tmp_path), stages)
+    assert len(up.CALLS) == 2 and len(down.CALLS) == 2
+
+    # Without the upstream stage nothing "down" depends on changed: skipped
+    cfg = _config(tmp_path)
+    cfg.run_params.run_up = False
+    run_pipeline(cfg, stages)
+    assert len(down.CALLS) == 2
+    assert down.CALLS[-1] == ["table"]
+
+    # Its config section changed, or forced: rerun (reading from disk, no in-memory input)
+    cfg = _config(tmp_path, alpha=2)
+    cfg.run_params.run_up = False
+    run_pipeline(cfg, stages)
+    assert down.CALLS[-1] == []
+    cfg.pipeline.force = True
+    run_pipeline(cfg, stages)
+    assert len(down.CALLS) == 4
+
+def test_failed_stage_is_not_recorded(tmp_path, monkeypatch):
+    stages = _stages(tmp_path, monkeypatch)
+    run_pipeline(_config(tmp_path), stages)
+    with open(tmp_path / "state.json", "r", encoding="utf-8") as f:
+        assert sorted(json.load(f)) == ["down", "up"]
+    assert not os.path.exists(tmp_path / "out" / "never.csv")
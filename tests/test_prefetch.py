@@ -0,0 +1,33 @@
+# test_prefetch.py
+"""Bounded background prefetch: order, failed loads, memory bound and early exit."""
+from prefetch import prefetched
+import threading
+import time
+
+ITEMS = [(i,) for i in range(10)]
+
+def test_items_come_in_order_with_failed_loads_as_errors():
+    def load(i):
+        if i == 4:
+            raise OSError("unreadable")
+        return i * i
+
+    entries = list(prefetched(load, ITEMS, depth=3))
+    assert [item for item, _, _ in entries] == ITEMS
+    assert [loaded for _, loaded, _ in entries] == [i * i if i != 4 else None for i in range(10)]
+    assert [type(error) for _, _, error in entries] == [type(None)] * 4 + [OSError] + [type(None)] * 5
+
+def test_loader_stays_at_most_depth_ahead():
+    loaded = []
+    stream = prefetched(lambda i: loaded.append(i) or i, ITEMS, depth=2)
+    next(stream)
+    time.sleep(0.3)
+    # The item being analyzed, `depth` waiting in the queue and one loaded but blocked on the queue
+    assert loaded == [0, 1, 2, 3]
+    stream.close()
+
+def test_closing_the_stream_stops_the_loader():
+    stream = prefetched(lambda i: i, ITEMS, depth=1)
+    next(stream)
+    stream.close()
+    assert not any(t.name == "prefetch" and t.is_alive() for t in threading.enumerate())
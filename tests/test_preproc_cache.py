@@ -0,0 +1,52 @@
+# test_preproc_cache.py
+"""Persistent preprocessed-signal cache: hits, keys and LRU eviction."""
+from conftest import EEG_CHANNELS, EOG_CHANNELS, make_config
+from preproc_cache import cache_key, load_preprocessed
+import numpy as np
+import time
+import os
+
+def _config(cache_dir, max_gb=20, **overrides):
+    return make_config(**{"cache.enabled": True, "cache.dir": str(cache_dir), "cache.max_gb": max_gb,
+                          "memory.signal_dtype": "float64", **overrides})
+
+def _entries(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if ".tmp-" not in name)
+
+def test_cache_hit_matches_uncached(recording, tmp_path):
+    cfg = _config(tmp_path)
+    direct = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, _config(tmp_path, **{"cache.enabled": False}))
+    stored = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)
+    hit = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)
+    assert _entries(tmp_path) == [cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)]
+    assert hit.ch_names == direct.ch_names and hit.info == direct.info
+    # Entries are stored in the signal dtype: a hit gives exactly the signals of a miss
+    assert hit.get_data().dtype == np.float64
+    np.testing.assert_array_equal(hit.get_data(), direct.get_data())
+    np.testing.assert_array_equal(hit.get_data(["ROC"], 10, 20), stored.get_data(["ROC"], 10, 20))
+
+def test_entries_are_kept_per_signal_dtype(recording, tmp_path):
+    cfg64, cfg32 = _config(tmp_path), _config(tmp_path, **{"memory.signal_dtype": "float32"})
+    assert cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg64) != cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg32)
+    for cfg in (cfg64, cfg32):
+        miss = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)
+        hit = load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)
+        np.testing.assert_array_equal(hit.get_data(), miss.get_data())
+    assert len(_entries(tmp_path)) == 2
+
+def test_key_follows_preprocess_config_only(recording, tmp_path):
+    cfg = _config(tmp_path)
+    key = cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)
+    assert key == cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, _config(tmp_path, **{"preprocess.output_dir": "x"}))
+    assert key != cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, _config(tmp_path, **{"preprocess.eeg.hp": 0.5}))
+    assert key != cache_key(recording[0], EEG_CHANNELS[:2], EOG_CHANNELS, cfg)
+
+def test_least_recently_used_entry_is_evicted(recording, tmp_path):
+    # One entry is 6 channels x 76800 float64 samples (3.7 MB); room for two
+    max_gb = 8e6 / (1 << 30)
+    configs = [_config(tmp_path, max_gb, **{"preprocess.eeg.hp": hp}) for hp in (0.3, 0.4, 0.5)]
+    keys = [cache_key(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg) for cfg in configs]
+    for cfg in (configs[0], configs[1], configs[0], configs[2]):  # the second load of 0 is a hit
+        load_preprocessed(recording[0], EEG_CHANNELS, EOG_CHANNELS, cfg)
+        time.sleep(0.05)  # distinct access times
+    assert _entries(tmp_path) == sorted([keys[0], keys[2]])
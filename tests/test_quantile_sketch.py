@@ -0,0 +1,35 @@
+# test_quantile_sketch.py
+"""Mergeable histogram quantile sketch against np.percentile."""
+from quantile_sketch import QuantileSketch
+import numpy as np
+import pytest
+
+Q = [0.0, 0.01, 0.25, 0.5, 0.75, 0.99, 1.0]
+
+def test_quantiles_within_a_bin_of_np_percentile():
+    rng = np.random.default_rng(0)
+    values = np.column_stack([rng.standard_normal(50_000), rng.exponential(2.0, 50_000)])
+    sketch = QuantileSketch([-8.0, 0.0], [8.0, 16.0], n_bins=4096).update(values)
+    want = np.percentile(values, 100 * np.array(Q), axis=0)
+    assert np.all(np.abs(sketch.quantiles(Q) - want) <= sketch.width)
+    np.testing.assert_array_equal(sketch.count, [50_000, 50_000])
+
+def test_merge_equals_one_sketch_over_all_values():
+    rng = np.random.default_rng(1)
+    parts = [rng.normal(k, 1.0, (1000 * (k + 1), 2)) for k in range(3)]
+    merged = QuantileSketch([-4.0, -4.0], [4.0, 4.0], n_bins=512)
+    for part in parts:
+        merged.merge(QuantileSketch([-4.0, -4.0], [4.0, 4.0], n_bins=512).update(part))
+    whole = QuantileSketch([-4.0, -4.0], [4.0, 4.0], n_bins=512).update(np.vstack(parts))
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    np.testing.assert_array_equal(merged.quantiles(Q), whole.quantiles(Q))
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch([-4.0, -4.0], [5.0, 4.0], n_bins=512))
+
+def test_out_of_range_nan_and_empty_columns():
+    sketch = QuantileSketch([0.0, 0.0], [1.0, 1.0], n_bins=100)
+    sketch.update(np.array([[-5.0, np.nan], [0.5, np.nan], [9.0, np.nan]]))
+    np.testing.assert_array_equal(sketch.count, [3, 0])
+    result = sketch.quantiles([0.0, 0.5, 1.0])
+    np.testing.assert_allclose(result[:, 0], [-5.0, 0.5, 9.0], atol=0.01)  # tails bounded by min/max
+    assert np.isnan(result[:, 1]).all()
@@ -0,0 +1,42 @@
+# test_result_store.py
+"""Partitioned Parquet result store: round trip, filters and subject rewrites."""
+from result_store import SubjectWriter, list_partitions, partition_file, read_partition, read_results
+import numpy as np
+import os
+
+def _write(root, subject, stages, n=5, offset=0.0):
+    writer = SubjectWriter(root, "timeseries", subject)
+    for k, stage in enumerate(stages):
+        writer.add(stage, {"time_sec": np.arange(n) * 15.0 + 1e6, "cca_corr1": np.full(n, offset + k)},
+                   dtypes={"time_sec": np.float64})
+    return writer.flush()
+
+def test_round_trip_and_filters(tmp_path):
+    root = str(tmp_path)
+    assert _write(root, "s1", ["N2", "W"]) == [partition_file("timeseries", "s1", "N2"),
+                                               partition_file("timeseries", "s1", "W")]
+    _write(root, "s2", ["N2"], offset=10.0)
+
+    df = read_results(root, "timeseries")
+    assert len(df) == 15 and df["cca_corr1"].dtype == np.float32 and df["time_sec"].dtype == np.float64
+    assert df["time_sec"].iloc[1] == 1e6 + 15.0  # float64 time axis kept exactly
+
+    df = read_results(root, "timeseries", columns=["cca_corr1"], subjects=["s2"], stages=["N2"])
+    assert list(df.columns) == ["cca_corr1", "subject", "stage"]
+    assert df["cca_corr1"].tolist() == [10.0] * 5 and set(df["subject"]) == {"s2"}
+
+    assert [p[:2] for p in list_partitions(root, "timeseries")] == [("s1", "N2"), ("s1", "W"), ("s2", "N2")]
+    path = list_partitions(root, "timeseries")[1][2]
+    assert read_partition(root, path, columns=["cca_corr1"])["cca_corr1"].tolist() == [1.0] * 5
+
+def test_rewrite_replaces_every_stage_of_the_subject(tmp_path):
+    root = str(tmp_path)
+    _write(root, "s1", ["N2", "W", "R"])
+    _write(root, "s1", ["N3"], offset=5.0)
+    assert [p[:2] for p in list_partitions(root, "timeseries")] == [("s1", "N3")]
+    assert read_results(root, "timeseries")["cca_corr1"].tolist() == [5.0] * 5
+    assert not [d for d in os.listdir(os.path.join(root, "timeseries")) if d.startswith("_tmp")]
+
+def test_empty_store(tmp_path):
+    assert read_results(str(tmp_path), "missing", columns=["x"]).empty
+    assert list_partitions(str(tmp_path), "missing") == []
@@ -0,0 +1,110 @@
+# test_static_cca.py
+"""Static CCA per subject: decimated projections per contiguous run of a stage, ledger entries of complete subjects only."""
+from conftest import make_config
+from annotations import parse_hypnogram
+from ledger import pending_subjects
+from result_store import SubjectWriter, read_results
+from synthetic_psg import START
+from omegaconf import OmegaConf
+import numpy as np
+import importlib
+import sys
+import os
+import pytest
+
+def _import_static_cca(recording, tmp_path, monkeypatch, **overrides):
+    """The static_cca module, imported with its outputs under tmp_path and the recording's folder as data."""
+    cfg = make_config(**{"data.data_dir": os.path.dirname(recording[0]), "data.hypnogram_cache": False,
+                         "cache.enabled": False, "ledger.enabled": False,
+                         "static_cca_params.output_dir": str(tmp_path / "static_cca"), **overrides})
+    config_path = str(tmp_path / "config.yaml")
+    OmegaConf.save(cfg, config_path)
+    monkeypatch.setenv("BESPACE_CONFIG", config_path)
+    sys.modules.pop("static_cca", None)  # module-level config of this test
+    return importlib.import_module("static_cca")
+
+@pytest.fixture
+def static_cca(recording, tmp_path, monkeypatch):
+    yield _import_static_cca(recording, tmp_path, monkeypatch)
+    sys.modules.pop("static_cca", None)
+
+def _runs(starts, stops):
+    # Lengths of the runs of back-to-back epochs
+    lengths = []
+    for i, (start, stop) in enumerate(zip(starts, stops)):
+        if i and start == stops[i - 1]:
+            lengths[-1] += stop - start
+        else:
+            lengths.append(stop - start)
+    return lengths
+
+def test_decimation_restarts_at_gaps_between_epochs(static_cca):
+    # Identity weights: the projections are the signals; a level step at the join of two epochs
+    cca = {"x_weights": np.eye(2), "y_weights": np.eye(2)}
+    n, factor = 1000, 8
+    ones = np.ones((n, 2))
+    blocks = [(0, ones[:600], ones[:600]), (600, ones[600:], ones[600:]), (5000, -ones, -ones)]
+    _, _, proj = static_cca._project_stage(iter(blocks), cca, np.zeros(2), np.zeros(2), np.eye(2), np.eye(2),
+                                           2 * n, factor)
+    # Each run is decimated on its own, without its ends: no transient at the join or the edges
+    half = static_cca.StreamDecimator(factor).half
+    m = len(range(half, n - half, factor))
+    assert proj.shape == (2 * m, 4)
+    np.testing.assert_allclose(proj[:m], 1.0, atol=1e-12)
+    np.testing.assert_allclose(proj[m:], -1.0, atol=1e-12)
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_projections_have_one_decimated_series_per_run(static_cca, recording, monkeypatch, streaming):
+    monkeypatch.setattr(static_cca, "STREAMING", streaming)
+    monkeypatch.setattr(static_cca, "CHUNK_SECONDS", 7)  # blocks straddle epoch edges and joins
+    edf_file, annot_file = (os.path.basename(p) for p in recording)
+    rows, complete = static_cca.process_subject(edf_file, annot_file)
+    assert complete and {row["stage"] for row in rows} and all(np.isfinite(row["cca_corr1"]) for row in rows)
+
+    sfreq = 128
+    hyp = parse_hypnogram(recording[1], START, sfreq, static_cca.SLEEP_STAGES)
+    projections = read_results(static_cca.OUTPUT_FOLDER, static_cca.PROJECTIONS)
+    for row in rows:
+        code = static_cca.SLEEP_STAGES.index(row["stage"])
+        epochs = hyp[hyp["stage"] == code]
+        half = static_cca.StreamDecimator(sfreq).half
+        expected = sum(len(range(half, length - half, sfreq)) for length in _runs(epochs["start_sample"], epochs["stop_sample"]))
+        assert (projections["stage"] == row["stage"]).sum() == expected
+
+def _fail_stage(stage, fit_cca):
+    def fit(Cxx, Cyy, Cxy, **kwargs):
+        cca = fit_cca(Cxx, Cyy, Cxy, **kwargs)
+        if fit.calls == stage:
+            cca["correlations"] = cca["correlations"] * np.nan
+        fit.calls += 1
+        return cca
+    fit.calls = 0
+    return fit
+
+def _fail_flush(self):
+    raise OSError("disk full")
+
+@pytest.mark.parametrize("failure", ["stage", "flush"])
+def test_incomplete_subjects_are_not_recorded_in_the_ledger(recording, tmp_path, monkeypatch, failure):
+    module = _import_static_cca(recording, tmp_path, monkeypatch, **{"ledger.enabled": True})
+    file_pair = tuple(os.path.basename(p) for p in recording)
+    try:
+        rows, complete = module.process_subject(*file_pair)
+        assert complete
+        if failure == "stage":
+            monkeypatch.setattr(module, "fit_cca", _fail_stage(1, module.fit_cca))
+        else:
+            monkeypatch.setattr(SubjectWriter, "flush", _fail_flush)
+        partial_rows, complete = module.process_subject(*file_pair)
+        assert not complete
+        assert len(partial_rows) == (len(rows) - 1 if failure == "stage" else len(rows))
+
+        module._checkpoint(file_pair, (partial_rows, complete))
+        assert os.path.exists(module._summary_part_path(file_pair[0]))  # the rows are kept for the summary
+        assert pending_subjects(module.LEDGER, [file_pair], module.DATA_FOLDER)[0] == [file_pair]
+
+        monkeypatch.undo()
+        module._checkpoint(file_pair, module.process_subject(*file_pair))
+        assert pending_subjects(module.LEDGER, [file_pair], module.DATA_FOLDER)[0] == []
+    finally:
+        sys.modules.pop("static_cca", None)
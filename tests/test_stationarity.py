@@ -0,0 +1,56 @@
+# test_stationarity.py
+"""Batched ADF/KPSS against statsmodels."""
+from statsmodels.tsa.stattools import adfuller, kpss
+from statsmodels.tools.sm_exceptions import InterpolationWarning
+from stationarity import RESULT_COLUMNS, adf_batch, kpss_batch, stationarity_tests
+import numpy as np
+import warnings
+import pytest
+
+def _series(n_series, length, seed=0):
+    # Stationary AR(1) processes and random walks
+    rng = np.random.default_rng(seed)
+    e = rng.standard_normal((n_series, length))
+    S = np.empty_like(e)
+    S[:, 0] = e[:, 0]
+    phi = np.where(np.arange(n_series) % 2 == 0, 0.5, 1.0)
+    for t in range(1, length):
+        S[:, t] = phi * S[:, t - 1] + e[:, t]
+    return S
+
+def _statsmodels(x):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", InterpolationWarning)
+        warnings.simplefilter("ignore", FutureWarning)
+        adf = adfuller(x)
+        stat, pval, nlags, _ = kpss(x, regression="c")
+    return [adf[0], adf[1], adf[2], stat, pval, nlags]
+
+@pytest.mark.parametrize("length", [40, 120, 500])
+def test_batches_match_statsmodels(length):
+    S = _series(12, length, seed=length)
+    adf_stat, adf_pval, adf_lags = adf_batch(S)
+    kpss_stat, kpss_pval, kpss_lags = kpss_batch(S)
+    want = np.array([_statsmodels(x) for x in S])
+    np.testing.assert_array_equal(adf_lags, want[:, 2])
+    np.testing.assert_allclose(adf_stat, want[:, 0], rtol=1e-8)
+    np.testing.assert_allclose(adf_pval, want[:, 1], rtol=1e-6)
+    np.testing.assert_array_equal(kpss_lags, want[:, 5])
+    np.testing.assert_allclose(kpss_stat, want[:, 3], rtol=1e-8)
+    np.testing.assert_allclose(kpss_pval, want[:, 4], rtol=1e-8)
+
+def test_mixed_lengths_and_degenerate_series_keep_input_order():
+    S = _series(10, 200, seed=1)
+    series = list(S) + [np.ones(200), S[0, :60], np.array([1.0, np.nan, 2.0] * 30)]
+    results = stationarity_tests(series, min_batch=8)
+    assert list(results.columns) == RESULT_COLUMNS and len(results) == len(series)
+    want = np.array([_statsmodels(x) for x in S])
+    np.testing.assert_allclose(results.iloc[:10].to_numpy(dtype=np.float64), want, rtol=1e-6)
+    np.testing.assert_allclose(results.iloc[11].to_numpy(dtype=np.float64), _statsmodels(S[0, :60]), rtol=1e-8)
+    assert results.iloc[10].isna().any() and results.iloc[12].isna().any()  # reported as failed tests
+
+def test_ragged_series_in_a_process_pool():
+    series = [x[:100 + 7 * i] for i, x in enumerate(_series(6, 200, seed=2))]
+    serial = stationarity_tests(series, n_workers=1)
+    pooled = stationarity_tests(series, n_workers=2)
+    np.testing.assert_array_equal(serial.to_numpy(), pooled.to_numpy())
@@ -0,0 +1,77 @@
+# test_streaming_cca.py
+"""Streaming CCA against the batch windowed CCA and explicitly weighted covariances."""
+from conftest import make_config
+from cca_engine import canonical_correlations
+from filtering import design_filter
+from streaming_cca import CausalFilter, StreamingCCA, array_chunks, stream_cca
+from windowed_cca import windowed_cca
+from scipy import signal
+import numpy as np
+
+SFREQ = 64.0
+
+def _signals(n=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    latent = rng.standard_normal((n, 1))
+    X = rng.standard_normal((n, 4)) + latent @ rng.standard_normal((1, 4)) + 20.0
+    Y = rng.standard_normal((n, 2)) + latent @ rng.standard_normal((1, 2))
+    return X, Y
+
+def _feed(engine, X, Y, sizes):
+    # Chunks of irregular size, so blocks and windows straddle chunk edges
+    results, pos, k = [], 0, 0
+    while pos < len(X):
+        n = sizes[k % len(sizes)]
+        results += engine.update(X[pos:pos + n], Y[pos:pos + n])
+        pos, k = pos + n, k + 1
+    return results
+
+def test_windows_match_batch_windowed_cca():
+    X, Y = _signals()
+    engine = StreamingCCA(4, 2, SFREQ, window_sec=6.0, step_sec=2.5)
+    results = _feed(engine, X, Y, [1, 37, 200, 64, 5])
+
+    window, step = 384, 160
+    starts = np.arange(0, len(X) - window + 1, step)
+    assert len(results) == len(starts)
+    np.testing.assert_allclose([r["time_sec"] for r in results], starts / SFREQ)
+    rho = windowed_cca(X, Y, starts, starts + window)
+    np.testing.assert_allclose([[r["cca_corr1"], r["cca_corr2"]] for r in results], rho, atol=1e-10)
+
+def test_forgetting_matches_weighted_covariance():
+    X, Y = _signals()
+    halflife_sec = 10.0
+    engine = StreamingCCA(4, 2, SFREQ, window_sec=6.0, step_sec=2.5, halflife_sec=halflife_sec)
+    results = _feed(engine, X, Y, [333])
+
+    block = engine.block
+    decay = 0.5 ** (block / (halflife_sec * SFREQ))
+    for r in results[::5]:
+        n = int(round(r["time_sec"] * SFREQ)) + 384  # samples seen when the step was emitted
+        Z = np.hstack([X[:n], Y[:n]])
+        weights = decay ** (n // block - 1 - np.arange(n) // block)  # every sample of a block shares its age
+        C = np.cov(Z, rowvar=False, aweights=weights)
+        ref = canonical_correlations(C[None, :4, :4], C[None, 4:, 4:], C[None, :4, 4:], n_components=2)[0]
+        np.testing.assert_allclose([r["ewm_corr1"], r["ewm_corr2"]], ref, atol=1e-9)
+
+def test_causal_filter_chunks_match_one_pass():
+    x = np.random.default_rng(1).standard_normal((3, 2000)) + 5.0
+    chunked = CausalFilter(SFREQ, 0.3, 20.0, 0)
+    out = np.hstack([chunked(x[:, a:a + 123]) for a in range(0, 2000, 123)])
+
+    sos = design_filter(SFREQ, 0.3, 20.0, 0.0, "iir")
+    ref, _ = signal.sosfilt(sos, x, axis=-1, zi=signal.sosfilt_zi(sos)[:, None, :] * x[None, :, :1])
+    np.testing.assert_allclose(out, ref, atol=1e-10)
+
+def test_stream_cca_is_causal_filter_then_windowed_cca():
+    X, Y = _signals()
+    config = make_config(**{"time_cca_params.window_length": 6, "time_cca_params.step_length": 3,
+                            "preprocess.line_hz": 0, "preprocess.eeg.lp": 20.0})
+    results = list(stream_cca(array_chunks(X.T, Y.T, 100), SFREQ, config, halflife_sec=None))
+
+    eeg = CausalFilter(SFREQ, 0.3, 20.0, 0)(X.T).T
+    eog = CausalFilter(SFREQ, 0.1, 10.0, 0)(Y.T).T
+    starts = np.arange(0, len(X) - 384 + 1, 192)
+    rho = windowed_cca(eeg, eog, starts, starts + 384)
+    np.testing.assert_allclose([[r["cca_corr1"], r["cca_corr2"]] for r in results], rho, atol=1e-9)
+    assert all(r["latency_sec"] >= 0 for r in results)
@@ -0,0 +1,66 @@
+# test_surrogates.py
+"""Spectral surrogate nulls against explicitly generated surrogate EOG signals."""
+from cca_engine import canonical_correlations, covariance_blocks
+from surrogates import surrogate_null
+from windowed_cca import windowed_cca
+import numpy as np
+import pytest
+
+N_SURROGATES = 30
+
+def _signals(n=2000, seed=0, gain=1.0):
+    rng = np.random.default_rng(seed)
+    latent = np.convolve(rng.standard_normal(n), np.ones(5) / 5, mode="same")[:, None] * gain
+    X = rng.standard_normal((n, 4)) + latent @ rng.standard_normal((1, 4)) + 3.0
+    Y = rng.standard_normal((n, 2)) + latent @ rng.standard_normal((1, 2))
+    return X, Y
+
+def _explicit_null(X, Y, starts, stops, method, seed, min_shift):
+    # Draw exactly what surrogate_null draws (windows of equal length share them), then build the signals
+    rng = np.random.default_rng(seed)
+    n = int(stops[0] - starts[0])
+    F = n // 2 + 1
+    if method == "phase":
+        phases = np.exp(1j * rng.uniform(0.0, 2.0 * np.pi, size=(N_SURROGATES, F)))
+        phases[:, 0] = 1.0
+        if n % 2 == 0:
+            phases[:, -1] = 1.0
+    else:
+        lo = min(min_shift, n // 2)
+        shifts = rng.integers(lo, n - lo + 1, size=N_SURROGATES) % n
+
+    null = np.empty((len(starts), N_SURROGATES, 2))
+    for w, (a, b) in enumerate(zip(starts, stops)):
+        x, y = X[a:b], Y[a:b] - Y[a:b].mean(axis=0)
+        for s in range(N_SURROGATES):
+            if method == "phase":
+                y_s = np.fft.irfft(np.fft.rfft(y, axis=0) * phases[s][:, None], n=n, axis=0)
+            else:
+                y_s = np.roll(y, -shifts[s], axis=0)
+            null[w, s] = canonical_correlations(*covariance_blocks(x, y_s)[2:], n_components=2)
+    return null
+
+@pytest.mark.parametrize("method, n", [("phase", 256), ("phase", 255), ("shift", 256)])
+def test_null_matches_explicit_surrogates(method, n):
+    X, Y = _signals()
+    starts = np.arange(0, 1500, 300)
+    stops = starts + n
+    rho = windowed_cca(X, Y, starts, stops)
+    pvals, null_mean = surrogate_null(X, Y, starts, stops, rho, method=method, n_surrogates=N_SURROGATES,
+                                      min_shift=20, rng=np.random.default_rng(5), block=2)
+    null = _explicit_null(X, Y, starts, stops, method, seed=5, min_shift=20)
+    np.testing.assert_allclose(null_mean, null.mean(axis=1), atol=1e-10)
+    np.testing.assert_array_equal(pvals, (1.0 + (null >= rho[:, None, :] - 1e-12).sum(axis=1)) / (N_SURROGATES + 1.0))
+
+def test_coupled_windows_are_significant_and_nan_windows_stay_nan():
+    X, Y = _signals(seed=1, gain=5.0)
+    starts = np.array([0, 500, 1000])
+    stops = starts + 500
+    rho = windowed_cca(X, Y, starts, stops)
+    rho[2] = np.nan
+    pvals, null_mean = surrogate_null(X, Y, starts, stops, rho, method="shift", n_surrogates=99, min_shift=50,
+                                      rng=np.random.default_rng(0))
+    assert (pvals[:2, 0] == 0.01).all() and (null_mean[:2, 0] < rho[:2, 0]).all()
+    assert np.isnan(pvals[2]).all() and np.isnan(null_mean[2]).all()
+    with pytest.raises(ValueError):
+        surrogate_null(X, Y, starts, stops, rho, method="bootstrap")
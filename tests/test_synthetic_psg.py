@@ -0,0 +1,65 @@
+# test_synthetic_psg.py
+"""Synthetic recordings: readable EDF, matching hypnogram, recovered coupling; benchmark comparison."""
+from conftest import EEG_CHANNELS, EOG_CHANNELS
+from annotations import parse_hypnogram
+from benchmark import compare
+from cca_engine import canonical_correlations, covariance_blocks
+from synthetic_psg import EPOCH_SEC, NOISE_UV, random_hypnogram, write_cohort, write_recording
+import numpy as np
+import mne
+import os
+import pytest
+
+def test_random_hypnogram_runs():
+    codes = random_hypnogram(2000, ["W", "N1", "N2"], np.random.default_rng(0), mean_run=10)
+    changes = np.flatnonzero(np.diff(codes)) + 1
+    assert set(codes) == {0, 1, 2}
+    assert 5 < np.diff(np.r_[0, changes, len(codes)]).mean() < 20
+
+def test_recording_is_readable_and_recovers_its_coupling(tmp_path):
+    coupling = {"N2": (0.7, 0.3), "N3": (0.85, 0.4)}
+    edf_path, annot_path = str(tmp_path / "rec.edf"), str(tmp_path / "rec.annot")
+    codes = write_recording(edf_path, annot_path, 3600 + 10, 64, EEG_CHANNELS, EOG_CHANNELS, ["ECG"],
+                            coupling=coupling, rng=np.random.default_rng(3), chunk_sec=700)
+    assert len(codes) == 120  # whole epochs only
+
+    raw = mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
+    assert raw.ch_names == EEG_CHANNELS + EOG_CHANNELS + ["ECG"] and raw.info["sfreq"] == 64
+    assert raw.n_times == 3600 * 64
+    data = raw.get_data(picks=EEG_CHANNELS + EOG_CHANNELS) * 1e6  # uV
+    assert 0.8 * NOISE_UV < data.std() < 2.0 * NOISE_UV
+
+    # The .annot stage of every epoch is the generated one
+    hyp = parse_hypnogram(annot_path, raw.info["meas_date"], 64, list(coupling))
+    stage_of_sample = np.full(raw.n_times, -1)
+    for stage, start, stop in hyp:
+        stage_of_sample[start:stop] = stage
+    np.testing.assert_array_equal(stage_of_sample, np.repeat(codes, EPOCH_SEC * 64))
+
+    # Population canonical correlations per stage (skipping the gain transition at every epoch edge)
+    settled = (np.arange(raw.n_times) % (EPOCH_SEC * 64)) >= 64
+    for k, (stage, rho) in enumerate(coupling.items()):
+        sel = (stage_of_sample == k) & settled
+        blocks = covariance_blocks(data[:4, sel].T, data[4:, sel].T)[2:]
+        np.testing.assert_allclose(canonical_correlations(*(b[None] for b in blocks))[0], rho, atol=0.05)
+
+def test_cohorts_share_pooled_recordings(tmp_path):
+    pool = str(tmp_path / "pool")
+    small = write_cohort(str(tmp_path / "n1"), 1, 60, 32, EEG_CHANNELS[:2], EOG_CHANNELS, seed=1, pool_dir=pool)
+    large = write_cohort(str(tmp_path / "n2"), 2, 60, 32, EEG_CHANNELS[:2], EOG_CHANNELS, seed=1, pool_dir=pool)
+    assert large[:1] == small and sorted(os.listdir(pool)) == sorted(n + e for n in ("synthetic-0000", "synthetic-0001")
+                                                                        for e in (".edf", ".annot"))
+    with open(tmp_path / "n1" / small[0], "rb") as a, open(tmp_path / "n2" / large[0], "rb") as b:
+        assert a.read() == b.read()
+    with pytest.raises(ValueError):
+        write_recording(str(tmp_path / "x.edf"), str(tmp_path / "x.annot"), 60, 10, EEG_CHANNELS, EOG_CHANNELS)
+
+def test_compare_flags_regressions_against_the_baseline():
+    baseline = {"results": [{"cohort_size": 1, "stage": "read", "seconds": 2.0, "peak_rss_mb": 100.0},
+                            {"cohort_size": 1, "stage": "static_cca", "seconds": 4.0, "peak_rss_mb": 100.0}]}
+    results = [{"cohort_size": 1, "stage": "read", "seconds": 2.2, "peak_rss_mb": 90.0},
+               {"cohort_size": 1, "stage": "static_cca", "seconds": 4.0, "peak_rss_mb": 150.0},
+               {"cohort_size": 4, "stage": "read", "seconds": 9.0, "peak_rss_mb": 100.0}]
+    rows = compare(results, baseline, tolerance=0.25)
+    assert [(r["stage"], r["regression"]) for r in rows] == [("read", False), ("static_cca", True)]
+    assert rows[0]["seconds_ratio"] == pytest.approx(1.1) and rows[1]["peak_rss_mb_ratio"] == pytest.approx(1.5)
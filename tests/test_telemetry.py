@@ -0,0 +1,61 @@
+# test_telemetry.py
+"""JSONL telemetry records and their per-metric summary."""
+import telemetry
+import json
+import os
+import pytest
+
+@pytest.fixture
+def metrics_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "metrics.jsonl")
+    monkeypatch.setattr(telemetry, "METRICS_FILE", path)
+    return path
+
+def _records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_nothing_is_written_without_a_metrics_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "METRICS_FILE", None)
+    with telemetry.timer("t", items=5):
+        pass
+    telemetry.count("c")
+    telemetry.memory_snapshot("m")
+    assert os.listdir(tmp_path) == []
+
+def test_timer_count_and_memory_records(metrics_file):
+    with telemetry.timer("windows", items=100, subject="s1") as record:
+        record["items"] = 200  # known only inside the block
+    with pytest.raises(RuntimeError):
+        with telemetry.timer("windows", subject="s2"):
+            raise RuntimeError
+    telemetry.count("cache_hit", subject="s1")
+    telemetry.memory_snapshot("after", stage="N2")
+
+    timer, failed, counter, memory = _records(metrics_file)
+    assert {timer["kind"], counter["kind"], memory["kind"]} == {"timer", "counter", "memory"}
+    assert timer["metric"] == "windows" and timer["subject"] == "s1" and timer["ok"] and timer["items"] == 200
+    assert timer["items_per_sec"] == pytest.approx(200 / timer["seconds"])
+    assert not failed["ok"] and "items" not in failed
+    assert counter["value"] == 1 and counter["pid"] == os.getpid()
+    assert memory["stage"] == "N2" and (memory["peak_rss_mb"] is None or memory["peak_rss_mb"] > 0)
+
+def test_summarize_aggregates_timers(metrics_file):
+    for metric, seconds, items in [("a", 1.0, 10), ("a", 3.0, 30), ("b", 0.5, None)]:
+        fields = {"seconds": seconds, "ok": True}
+        if items is not None:
+            fields["items"] = items
+        telemetry.emit("timer", metric, **fields)
+    telemetry.count("ignored")
+
+    summary = telemetry.summarize(metrics_file)
+    assert list(summary.index) == ["a", "b"]  # by total time
+    assert summary.loc["a", "count"] == 2 and summary.loc["a", "total_sec"] == 4.0 and summary.loc["a", "max_sec"] == 3.0
+    assert summary.loc["a", "items_per_sec"] == 10.0
+    assert summary.loc["b", "mean_sec"] == 0.5 and summary["items_per_sec"].isna()["b"]
+
+def test_profiled_writes_a_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "PROFILE_DIR", str(tmp_path / "prof"))
+    with telemetry.profiled("stage"):
+        sum(range(1000))
+    assert os.listdir(tmp_path / "prof") == [f"stage-{os.getpid()}.prof"]
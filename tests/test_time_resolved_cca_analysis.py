@@ -0,0 +1,36 @@
+# test_time_resolved_cca_analysis.py
+"""Time-resolved CCA summaries against the original pandas groupby outputs."""
+from conftest import make_config
+from omegaconf import OmegaConf
+import time_resolved_cca_analysis
+import pandas as pd
+import numpy as np
+import os
+
+def _timeseries(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for subject in ["s1", "s2", "s3"]:
+        for stage, start, stop in [("W", 0, 1800), ("N2", 1800, 4200), ("R", 6600, 7200), ("N2", 7200, 9000)]:
+            t = np.arange(start, stop, 15.0)
+            rows.append(pd.DataFrame({"subject": subject, "stage": stage, "time_sec": t,
+                                      "cca_corr1": rng.uniform(0, 1, len(t)), "cca_corr2": rng.uniform(0, 1, len(t))}))
+    return pd.concat(rows, ignore_index=True)
+
+def test_trajectory_has_every_stage_and_bin_like_the_categorical_groupby(tmp_path, monkeypatch):
+    cfg = make_config(**{"time_cca_params.results_dir": str(tmp_path), "time_cca_params.trajectory_bins": 600})
+    OmegaConf.save(cfg, str(tmp_path / "config.yaml"))
+    monkeypatch.setenv("BESPACE_CONFIG", str(tmp_path / "config.yaml"))
+    timeseries = _timeseries()
+    time_resolved_cca_analysis.main(timeseries=timeseries)
+
+    # The original script: pd.cut bins, grouped with the empty (stage, bin) pairs kept
+    df = timeseries.copy()
+    df["time_bin"] = pd.cut(df["time_sec"], bins=np.arange(0, df["time_sec"].max() + 600, 600))
+    want = df.groupby(["stage", "time_bin"], observed=False)[["cca_corr1", "cca_corr2"]].mean().reset_index()
+    want.to_csv(tmp_path / "want.csv", index=False)
+
+    got = pd.read_csv(os.path.join(tmp_path, "mean_cca_trajectory_by_stage.csv"))
+    want = pd.read_csv(tmp_path / "want.csv")
+    assert len(got) == 3 * 15 and got["cca_corr1"].isna().any()  # R and W only cover a few of the bins
+    pd.testing.assert_frame_equal(got, want, rtol=1e-12)
@@ -0,0 +1,81 @@
+# test_windowed_cca.py
+"""Prefix-sum window covariances, batched windowed CCA and the window/step sweep against per-window fits."""
+from sklearn.cross_decomposition import CCA
+from windowed_cca import window_bounds, window_covariances, windowed_cca, windowed_cca_sweep
+import numpy as np
+
+def _signals(n=3000, p=4, q=2, seed=0):
+    rng = np.random.default_rng(seed)
+    latent = rng.standard_normal((n, 1))
+    X = rng.standard_normal((n, p)) + latent @ rng.standard_normal((1, p)) + 50.0  # large offset
+    Y = rng.standard_normal((n, q)) + latent @ rng.standard_normal((1, q))
+    return X, Y
+
+def _reference_bounds(epochs, sfreq, n_times, window_length, step_length):
+    # The original per-window loop of time_resolved_cca.py
+    out = []
+    for stage, start, stop in epochs:
+        t = start
+        while t + window_length <= stop:
+            s0, s1 = round(t * sfreq), round((t + window_length) * sfreq)
+            if s0 >= 0 and s1 <= n_times:
+                out.append((stage, t, s0, s1))
+            t += step_length
+    return out
+
+def test_window_covariances_match_np_cov():
+    X, Y = _signals()
+    starts = np.array([0, 100, 1000, 2500, 7])
+    stops = np.array([300, 2900, 1200, 3000, 8 + 64])
+    # A small chunk puts window boundaries on both sides of chunk edges
+    Cxx, Cyy, Cxy = window_covariances(X, Y, starts, stops, chunk=64)
+    for i, (a, b) in enumerate(zip(starts, stops)):
+        C = np.cov(np.hstack([X[a:b], Y[a:b]]), rowvar=False)
+        np.testing.assert_allclose(Cxx[i], C[:4, :4], atol=1e-9)
+        np.testing.assert_allclose(Cyy[i], C[4:, 4:], atol=1e-9)
+        np.testing.assert_allclose(Cxy[i], C[:4, 4:], atol=1e-9)
+
+def test_window_covariances_float32_input():
+    X, Y = _signals()
+    starts, stops = np.array([0, 1500]), np.array([1500, 3000])
+    ref = window_covariances(X, Y, starts, stops)
+    got = window_covariances(X.astype(np.float32), Y.astype(np.float32), starts, stops)
+    for r, g in zip(ref, got):
+        np.testing.assert_allclose(g, r, rtol=1e-4, atol=1e-5)
+
+def test_window_bounds_match_original_loop():
+    epochs = [("W", 0.0, 90.0), ("N2", 90.0, 100.0), ("R", 100.0, 187.5), ("N3", 180.0, 400.0)]
+    stages, times, starts, stops = window_bounds(epochs, 128.0, 300 * 128, 30.0, 7.5)
+    ref = _reference_bounds(epochs, 128.0, 300 * 128, 30.0, 7.5)
+    assert stages == [r[0] for r in ref]
+    np.testing.assert_allclose(times, [r[1] for r in ref])
+    np.testing.assert_array_equal(starts, [r[2] for r in ref])
+    np.testing.assert_array_equal(stops, [r[3] for r in ref])
+
+def test_windowed_cca_matches_sklearn_per_window():
+    X, Y = _signals()
+    starts = np.arange(0, 2400, 600)
+    stops = starts + 600
+    rho = windowed_cca(X, Y, starts, stops, n_components=2, chunk=256)
+    for i, (a, b) in enumerate(zip(starts, stops)):
+        x_c, y_c = CCA(n_components=2, max_iter=5000, tol=1e-12).fit_transform(X[a:b], Y[a:b])
+        ref = [abs(np.corrcoef(x_c[:, k], y_c[:, k])[0, 1]) for k in range(2)]
+        np.testing.assert_allclose(rho[i], ref, atol=1e-6)
+
+def test_sweep_matches_each_combination_separately():
+    X, Y = _signals()
+    epochs = [("W", 0.0, 10.0), ("N2", 10.0, 20.0), ("R", 20.0, 23.4)]
+    sfreq, window_lengths, step_lengths = 128.0, [2.0, 5.0], [1.0, 2.5]
+    stages, times, windows, steps, rho = windowed_cca_sweep(X, Y, epochs, sfreq, len(X), window_lengths, step_lengths)
+
+    row = 0
+    for window_length in window_lengths:
+        for step_length in step_lengths:
+            s, t, a, b = window_bounds(epochs, sfreq, len(X), window_length, step_length)
+            n = len(t)
+            assert stages[row:row + n] == s
+            np.testing.assert_array_equal(times[row:row + n], t)
+            assert (windows[row:row + n] == window_length).all() and (steps[row:row + n] == step_length).all()
+            np.testing.assert_allclose(rho[row:row + n], windowed_cca(X, Y, a, b), atol=1e-10)
+            row += n
+    assert row == len(rho)